@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the module discovery of pubq with a pkgutil based walk.
+
+Usage:
+
+    python benchmarks/discovery.py [--depth N] [--width N] [--modules N]
+                                   [--runs N]
+
+A tree of packages is created in a temporary directory: each package
+has `width` sub-packages down to `depth` levels and `modules` modules.
+The pkgutil walk imports every package to find its sub-packages, so its
+runs start with the packages of the tree removed from sys.modules.
+"""
+import argparse
+import importlib
+import os
+import pkgutil
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+here = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(here, os.pardir))
+
+from pubqlib.logic.module import PubModule  # noqa: E402
+
+TOP_NAME = 'pubq_discovery_bench'
+
+
+def create_tree(path, depth, width, modules):
+    """ Creates a package with sub-packages; returns the number of files. """
+    os.makedirs(path)
+    with open(os.path.join(path, '__init__.py'), 'w') as fout:
+        fout.write('VALUE = 1\n')
+    count = 1
+    for index in range(modules):
+        with open(os.path.join(path, 'm%d.py' % index), 'w') as fout:
+            fout.write('def f():\n    return %d\n' % index)
+        count = count + 1
+    if depth > 0:
+        for index in range(width):
+            count = count + create_tree(
+                os.path.join(path, 'p%d' % index), depth - 1, width, modules)
+    return count
+
+
+def pkgutil_walk(path):
+    """ Lists the modules of a package the way pubq used to. """
+    result = []
+    for _, name, is_pkg in pkgutil.walk_packages(
+            path=[path], prefix=TOP_NAME + '.', onerror=lambda x: None):
+        result.append(name)
+    return result
+
+
+def pubq_walk(path):
+    """ Lists the modules of a package with pubq. """
+    module = PubModule(TOP_NAME, path)
+    module.collect_py_files()
+    return module.files
+
+
+def forget_tree():
+    """ Removes the imported packages of the tree. """
+    for name in list(sys.modules):
+        if name == TOP_NAME or name.startswith(TOP_NAME + '.'):
+            del sys.modules[name]
+    importlib.invalidate_caches()
+
+
+def measure(func, path, runs):
+    """ Calls a function a number of times and returns the durations. """
+    result = []
+    for _ in range(runs):
+        forget_tree()
+        start = time.perf_counter()
+        found = func(path)
+        result.append((time.perf_counter() - start) * 1000.0)
+    return result, len(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--width", type=int, default=4)
+    parser.add_argument("--modules", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    base_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(base_dir, TOP_NAME)
+        count = create_tree(path, args.depth, args.width, args.modules)
+        sys.path.insert(0, base_dir)
+        print("%d files in the tree" % count)
+        for label, func in (('pkgutil', pkgutil_walk), ('pubq', pubq_walk)):
+            durations, found = measure(func, path, args.runs)
+            print("%-8s %6d found, median %8.1f ms, min %8.1f ms" % (
+                label, found, statistics.median(durations), min(durations)))
+    finally:
+        forget_tree()
+        shutil.rmtree(base_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how long it takes for the command line program to start.
+
+Usage:
+
+    python benchmarks/startup.py [--runs N] [--budget-ms MS] [command ...]
+
+The script exits with a non-zero code if the median of the runs exceeds
+the budget, so it can be used to gate a build.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+here = os.path.abspath(os.path.dirname(__file__))
+script = os.path.join(here, os.pardir, 'bin', 'pubq.py')
+
+
+def measure(command, runs):
+    """ Runs the program a number of times and returns the durations. """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.join(here, os.pardir), env.get('PYTHONPATH', '')])
+    result = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call(
+            [sys.executable, script, *command],
+            env=env, stdout=subprocess.DEVNULL)
+        result.append((time.perf_counter() - start) * 1000.0)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=60.0)
+    parser.add_argument("command", nargs='*', default=['version'])
+    args = parser.parse_args()
+
+    # The interpreter alone is the floor for any command.
+    baseline = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', 'pass'])
+        baseline.append((time.perf_counter() - start) * 1000.0)
+
+    durations = measure(args.command, args.runs)
+    median = statistics.median(durations)
+    print("python -c pass:  median %7.1f ms" % statistics.median(baseline))
+    print("pubq %s: median %7.1f ms, min %7.1f ms, max %7.1f ms" % (
+        ' '.join(args.command), median, min(durations), max(durations)))
+    if median > args.budget_ms:
+        print("over budget (%.1f ms)" % args.budget_ms)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,11 +7,8 @@ Usage:
 
     pubq.py command options
 """
-import logging
+import sys
 
-from appupup.main import main
-
-from pubqlib.commands.install import create_install_command
 from pubqlib.constants import (__package_name__, __author__, __package_url__)
 from pubqlib.__version__ import __version__
 
@@ -23,17 +20,20 @@ def print_version(args, logger, the_app):
 
 def setup_parser(parent_parser):
     """ Create the structure that parses the arguments. """
+    from pubqlib.commands import register_commands
+
     subparsers = parent_parser.add_subparsers(help='top level command')
 
     parser = subparsers.add_parser(
         'version', help='Prints the version and exits')
     parser.set_defaults(func=print_version)
 
-    create_install_command(subparsers, my_app)
+    register_commands(subparsers, my_app, sys.argv[1:])
 
 
 def pre_start(arguments, the_app):
-    the_app.toolset.find()
+    import logging
+
     logger = logging.getLogger()
     for handler in logger.handlers:
         if isinstance(handler, logging.StreamHandler):
@@ -45,10 +45,16 @@ def pre_start(arguments, the_app):
 
 
 if __name__ == '__main__':
+    # The version does not need the application, so we don't pay
+    # for importing it.
+    if sys.argv[1:] == ['version']:
+        print_version(None, None, None)
+        sys.exit(0)
+
+    from appupup.main import main
     from pubqlib.logic.the_app import TheApp
     my_app = TheApp()
 
-    import sys
     sys.exit(main(
         app_name=__package_name__, app_version=__version__,
         app_stage='',
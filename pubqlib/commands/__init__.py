@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of the commands implemented in this package.
+
+The module of a command is only imported when that command is selected
+on the command line; the other commands get a placeholder parser so that
+they still show up in the help text.
+"""
+import importlib
+
+# name, module, parser constructor, help
+COMMANDS = (
+    ('install', 'pubqlib.commands.install', 'create_install_command',
+     'Installs a plugin to local QGis installation'),
+    ('daemon', 'pubqlib.commands.daemon', 'create_daemon_command',
+     'Keeps the program in memory and serves other invocations'),
+    ('profiles', 'pubqlib.commands.profiles', 'create_profiles_command',
+     'Compares the size and load time of the deploy profiles'),
+    ('check', 'pubqlib.commands.check', 'create_check_command',
+     'Validates plugins without deploying them'),
+    ('status', 'pubqlib.commands.status', 'create_status_command',
+     'Tells what a new install would rebuild and copy'),
+    ('diff', 'pubqlib.commands.status', 'create_diff_command',
+     'Lists the differences between a plugin and its installed copy'),
+    ('workspace', 'pubqlib.commands.workspace', 'create_workspace_command',
+     'Builds and installs all plugins of a workspace'),
+    ('verify', 'pubqlib.commands.verify', 'create_verify_command',
+     'Checks that installed plugins match their manifest'),
+    ('import-profile', 'pubqlib.commands.import_profile',
+     'create_import_profile_command',
+     'Measures how long QGis takes to load installed plugins'),
+    ('resources', 'pubqlib.commands.resources', 'create_resources_command',
+     'Reports the resources shared by the .qrc files of plugins'),
+    ('export', 'pubqlib.commands.export', 'create_export_command',
+     'Builds plugins and writes them to an archive, without staging '
+     'them on disk'),
+    ('worker', 'pubqlib.commands.worker', 'create_worker_command',
+     'Compiles forms and resources for builds on other machines'),
+)
+
+# The options of the program (added by appupup before the commands) that
+# are followed by a value.
+VALUE_OPTIONS = ('--config', '--log-level', '--log-file', '--hook-file',
+                 '--udd')
+
+
+def selected_command(argv, names=None):
+    """
+    Finds the command that the user has selected.
+
+    The command is the first argument that is neither an option of the
+    program nor the value of one, so a value that happens to be the
+    name of a command (e.g. `--log-file install`) is not mistaken for
+    it.
+
+    Arguments:
+        argv (list):
+            The arguments (without the name of the program).
+        names (iterable):
+            The names of the commands; all registered commands by default.
+
+    Returns:
+        The name of the command or None if no command was found.
+    """
+    if names is None:
+        names = [command[0] for command in COMMANDS]
+    skip_value = False
+    for arg in argv:
+        if skip_value:
+            skip_value = False
+        elif arg == '--':
+            continue
+        elif arg.startswith('-'):
+            # argparse also accepts unambiguous prefixes of long options.
+            skip_value = '=' not in arg and len(arg) > 2 and any(
+                option.startswith(arg) for option in VALUE_OPTIONS)
+        else:
+            return arg if arg in names else None
+    return None
+
+
+def register_commands(subparsers, the_app, argv):
+    """
+    Adds the parsers for all registered commands.
+
+    Arguments:
+        subparsers:
+            The object returned by `add_subparsers()`.
+        the_app (TheApp):
+            The application.
+        argv (list):
+            The arguments (without the name of the program).
+    """
+    selected = selected_command(argv)
+    for name, module_name, constructor, help_text in COMMANDS:
+        if name == selected:
+            module = importlib.import_module(module_name)
+            getattr(module, constructor)(subparsers, the_app)
+        else:
+            subparsers.add_parser(name, help=help_text)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+
+"""
+import logging
+
+from pubqlib.logic.checker import PubChecker
+
+logger = logging.getLogger('pubq.cmd.check')
+
+
+def check_command(args, log, the_app):
+    """ The command handler for check command. """
+    logger.debug("check command (%r)", args)
+    the_app.source_py = True
+    checker = PubChecker(
+        cache_path='' if args.no_cache else None, jobs=args.jobs)
+    result = True
+    for source in args.source:
+        plugin = the_app.try_load_plugin(source)
+        if plugin is not None and checker.check(plugin):
+            print("%s: ok" % source)
+        else:
+            print("%s: failed" % source)
+            result = False
+    return 0 if result else 1
+
+
+def create_check_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'check', help='Validates plugins without deploying them')
+    parser.add_argument(
+        "--jobs", default=None, type=int,
+        help="number of worker processes; by default one per CPU")
+    parser.add_argument(
+        "--no-cache", default=False,
+        action="store_true",
+        help="check all files, even if they were checked before")
+    parser.add_argument(
+        "source", nargs='+',
+        help="The source directory of the plugin")
+    parser.set_defaults(func=check_command)
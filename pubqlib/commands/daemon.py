@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+
+"""
+import logging
+
+from pubqlib.logic.daemon import PubDaemon
+from pubqlib.utils import get_daemon_socket
+
+logger = logging.getLogger('pubq.cmd.daemon')
+
+
+def daemon_command(args, log, the_app):
+    """ The command handler for daemon command. """
+    logger.debug("daemon command (%r)", args)
+    daemon = PubDaemon(the_app, args.socket)
+    return 0 if daemon.serve() else 1
+
+
+def create_daemon_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'daemon',
+        help='Keeps the program in memory and serves other invocations')
+    parser.add_argument(
+        "--socket", default=get_daemon_socket(),
+        help="the unix socket where the daemon listens for commands")
+    parser.set_defaults(func=daemon_command)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+
+"""
+import contextlib
+import logging
+import os
+import subprocess
+import sys
+
+from pubqlib.logic.export import COMPRESSIONS
+from pubqlib.logic.profile import PROFILES, DEFAULT_PROFILE, get_profile
+from pubqlib.logic.toolset import TARGETS
+
+logger = logging.getLogger('pubq.cmd.export')
+
+
+@contextlib.contextmanager
+def stdout_to_stderr():
+    """
+    Sends everything written to the standard output to the standard
+    error, including the output of child processes (the compilers),
+    and yields a binary file writing to the original standard output.
+    """
+    sys.stdout.flush()
+    saved_fd = os.dup(sys.stdout.fileno())
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    fileobj = os.fdopen(saved_fd, 'wb')
+    try:
+        yield fileobj
+    finally:
+        sys.stdout.flush()
+        fileobj.flush()
+        os.dup2(saved_fd, sys.stdout.fileno())
+        fileobj.close()
+
+
+def export_command(args, log, the_app):
+    """ The command handler for export command. """
+    logger.debug("export command (%r)", args)
+    the_app.source_py = bool(args.source_py)
+    the_app.lazy_init = args.lazy_init
+    the_app.optimize_images = args.optimize_images
+    the_app.profile = get_profile(args.profile)
+    the_app.check = not args.no_check
+    the_app.targets = [args.target] if args.target else None
+    the_app.toolset.from_args(args)
+
+    with contextlib.ExitStack() as stack:
+        if args.output == '-':
+            if sys.stdout.isatty():
+                logger.error("Refusing to write an archive to a terminal")
+                return 1
+            # The compilers report on stdout, which carries the archive.
+            fileobj = stack.enter_context(stdout_to_stderr())
+        else:
+            fileobj = stack.enter_context(open(args.output, 'wb'))
+        try:
+            result = the_app.export(
+                args.source, fileobj, compression=args.compression,
+                force_recompile=args.force_recompile)
+        except (OSError, ValueError, subprocess.CalledProcessError) as exc:
+            logger.error("Cannot export: %s", exc)
+            return 1
+    return 0 if result else 1
+
+
+def create_export_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'export',
+        help='Builds plugins and writes them to an archive, without '
+             'staging them on disk')
+
+    # The toolset also gets some arguments here.
+    the_app.toolset.prepare_parser(parser)
+
+    parser.add_argument(
+        "--format", default='tar', choices=['tar'],
+        help="the format of the archive; it holds a directory for each "
+             "plugin, as it would be installed")
+    parser.add_argument(
+        "--compression", default=None, choices=COMPRESSIONS,
+        help="compress the archive; by default it is not compressed")
+    parser.add_argument(
+        "--source-py", default=False,
+        action="store_true",
+        help="export source files instead of compiled .pyc files")
+    parser.add_argument(
+        "--lazy-init", default=False,
+        action="store_true",
+        help="let QGis start without importing the plugins (see the "
+             "install command)")
+    parser.add_argument(
+        "--optimize-images", default=False,
+        action="store_true",
+        help="losslessly recompress the PNG images of the plugins")
+    parser.add_argument(
+        "--force-recompile", default=False,
+        action="store_true",
+        help="compile even if the outputs are up to date")
+    parser.add_argument(
+        "--profile", default=DEFAULT_PROFILE,
+        choices=sorted(PROFILES),
+        help="how python files are compiled")
+    parser.add_argument(
+        "--target", default=None, choices=sorted(TARGETS),
+        help="the Qt flavour to build for; by default the tools found "
+             "by the toolset options")
+    parser.add_argument(
+        "--no-check", default=False,
+        action="store_true",
+        help="export without validating the plugins first")
+    parser.add_argument(
+        "output",
+        help="the archive to write or - for the standard output, e.g. "
+             "pubq export - plugin | ssh host tar -x -C plugins")
+    parser.add_argument(
+        "source", nargs='*', default=['.'],
+        help="The source directories of the plugins; by default the "
+             "current directory")
+    parser.set_defaults(func=export_command)
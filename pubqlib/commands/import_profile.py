@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+
+"""
+import json
+import logging
+
+from pubqlib.commands.verify import add_location_arguments, installed_path
+from pubqlib.logic.import_profile import PubImportProfile
+
+logger = logging.getLogger('pubq.cmd.import_profile')
+
+
+def import_profile_command(args, log, the_app):
+    """ The command handler for import-profile command. """
+    logger.debug("import-profile command (%r)", args)
+    profiles = []
+    for plugin in args.plugin:
+        path = installed_path(plugin, args, the_app)
+        profile = PubImportProfile(
+            path, python=args.python, stubs=args.stub,
+            init_gui=args.init_gui)
+        try:
+            profiles.append(profile.run(runs=args.runs))
+        except OSError as exc:
+            logger.error("Cannot profile %s: %s", path, exc)
+            return 1
+
+    if args.json:
+        print(json.dumps(
+            [profile.to_dict() for profile in profiles], indent=1))
+    else:
+        for profile in profiles:
+            for line in profile.report(top=args.top):
+                print(line)
+
+    result = True
+    for profile in profiles:
+        if profile.error is not None:
+            result = False
+            continue
+        if args.max_ms is not None and profile.total_ms > args.max_ms:
+            logger.error("%s takes %.1f ms to load, over the limit of "
+                         "%.1f ms", profile.path, profile.total_ms,
+                         args.max_ms)
+            result = False
+        if args.max_memory is not None and \
+                profile.peak_bytes > args.max_memory * 1024 * 1024:
+            logger.error("%s needs %.1f MiB to load, over the limit of "
+                         "%.1f MiB", profile.path,
+                         profile.peak_bytes / 1024.0 / 1024.0,
+                         args.max_memory)
+            result = False
+    return 0 if result else 1
+
+
+def create_import_profile_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'import-profile',
+        help='Measures how long QGis takes to load installed plugins')
+    add_location_arguments(parser)
+    parser.add_argument(
+        "--python", default=None,
+        help="the interpreter that loads the plugin, e.g. the one of "
+             "QGis; by default the one running this program")
+    parser.add_argument(
+        "--stub", default=[], action="append", metavar="MODULE",
+        help="also replace this module (and its sub-modules) by "
+             "stand-ins; qgis, PyQt4, PyQt5, PyQt6 and sip always are")
+    parser.add_argument(
+        "--init-gui", default=False,
+        action="store_true",
+        help="also call initGui() on the plugin, as QGis does")
+    parser.add_argument(
+        "--runs", default=3, type=int,
+        help="how many times the plugin is loaded; the fastest run is "
+             "reported")
+    parser.add_argument(
+        "--top", default=15, type=int,
+        help="how many entries each ranking shows")
+    parser.add_argument(
+        "--json", default=False,
+        action="store_true",
+        help="print the measurements as json")
+    parser.add_argument(
+        "--max-ms", default=None, type=float,
+        help="exit with an error status if loading a plugin takes longer")
+    parser.add_argument(
+        "--max-memory", default=None, type=float, metavar="MIB",
+        help="exit with an error status if loading a plugin needs more "
+             "memory")
+    parser.add_argument(
+        "plugin", nargs='+',
+        help="The directory of an installed plugin or its name")
+    parser.set_defaults(func=import_profile_command)
@@ -2,28 +2,109 @@
 """
 
 """
+import argparse
 import logging
 import os
-import pkgutil
-import configparser
 
-from pubqlib.logic.plugin import PubPlugin
-from pubqlib.logic.toolset import Toolset
+from pubqlib.logic.daemon import forward_to_daemon
+from pubqlib.logic.profile import PROFILES, DEFAULT_PROFILE, get_profile
+from pubqlib.logic.toolset import TARGETS
+from pubqlib.utils import get_daemon_socket
 
 logger = logging.getLogger('pubq.cmd.install')
 
 
+def worker_list(value):
+    """ Parses a comma separated list of worker addresses. """
+    from pubqlib.logic.worker import parse_address
+
+    result = [item.strip() for item in value.split(',') if item.strip()]
+    for item in result:
+        try:
+            parse_address(item)
+        except ValueError as exc:
+            raise argparse.ArgumentTypeError(str(exc))
+    return result
+
+
+def target_list(value):
+    """ Parses a comma separated list of targets. """
+    result = [item.strip() for item in value.split(',') if item.strip()]
+    for item in result:
+        if item not in TARGETS:
+            raise argparse.ArgumentTypeError(
+                "unknown target %r; use one of %s" % (
+                    item, ', '.join(sorted(TARGETS))))
+    return result
+
+
 def install_command(args, log, the_app):
     """ The command handler for version command. """
     logger.debug("install command (%r)", args)
-    the_app.source_py = bool(args.source_py)
-    the_app.destination = os.path.abspath(args.destination)
+    if args.from_repo:
+        # Plugin names are passed as they are.
+        sources = [
+            os.path.abspath(source) if os.path.isdir(source) else source
+            for source in args.source]
+    else:
+        sources = [os.path.abspath(source) for source in args.source]
+    # The schedule is only known to the process doing the work.
+    if not args.no_daemon and not args.explain_schedule:
+        result = forward_to_daemon('install', {
+            'source': sources,
+            'from_repo': args.from_repo,
+            'qgis_version': args.qgis_version,
+            'destination': os.path.abspath(args.destination)
+            if args.destination else None,
+            'targets': args.targets,
+            'source_py': bool(args.source_py or args.link),
+            'link': args.link,
+            'lazy_init': args.lazy_init,
+            'optimize_images': args.optimize_images,
+            'workers': args.workers,
+            'jobs': args.jobs,
+            'force_recompile': args.force_recompile,
+            'on_existing': args.on_existing,
+            'profile': args.profile,
+            'check': not args.no_check,
+            'rc_compiler': args.rc_compiler,
+            'ui_compiler': args.ui_compiler,
+            'target_python': args.target_python,
+        }, socket_path=args.socket)
+        if result is not None:
+            return result
+
+    # Linked modules are the sources themselves.
+    the_app.source_py = bool(args.source_py or args.link)
+    the_app.link = args.link
+    the_app.lazy_init = args.lazy_init
+    the_app.optimize_images = args.optimize_images
+    if args.workers:
+        from pubqlib.logic.worker import WorkerPool
+        the_app.workers = WorkerPool(args.workers)
+    the_app.jobs = args.jobs
+    the_app.profile = get_profile(args.profile)
+    the_app.check = not args.no_check
+    the_app.destination = os.path.abspath(args.destination) \
+        if args.destination else None
+    the_app.targets = args.targets
+    the_app.qgis_version = args.qgis_version
     the_app.toolset.from_args(args)
-    the_app.install(
+    if args.from_repo:
+        return 0 if the_app.install_from_repo(
+            args.from_repo, sources, clear_opt=args.on_existing) else 1
+    result = the_app.install(
         args.source,
         force_recompile=args.force_recompile,
         clear_opt=args.on_existing,
     )
+    if args.explain_schedule:
+        for plugin in the_app.plugins:
+            for schedule in plugin.schedules:
+                print("%s (%s)" % (plugin.name, plugin.source_path))
+                for line in schedule.report():
+                    print('  ' + line)
+    return 0 if result else 1
 
 
 def create_install_command(subparsers, the_app):
@@ -41,14 +122,65 @@ def create_install_command(subparsers, the_app):
         action="store_true",
         help="deploy source files; by default the program deploys compiled "
              ".pyc files")
+    parser.add_argument(
+        "--link", default=False,
+        action="store_true",
+        help="for development: deploy symbolic links to the source files "
+             "(implies --source-py); only metadata.txt and the compiled "
+             "forms and resources are copied, so a new install only "
+             "rebuilds and copies what changed")
+    parser.add_argument(
+        "--lazy-init", default=False,
+        action="store_true",
+        help="deploy a generated __init__.py that lets QGis start without "
+             "importing the plugin; its modules, forms and resources are "
+             "loaded once QGis is running (the original __init__.py is "
+             "deployed as _pubq_init.py)")
+    parser.add_argument(
+        "--optimize-images", default=False,
+        action="store_true",
+        help="losslessly recompress the PNG images used by the .qrc files "
+             "and the extra files; optimized images are cached, so each "
+             "image is only processed once (ignored with --link)")
+    parser.add_argument(
+        "--workers", default=None, type=worker_list,
+        help="comma separated list of workers (host:port or the path of "
+             "a unix socket, see the worker command) that compile the "
+             "forms and resources; units are compiled locally when no "
+             "worker can take them. Only use workers you trust: the "
+             "modules they return are deployed as they are. TCP workers "
+             "need the token in PUBQ_WORKER_TOKEN")
+    parser.add_argument(
+        "--jobs", default=None, type=int,
+        help="how many forms and resources are compiled at the same time, "
+             "longest first (based on the durations of previous builds); "
+             "by default one, or as many as the workers accept")
+    parser.add_argument(
+        "--explain-schedule", default=False,
+        action="store_true",
+        help="print the order in which forms and resources were compiled, "
+             "with the predicted and the actual time (implies --no-daemon)")
     parser.add_argument(
         "--force-recompile", default=False,
         action="store_true",
         help="forces the recompilation even if the timestamps would suggest "
              "that there's no need")
     parser.add_argument(
-        "--destination", default=destination,
-        help="where to copy the files")
+        "--profile", default=DEFAULT_PROFILE,
+        choices=sorted(PROFILES),
+        help="how python files are compiled: debug (no optimizations), "
+             "release (asserts are removed) or release-slim (asserts and "
+             "docstrings are removed)")
+    parser.add_argument(
+        "--targets", default=None, type=target_list,
+        help="comma separated list of Qt flavours to build for (%s); the "
+             "plugin is scanned once and built for each of them" % (
+                 ', '.join(sorted(TARGETS))))
+    parser.add_argument(
+        "--destination", default=None,
+        help="where to copy the files; by default the plugin directory "
+             "of QGis (%s); with more than one target each one is "
+             "installed in a sub-directory" % destination)
     parser.add_argument(
         "--on-existing", default='error',
         choices=['error', 'clear', 'overwrite'],
@@ -56,8 +188,33 @@ def create_install_command(subparsers, the_app):
              "error (will refuse to go forward if the directory is not empty), "
              "clear (will delete any files or  directories found inside prior to installation) or "
              "overwrite (will only overwrite the files that are installed)")
+    parser.add_argument(
+        "--from-repo", default=None, metavar="URL",
+        help="install plugins by name (NAME or NAME==VERSION) from a local "
+             "repository (a directory with plugins.xml, as a path or a "
+             "file:// url), together with the plugins they depend on; "
+             "for source directories only their dependencies are taken "
+             "from the repository")
+    parser.add_argument(
+        "--qgis-version", default=None,
+        help="the QGis version plugins from the repository must support; "
+             "by default any release of the QGis version of the target")
+    parser.add_argument(
+        "--no-check", default=False,
+        action="store_true",
+        help="deploy without validating the metadata, python sources "
+             "and xml files first")
+    parser.add_argument(
+        "--no-daemon", default=False,
+        action="store_true",
+        help="do the work in this process even if a daemon is running")
+    parser.add_argument(
+        "--socket", default=get_daemon_socket(),
+        help="the unix socket of the daemon")
     parser.add_argument(
         "source", nargs='+',
-        help="The source directory from where we install the plugin")
+        help="The source directory from where we install the plugin, "
+             "the zip file of a released plugin or, with --from-repo, the "
+             "name of a plugin")
 
     parser.set_defaults(func=install_command)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+
+"""
+import logging
+
+from pubqlib.logic.profile import (
+    collect_sources, compare_profiles, format_report)
+
+logger = logging.getLogger('pubq.cmd.profiles')
+
+
+def profiles_command(args, log, the_app):
+    """ The command handler for profiles command. """
+    logger.debug("profiles command (%r)", args)
+    the_app.source_py = True
+    result = True
+    for source in args.source:
+        plugin = the_app.try_load_plugin(source)
+        if plugin is None:
+            result = False
+            continue
+        files = collect_sources(plugin)
+        print("%s (%s)" % (plugin.name, plugin.source_path))
+        print(format_report(compare_profiles(files, repeat=args.repeat)))
+        print()
+    return 0 if result else 1
+
+
+def create_profiles_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'profiles',
+        help='Compares the size and load time of the deploy profiles')
+    parser.add_argument(
+        "--repeat", default=5, type=int,
+        help="how many times the bytecode is loaded; the best time is "
+             "reported")
+    parser.add_argument(
+        "source", nargs='+',
+        help="The source directory of the plugin")
+    parser.set_defaults(func=profiles_command)
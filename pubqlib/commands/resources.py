@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+
+"""
+import logging
+
+from pubqlib.logic.resources import ResourceIndex
+
+logger = logging.getLogger('pubq.cmd.resources')
+
+
+def resources_command(args, log, the_app):
+    """ The command handler for resources command. """
+    logger.debug("resources command (%r)", args)
+    result = True
+    for source in args.source:
+        plugin = the_app.try_load_plugin(source)
+        if plugin is None:
+            result = False
+            continue
+        index = ResourceIndex(
+            [qrc_file.path_in for qrc_file in plugin.qrc_files],
+            hashes=plugin.get_journal().hashes).build()
+        print('%s: %d .qrc files' % (plugin.source_path, len(index.qrc_paths)))
+        for line in index.report(top=args.top):
+            print('  ' + line)
+    return 0 if result else 1
+
+
+def create_resources_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'resources',
+        help='Reports the resources shared by the .qrc files of plugins')
+    parser.add_argument(
+        "--top", default=10, type=int,
+        help="how many files compiled under different paths are listed")
+    parser.add_argument(
+        "source", nargs='+',
+        help="The source directory of the plugin")
+    parser.set_defaults(func=resources_command)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+
+"""
+import logging
+import os
+
+from pubqlib.commands.install import target_list
+from pubqlib.logic.profile import PROFILES, DEFAULT_PROFILE, get_profile
+from pubqlib.logic.status import PubStatus
+from pubqlib.logic.toolset import TARGETS
+
+logger = logging.getLogger('pubq.cmd.status')
+
+
+def compare(args, the_app):
+    """
+    Compares each plugin with each of its deployed copies.
+
+    Returns:
+        The PubStatus of each copy and False if a plugin could not be
+        loaded or compared.
+    """
+    # Linked modules are the sources themselves.
+    the_app.source_py = bool(args.source_py or args.link)
+    the_app.destination = os.path.abspath(args.destination) \
+        if args.destination else None
+    the_app.targets = args.targets
+    the_app.toolset.from_args(args)
+    profile = get_profile(args.profile)
+
+    result = []
+    loaded = True
+    for source in args.source:
+        plugin = the_app.try_load_plugin(source)
+        if plugin is None:
+            loaded = False
+            continue
+        # As the build does; it decides what is compiled and deployed.
+        plugin.lazy_init = args.lazy_init
+        plugin.optimize_images = args.optimize_images and not args.link
+        plugin.optimize_assets(dry_run=True)
+        plugin.share_resources(dry_run=True)
+        if args.targets is None:
+            variants = [(plugin, the_app.toolset, None)]
+        else:
+            variants = []
+            for target in args.targets:
+                toolset = the_app.toolset.for_target(target)
+                try:
+                    variant = plugin.variant(target, toolset)
+                except ValueError as exc:
+                    logger.error("Cannot compare %s for %s: %s",
+                                 plugin.name, target, exc)
+                    loaded = False
+                    continue
+                variants.append((variant, toolset, target))
+        for variant, toolset, target in variants:
+            destination = the_app.target_destination(target, create=False)
+            result.append(PubStatus(
+                variant, toolset, profile,
+                os.path.join(destination, variant.target_name)).compute())
+    return result, loaded
+
+
+def status_command(args, log, the_app):
+    """ The command handler for status command. """
+    logger.debug("status command (%r)", args)
+    statuses, loaded = compare(args, the_app)
+    for status in statuses:
+        for line in status.summary():
+            print(line)
+    return 0 if loaded else 1
+
+
+def diff_command(args, log, the_app):
+    """ The command handler for diff command. """
+    logger.debug("diff command (%r)", args)
+    result = True
+    statuses, loaded = compare(args, the_app)
+    for status in statuses:
+        for line in status.details():
+            print(line)
+        result = result and status.up_to_date
+    if not loaded:
+        return 1
+    return 1 if args.exit_code and not result else 0
+
+
+def add_arguments(parser, the_app):
+    """ The arguments shared by the status and diff commands. """
+    the_app.toolset.prepare_parser(parser)
+    parser.add_argument(
+        "--source-py", default=False,
+        action="store_true",
+        help="compare with a plugin deployed with --source-py")
+    parser.add_argument(
+        "--link", default=False,
+        action="store_true",
+        help="compare with a plugin deployed with --link")
+    parser.add_argument(
+        "--lazy-init", default=False,
+        action="store_true",
+        help="compare with a plugin deployed with --lazy-init")
+    parser.add_argument(
+        "--optimize-images", default=False,
+        action="store_true",
+        help="compare with a plugin built with --optimize-images")
+    parser.add_argument(
+        "--profile", default=DEFAULT_PROFILE,
+        choices=sorted(PROFILES),
+        help="the profile the plugin would be built with")
+    parser.add_argument(
+        "--targets", default=None, type=target_list,
+        help="comma separated list of Qt flavours (%s)" % (
+            ', '.join(sorted(TARGETS))))
+    parser.add_argument(
+        "--destination", default=None,
+        help="where the plugin is installed; by default the plugin "
+             "directory of QGis")
+    parser.add_argument(
+        "source", nargs='+',
+        help="The source directory of the plugin")
+
+
+def create_status_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'status', help='Tells what a new install would rebuild and copy')
+    add_arguments(parser, the_app)
+    parser.set_defaults(func=status_command)
+
+
+def create_diff_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'diff',
+        help='Lists the differences between a plugin and its installed copy')
+    add_arguments(parser, the_app)
+    parser.add_argument(
+        "--exit-code", default=False,
+        action="store_true",
+        help="exit with an error status if there are differences")
+    parser.set_defaults(func=diff_command)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+
+"""
+import logging
+import os
+
+from pubqlib.logic.toolset import TARGETS
+from pubqlib.logic.verify import PubVerifier
+from pubqlib.utils.fileio import HashCache
+
+logger = logging.getLogger('pubq.cmd.verify')
+
+
+def installed_path(plugin, args, the_app):
+    """
+    The directory of an installed plugin given by path or by name.
+
+    Names are looked up where install would have deployed the plugin.
+    """
+    if os.path.isdir(plugin):
+        return os.path.abspath(plugin)
+    the_app.destination = os.path.abspath(args.destination) \
+        if args.destination else None
+    the_app.targets = None if args.target is None else [args.target]
+    return os.path.join(
+        the_app.target_destination(args.target, create=False), plugin)
+
+
+def add_location_arguments(parser):
+    """ The arguments that locate installed plugins. """
+    parser.add_argument(
+        "--destination", default=None,
+        help="the directory where the plugins are installed; by default "
+             "the plugin directory of QGis")
+    parser.add_argument(
+        "--target", default=None, choices=sorted(TARGETS),
+        help="the Qt flavour the plugin was installed for, as given to "
+             "install --targets; by default the one install uses")
+
+
+def verify_command(args, log, the_app):
+    """ The command handler for verify command. """
+    logger.debug("verify command (%r)", args)
+    hashes = HashCache(cache_path='' if args.full else None)
+    result = True
+    for plugin in args.plugin:
+        path = installed_path(plugin, args, the_app)
+        verifier = PubVerifier(
+            path, hashes=hashes, jobs=args.jobs, full=args.full)
+        try:
+            verifier.verify()
+        except (OSError, ValueError) as exc:
+            logger.error("Cannot verify %s: %s", path, exc)
+            result = False
+            continue
+        print(verifier.summary())
+        for line in verifier.details():
+            print('  ' + line)
+        result = result and verifier.intact
+    return 0 if result else 1
+
+
+def create_verify_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'verify',
+        help='Checks that installed plugins match their manifest')
+    add_location_arguments(parser)
+    parser.add_argument(
+        "--jobs", default=None, type=int,
+        help="maximum number of threads hashing files")
+    parser.add_argument(
+        "--full", default=False,
+        action="store_true",
+        help="hash every file, even the ones that were not touched "
+             "since they were last hashed")
+    parser.add_argument(
+        "plugin", nargs='+',
+        help="The directory of an installed plugin or its name")
+    parser.set_defaults(func=verify_command)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+
+"""
+import logging
+import os
+
+from pubqlib.logic.worker import (
+    TOKEN_VARIABLE, PubWorker, get_worker_socket)
+
+logger = logging.getLogger('pubq.cmd.worker')
+
+
+def worker_command(args, log, the_app):
+    """ The command handler for worker command. """
+    logger.debug("worker command (%r)", args)
+    the_app.toolset.from_args(args)
+    worker = PubWorker(
+        args.listen, the_app.toolset, jobs=args.jobs,
+        token=os.environ.get(TOKEN_VARIABLE))
+    return 0 if worker.serve() else 1
+
+
+def create_worker_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'worker',
+        help='Compiles forms and resources for builds on other machines')
+
+    # The toolset also gets some arguments here.
+    the_app.toolset.prepare_parser(parser)
+
+    parser.add_argument(
+        "--listen", default=get_worker_socket(),
+        help="the path of a unix socket (only the current user may "
+             "connect; by default %s) or a port (loopback only) or "
+             "host:port to listen on TCP; TCP clients must present the "
+             "token in %s, which must be set. Workers must be trusted: "
+             "the modules they return run inside QGis" % (
+                 get_worker_socket(), TOKEN_VARIABLE))
+    parser.add_argument(
+        "--jobs", default=None, type=int,
+        help="how many compilers run at the same time; by default the "
+             "number of processors")
+    parser.set_defaults(func=worker_command)
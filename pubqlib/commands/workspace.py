@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+
+"""
+import logging
+import os
+
+from pubqlib.commands.install import target_list, worker_list
+from pubqlib.logic.profile import PROFILES, DEFAULT_PROFILE, get_profile
+from pubqlib.logic.toolset import TARGETS
+from pubqlib.logic.worker import WorkerPool
+from pubqlib.logic.workspace import WORKSPACE_NAME, PubWorkspace
+
+logger = logging.getLogger('pubq.cmd.workspace')
+
+
+def workspace_command(args, log, the_app):
+    """ The command handler for workspace command. """
+    logger.debug("workspace command (%r)", args)
+    the_app.source_py = bool(args.source_py)
+    the_app.profile = get_profile(args.profile)
+    the_app.check = not args.no_check
+    the_app.destination = os.path.abspath(args.destination) \
+        if args.destination else None
+    the_app.targets = args.targets
+    the_app.lazy_init = args.lazy_init
+    the_app.optimize_images = args.optimize_images
+    # A single pool, so the plugins built at the same time share the
+    # workers.
+    the_app.workers = WorkerPool(args.workers) if args.workers else None
+    the_app.jobs = args.compile_jobs
+    the_app.toolset.from_args(args)
+
+    try:
+        workspace = PubWorkspace(args.workspace).read().load(
+            the_app, jobs=args.jobs)
+    except (OSError, ValueError) as exc:
+        logger.error("Cannot load workspace %s: %s", args.workspace, exc)
+        return 1
+    return 0 if workspace.build(
+        the_app, force_recompile=args.force_recompile,
+        clear_opt=args.on_existing, jobs=args.jobs) else 1
+
+
+def create_workspace_command(subparsers, the_app):
+    """ Construct the parser for program arguments. """
+    parser = subparsers.add_parser(
+        'workspace', help='Builds and installs all plugins of a workspace')
+
+    # The toolset also gets some arguments here.
+    the_app.toolset.prepare_parser(parser)
+
+    parser.add_argument(
+        "--source-py", default=False,
+        action="store_true",
+        help="deploy source files instead of compiled .pyc files")
+    parser.add_argument(
+        "--lazy-init", default=False,
+        action="store_true",
+        help="let QGis start without importing the plugins (see the "
+             "install command)")
+    parser.add_argument(
+        "--optimize-images", default=False,
+        action="store_true",
+        help="losslessly recompress the PNG images of the plugins")
+    parser.add_argument(
+        "--workers", default=None, type=worker_list,
+        help="comma separated list of workers that compile the forms "
+             "and resources (see the install command)")
+    parser.add_argument(
+        "--force-recompile", default=False,
+        action="store_true",
+        help="compile even if the outputs are up to date")
+    parser.add_argument(
+        "--profile", default=DEFAULT_PROFILE,
+        choices=sorted(PROFILES),
+        help="how python files are compiled")
+    parser.add_argument(
+        "--targets", default=None, type=target_list,
+        help="comma separated list of Qt flavours to build for (%s)" % (
+            ', '.join(sorted(TARGETS))))
+    parser.add_argument(
+        "--destination", default=None,
+        help="where to copy the plugins; by default the plugin directory "
+             "of QGis")
+    parser.add_argument(
+        "--on-existing", default='error',
+        choices=['error', 'clear', 'overwrite'],
+        help="what to do when a plugin is already installed")
+    parser.add_argument(
+        "--no-check", default=False,
+        action="store_true",
+        help="deploy without validating the plugins first")
+    parser.add_argument(
+        "--jobs", default=None, type=int,
+        help="maximum number of plugins built at the same time")
+    parser.add_argument(
+        "--compile-jobs", default=None, type=int,
+        help="how many forms and resources of a plugin are compiled at "
+             "the same time (see --jobs of the install command)")
+    parser.add_argument(
+        "workspace", nargs='?', default=WORKSPACE_NAME,
+        help="the workspace file or the directory containing %s" %
+             WORKSPACE_NAME)
+    parser.set_defaults(func=workspace_command)
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 """
 """
-import logging
 
 __author__ = "Nicu Tofan"
 __package_name__ = "pubq"
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubArchive class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import hashlib
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from pubqlib.utils.fileio import (
+    CHUNK_SIZE, HASH_NAME, HashCache, atomic_output, crc_file, hash_file)
+from .manifest import MANIFEST_NAME, PubManifest
+from .plugin import prepare_target
+
+logger = logging.getLogger('pubq.archive')
+
+
+def is_plugin_archive(path):
+    """ Tell if a path given on the command line is a zip file. """
+    return os.path.isfile(path) and zipfile.is_zipfile(path)
+
+
+class PubArchive(object):
+    """
+    A released plugin: a zip file with the plugin in a single top-level
+    directory.
+
+    Members are extracted straight into the deployed plugin by a pool of
+    threads, each with its own handle of the archive. The CRC of each
+    member is verified while it is extracted and, when the archive
+    contains a manifest, so are its size and content hash. Members are
+    written under a temporary name, so a member that fails the checks
+    never replaces a deployed file.
+
+    Attributes:
+        path (str):
+            The zip file.
+        target_name (str):
+            The name of the top-level directory.
+        members (list):
+            The ZipInfo of each file in the archive.
+        manifest (PubManifest):
+            The manifest found in the archive or None.
+        jobs (int):
+            Maximum number of threads.
+    """
+
+    def __init__(self, path, jobs=None):
+        """
+        Constructor.
+
+        Arguments:
+            path (str):
+                The zip file.
+            jobs (int):
+                Maximum number of threads.
+        """
+        super().__init__()
+        self.path = path
+        self.jobs = jobs
+        self.target_name = None
+        self.members = []
+        self.manifest = None
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubArchive("%s")' % self.path
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubArchive(%r, jobs=%r)' % (self.path, self.jobs)
+
+    def load(self):
+        """
+        Reads the list of members and the manifest.
+
+        Raises:
+            ValueError if the archive does not hold a plugin or names a
+            file outside of the plugin.
+        """
+        with zipfile.ZipFile(self.path) as archive:
+            infos = archive.infolist()
+            tops = set()
+            for info in infos:
+                parts = info.filename.split('/')
+                if info.filename.startswith('/') or '..' in parts or \
+                        '\\' in info.filename:
+                    raise ValueError(
+                        "unsafe member %r in %s" % (info.filename, self.path))
+                if len(parts) < 2 and not info.is_dir():
+                    raise ValueError(
+                        "%s has files outside of the plugin directory" %
+                        self.path)
+                tops.add(parts[0])
+            if len(tops) != 1:
+                raise ValueError(
+                    "%s must contain exactly one plugin directory" % self.path)
+            self.target_name = tops.pop()
+            self.members = [info for info in infos if not info.is_dir()]
+
+            manifest_name = '%s/%s' % (self.target_name, MANIFEST_NAME)
+            if manifest_name in archive.namelist():
+                self.manifest = PubManifest.from_json(
+                    archive.read(manifest_name).decode('utf-8'))
+                logger.debug("%s has a manifest with %d files",
+                             self.path, len(self.manifest.files))
+        return self
+
+    def is_deployed(self, info, rel_path, output_path):
+        """ Tell if a member is identical to a deployed file. """
+        try:
+            size = os.path.getsize(output_path)
+        except OSError:
+            return False
+        if size != info.file_size:
+            return False
+        expected = None if self.manifest is None \
+            else self.manifest.get(rel_path)
+        if expected is not None:
+            return hash_file(output_path, size) == expected[1]
+        return crc_file(output_path) == info.CRC
+
+    def extract(self, archive, info, target):
+        """
+        Extracts a single member.
+
+        Returns:
+            True if the member was written, False if it was skipped.
+        """
+        rel_path = info.filename[len(self.target_name) + 1:]
+        output_path = os.path.join(target, *rel_path.split('/'))
+        expected = None if self.manifest is None \
+            else self.manifest.get(rel_path)
+        if expected is not None and expected[0] != info.file_size:
+            raise ValueError("size differs from the manifest")
+        if self.is_deployed(info, rel_path, output_path):
+            logger.log(1, "%s is already in place", output_path)
+            return False
+
+        out_dir = os.path.dirname(output_path)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir, exist_ok=True)
+        digest = hashlib.new(HASH_NAME)
+        with atomic_output(output_path) as temp_path:
+            # Reading to the end makes zipfile verify the CRC.
+            with archive.open(info) as fin, open(temp_path, 'wb') as fout:
+                for chunk in iter(lambda: fin.read(CHUNK_SIZE), b''):
+                    if expected is not None:
+                        digest.update(chunk)
+                    fout.write(chunk)
+            if expected is not None and digest.hexdigest() != expected[1]:
+                raise ValueError("content differs from the manifest")
+            mode = (info.external_attr >> 16) & 0o777
+            if mode:
+                os.chmod(temp_path, mode)
+        return True
+
+    def deploy(self, target, clear_opt='error'):
+        """
+        Extracts the plugin into a plugin directory.
+
+        Arguments:
+            target (str):
+                A directory path; the plugin is placed in a
+                sub-directory named like the top-level directory of the
+                archive.
+            clear_opt (str):
+                What to do when the target directory exists and is not
+                empty (see PubPlugin.deploy()).
+
+        Returns:
+            True if all members are in place.
+        """
+        target = os.path.join(target, self.target_name)
+        logger.debug("deploying archive %s to %s", self.path, target)
+        if prepare_target(target, clear_opt) is None:
+            return False
+
+        local = threading.local()
+        handles = []
+        handles_lock = threading.Lock()
+
+        def extract_one(info):
+            archive = getattr(local, 'archive', None)
+            if archive is None:
+                archive = local.archive = zipfile.ZipFile(self.path)
+                with handles_lock:
+                    handles.append(archive)
+            try:
+                return self.extract(archive, info, target)
+            except (zipfile.BadZipFile, ValueError, OSError) as exc:
+                logger.error("%s: %s: %s", self.path, info.filename, exc)
+                return None
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                outcomes = list(executor.map(extract_one, self.members))
+        finally:
+            for archive in handles:
+                archive.close()
+
+        written = outcomes.count(True)
+        failed = outcomes.count(None)
+        logger.debug("%d members extracted, %d already in place, %d failed",
+                     written, len(outcomes) - written - failed, failed)
+        if failed == 0 and self.manifest is None:
+            self.write_manifest(target)
+        return failed == 0
+
+    def write_manifest(self, target):
+        """ Creates the manifest of a plugin released without one. """
+        entries = []
+        for info in self.members:
+            rel_path = info.filename[len(self.target_name) + 1:]
+            entries.append((rel_path, info.file_size, os.path.join(
+                target, *rel_path.split('/'))))
+        hashes = HashCache()
+        digests = hashes.hash_many(
+            [output for _, _, output in entries], jobs=self.jobs)
+        manifest = PubManifest()
+        for rel_path, size, output in entries:
+            manifest.add(rel_path, size, digests[output])
+        manifest.save(os.path.join(target, MANIFEST_NAME))
+        hashes.save()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the ArtefactCache class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import logging
+import os
+import shutil
+import tempfile
+
+from pubqlib.utils import get_cache_dir
+from pubqlib.utils.fileio import atomic_output, copy_file
+from pubqlib.utils.locking import FileLock
+
+logger = logging.getLogger('pubq.artefacts')
+
+
+class ArtefactCache(object):
+    """
+    Files generated by the external compilers, shared by all pubq
+    processes on this machine.
+
+    Each entry is a directory named after the hash of the inputs that
+    produced it. Entries are assembled in a temporary directory and
+    renamed into place, so a partial entry is never visible. The
+    process that generates an entry holds a lock on its key; the others
+    wait for it and then reuse the result.
+
+    Attributes:
+        path (str):
+            The directory holding the entries.
+    """
+
+    def __init__(self, path=None):
+        """
+        Constructor.
+
+        Arguments:
+            path (str):
+                The directory holding the entries; by default a directory
+                in the cache of the program.
+        """
+        super().__init__()
+        self.path = get_cache_dir('artefacts') if path is None else path
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'ArtefactCache(%s)' % self.path
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'ArtefactCache(%r)' % self.path
+
+    def lock(self, key):
+        """ The lock to hold while producing the entry for a key. """
+        return FileLock(os.path.join(self.path, key + '.lock'))
+
+    def fetch(self, key, outputs):
+        """
+        Places the files of an entry.
+
+        Arguments:
+            key (str):
+                The hash of the inputs.
+            outputs (list):
+                Where the files are needed; they are looked up in the
+                entry by their name.
+
+        Returns:
+            True if the entry existed and was copied.
+        """
+        entry = os.path.join(self.path, key)
+        if not os.path.isdir(entry):
+            return False
+        available = set(os.listdir(entry))
+        if len(available) == 0 or not available.issubset(
+                os.path.basename(output) for output in outputs):
+            return False
+
+        logger.debug("reusing %s from %s", outputs, entry)
+        for output in outputs:
+            name = os.path.basename(output)
+            if name not in available:
+                continue
+            out_dir = os.path.dirname(output)
+            if not os.path.isdir(out_dir):
+                os.makedirs(out_dir)
+            with atomic_output(output) as temp_path:
+                copy_file(os.path.join(entry, name), temp_path)
+        return True
+
+    def store(self, key, outputs):
+        """
+        Creates an entry from freshly generated files.
+
+        Arguments:
+            key (str):
+                The hash of the inputs.
+            outputs (list):
+                The generated files; those that do not exist are ignored.
+        """
+        outputs = [output for output in outputs if os.path.isfile(output)]
+        entry = os.path.join(self.path, key)
+        if len(outputs) == 0 or os.path.isdir(entry):
+            return
+        temp_dir = tempfile.mkdtemp(prefix='.%s.' % key, dir=self.path)
+        try:
+            for output in outputs:
+                copy_file(output, os.path.join(
+                    temp_dir, os.path.basename(output)))
+            os.rename(temp_dir, entry)
+        except OSError as exc:
+            logger.debug("could not store %s: %s", entry, exc)
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubChecker class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import ast
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+from pubqlib.utils import get_cache_dir
+from pubqlib.utils.fileio import atomic_output
+from pubqlib.utils.locking import FileLock
+
+logger = logging.getLogger('pubq.checker')
+
+# Bump this when the checks change so old results are not reused.
+CHECKER_VERSION = 1
+
+# Below this many files starting the process pool costs more than it saves.
+POOL_THRESHOLD = 32
+
+
+def check_file(path, kind):
+    """
+    Validates a single file.
+
+    This runs inside the worker processes, so it reads the file itself
+    and returns everything the parent needs.
+
+    Arguments:
+        path (str):
+            The file to check.
+        kind (str):
+            `py` for python sources, `xml` for forms and resources.
+
+    Returns:
+        A (path, content hash, error message or None) tuple. Results
+        are cached by content and reused for any file with the same
+        content, so the message only gives the error and its line; the
+        caller prefixes it with the path. (ast.parse() is given the path,
+        and str() of its SyntaxError would name it.)
+    """
+    try:
+        with open(path, 'rb') as fin:
+            content = fin.read()
+    except OSError as exc:
+        return path, None, str(exc)
+
+    digest = hashlib.sha1(content).hexdigest()
+    error = None
+    try:
+        if kind == 'py':
+            ast.parse(content, filename=path)
+        else:
+            ElementTree.fromstring(content)
+    except ElementTree.ParseError as exc:
+        # Only gives the line and column.
+        error = str(exc)
+    except SyntaxError as exc:
+        error = '%s (line %s)' % (exc.msg, exc.lineno)
+    except ValueError as exc:
+        # Null bytes, for instance.
+        error = str(exc)
+    return path, digest, error
+
+
+class PubChecker(object):
+    """
+    Validates a plugin before it is deployed.
+
+    The metadata must contain all required fields, python sources must
+    parse and forms and resources must be well-formed XML.
+
+    Results are cached by content hash. A file whose size and timestamp
+    did not change since the last check is not even read again.
+
+    Attributes:
+        cache_path (str):
+            The json file where results are stored.
+        jobs (int):
+            Maximum number of worker processes; None to use all CPUs.
+    """
+
+    def __init__(self, cache_path=None, jobs=None):
+        """
+        Constructor.
+
+        Arguments:
+            cache_path (str):
+                The json file where results are stored; by default a file
+                in the cache directory of the program. Use an empty
+                string to disable caching.
+            jobs (int):
+                Maximum number of worker processes.
+        """
+        super().__init__()
+        if cache_path is None:
+            cache_path = os.path.join(get_cache_dir(), 'check.json')
+        self.cache_path = cache_path
+        self.jobs = jobs
+        self.stats = {}
+        self.results = {}
+        self.loaded = False
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubChecker()'
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubChecker(cache_path=%r, jobs=%r)' % (
+            self.cache_path, self.jobs)
+
+    def read(self):
+        """ The (stats, results) saved by other runs. """
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return {}, {}
+        try:
+            with open(self.cache_path, 'r') as fin:
+                data = json.load(fin)
+        except (OSError, ValueError):
+            logger.debug("ignoring unreadable cache %s", self.cache_path)
+            return {}, {}
+        if data.get('version') != CHECKER_VERSION:
+            return {}, {}
+        return data.get('stats', {}), data.get('results', {})
+
+    def load(self):
+        """ Reads previous results. """
+        self.loaded = True
+        self.stats, self.results = self.read()
+
+    def save(self):
+        """ Writes current results, keeping those of other processes. """
+        if not self.cache_path:
+            return
+        with FileLock(self.cache_path + '.lock'):
+            stats, results = self.read()
+            stats.update(self.stats)
+            results.update(self.results)
+            self.stats, self.results = stats, results
+            with atomic_output(self.cache_path) as temp_path:
+                with open(temp_path, 'w') as fout:
+                    json.dump({
+                        'version': CHECKER_VERSION,
+                        'stats': stats,
+                        'results': results,
+                    }, fout)
+
+    def files_to_check(self, plugin):
+        """ Lists (path, kind) for all the files that need checking. """
+        result = []
+        init_path = os.path.join(plugin.source_path, '__init__.py')
+        if os.path.isfile(init_path):
+            result.append((init_path, 'py'))
+        for module in plugin.modules:
+            for file in module.files:
+                if file.path_in.endswith('.py') and \
+                        os.path.isfile(file.path_in):
+                    result.append((file.path_in, 'py'))
+        for file in plugin.ui_files + plugin.qrc_files:
+            result.append((file.path_in, 'xml'))
+        return result
+
+    def check_files(self, files):
+        """
+        Checks a list of files.
+
+        Arguments:
+            files (list):
+                (path, kind) tuples.
+
+        Returns:
+            A list of error messages.
+        """
+        if not self.loaded:
+            self.load()
+
+        errors = []
+        pending = []
+        for path, kind in files:
+            try:
+                stat = os.stat(path)
+            except OSError as exc:
+                errors.append('%s: %s' % (path, exc))
+                continue
+            signature = [stat.st_mtime_ns, stat.st_size]
+            cached = self.stats.get(path)
+            if cached is not None and cached[0] == signature:
+                key = '%s:%s' % (kind, cached[1])
+                if key in self.results:
+                    if self.results[key] is not None:
+                        errors.append('%s: %s' % (path, self.results[key]))
+                    continue
+            pending.append((path, kind, signature))
+
+        logger.debug("%d files checked before, %d to check now",
+                     len(files) - len(pending), len(pending))
+        if len(pending) >= POOL_THRESHOLD and self.jobs != 1:
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                outcomes = list(executor.map(
+                    check_file,
+                    [item[0] for item in pending],
+                    [item[1] for item in pending],
+                    chunksize=max(1, len(pending) // 64)))
+        else:
+            outcomes = [check_file(path, kind) for path, kind, _ in pending]
+
+        for (path, kind, signature), (_, digest, error) in zip(
+                pending, outcomes):
+            if error is not None:
+                errors.append('%s: %s' % (path, error))
+            if digest is not None:
+                self.stats[path] = [signature, digest]
+                self.results['%s:%s' % (kind, digest)] = error
+
+        if len(pending) > 0:
+            self.save()
+        return errors
+
+    def check(self, plugin):
+        """
+        Validates a plugin.
+
+        Arguments:
+            plugin (PubPlugin):
+                The plugin to check.
+
+        Returns:
+            True if no problems were found.
+        """
+        logger.debug("checking plugin %s", plugin.name)
+        result = plugin.has_required_metadata()
+        errors = self.check_files(self.files_to_check(plugin))
+        for error in errors:
+            logger.error(error)
+        if len(errors) > 0:
+            result = False
+        logger.debug("plugin %s %s the checks", plugin.name,
+                     "passed" if result else "failed")
+        return result
@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubDaemon class.
+
+The daemon keeps an instance of TheApp (and, through it, the toolset and
+the scanned plugins) in memory. Command line invocations forward their
+arguments over a unix socket and the daemon executes them against the
+warm state. Plugins are dropped from the cache as soon as inotify
+reports a change inside their source directory.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+from pubqlib.utils import is_private_dir
+from .profile import get_profile
+
+logger = logging.getLogger('pubq.daemon')
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+CONTENT_EVENTS = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE
+
+# Files whose content (not only their presence) decides how a plugin
+# is scanned.
+SCAN_INPUTS = ('metadata.txt', '__init__.py', '.pubqignore')
+
+# Directories that only hold files written by us or by version control.
+UNWATCHED = ('.pubq', '.git', '.hg', '.svn', '__pycache__')
+
+
+class TreeWatcher(object):
+    """
+    Watches directory trees using inotify.
+
+    Each tree is watched until the first change is seen inside it; then
+    all watches for that tree are removed and the callback is invoked with
+    the root of the tree. The caller re-arms the watch when it has
+    reloaded the tree.
+
+    Attributes:
+        callback (callable):
+            Invoked with the root path of a tree that has changed.
+        available (bool):
+            False if inotify could not be initialized.
+    """
+
+    def __init__(self, callback):
+        """
+        Constructor.
+
+        Arguments:
+            callback (callable):
+                Invoked with the root path of a tree that has changed.
+        """
+        super().__init__()
+        self.callback = callback
+        self.roots = {}
+        self.descriptors = {}
+        self.lock = threading.Lock()
+        self.fd = -1
+        self.libc = None
+        self.thread = None
+
+        lib_name = ctypes.util.find_library('c')
+        if lib_name is not None:
+            try:
+                self.libc = ctypes.CDLL(lib_name, use_errno=True)
+                self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+            except (OSError, AttributeError):
+                self.libc = None
+        if self.fd < 0:
+            logger.warning("inotify is not available; plugins will be "
+                           "rescanned on every request")
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'TreeWatcher(%d trees)' % len(self.roots)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'TreeWatcher()'
+
+    @property
+    def available(self):
+        """ Tell if changes are being tracked. """
+        return self.fd >= 0
+
+    def start(self):
+        """ Starts the thread that reads inotify events. """
+        if not self.available:
+            return
+        self.thread = threading.Thread(
+            target=self.run, name='pubq-watcher', daemon=True)
+        self.thread.start()
+
+    def watch(self, root):
+        """
+        Starts watching a tree.
+
+        Arguments:
+            root (str):
+                The directory at the top of the tree.
+        """
+        if not self.available:
+            return
+        with self.lock:
+            if root in self.roots:
+                return
+            self.roots[root] = []
+            for dir_path, dirs, files in os.walk(root):
+                dirs[:] = [name for name in dirs if name not in UNWATCHED]
+                wd = self.libc.inotify_add_watch(
+                    self.fd, os.fsencode(dir_path), WATCH_MASK)
+                if wd < 0:
+                    logger.debug("could not watch %s (errno %d)",
+                                 dir_path, ctypes.get_errno())
+                    continue
+                self.roots[root].append(wd)
+                self.descriptors[wd] = root
+        logger.debug("watching %s", root)
+
+    def forget(self, root):
+        """ Removes all the watches for a tree. """
+        with self.lock:
+            for wd in self.roots.pop(root, []):
+                self.descriptors.pop(wd, None)
+                self.libc.inotify_rm_watch(self.fd, wd)
+
+    def run(self):
+        """ Reads events and dispatches them. """
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except OSError:
+                logger.debug("inotify descriptor was closed")
+                return
+            offset = 0
+            changed = set()
+            while offset < len(buffer):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(
+                    buffer, offset)
+                offset += EVENT_HEADER.size
+                name = buffer[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_IGNORED or not is_relevant(mask, name):
+                    continue
+                with self.lock:
+                    root = self.descriptors.get(wd)
+                if root is not None:
+                    changed.add(root)
+            for root in changed:
+                logger.debug("change detected in %s", root)
+                self.forget(root)
+                self.callback(root)
+
+    def close(self):
+        """ Releases the inotify descriptor. """
+        if self.available:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def is_relevant(mask, name):
+    """
+    Tell if an event might change the result of scanning a plugin.
+
+    Compiled files are written by the daemon itself and changes to the
+    content of regular files are picked up by the timestamp checks
+    performed at compile time.
+    """
+    name = os.fsdecode(name)
+    if '.pyc' in name or name in UNWATCHED:
+        return False
+    if name.startswith('.') and name.endswith('.tmp'):
+        # Generated files are written under a temporary name first.
+        return False
+    if mask & ~CONTENT_EVENTS:
+        return True
+    return name in SCAN_INPUTS
+
+
+def peer_uid(sock):
+    """
+    The user running the process at the other end of a unix socket.
+
+    Returns:
+        The user id or None where the platform does not tell it.
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    credentials = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', credentials)[1]
+
+
+class PrivateUnixStreamServer(socketserver.UnixStreamServer):
+    """
+    A unix socket server that only serves the user running it.
+
+    The socket is created without permissions for anybody else (there
+    is no window between bind() and chmod()) and the user of each
+    client is checked where the platform tells it.
+    """
+
+    def server_bind(self):
+        """ Creates the socket with owner-only permissions. """
+        previous = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(previous)
+
+    def verify_request(self, request, client_address):
+        """ Refuses the connections of other users. """
+        uid = peer_uid(request)
+        if uid is not None and uid != os.getuid():
+            logger.warning("refused a connection from user %d", uid)
+            return False
+        return True
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """ Serves one request received over the socket. """
+
+    def handle(self):
+        """ Reads a json request and writes back a json response. """
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line.decode('utf-8'))
+            response = self.server.daemon.execute(request)
+        except Exception as exc:
+            logger.error("Request failed", exc_info=True)
+            response = {'result': -2, 'messages': [str(exc)]}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class MessageCollector(logging.Handler):
+    """ Keeps the messages logged while a request is being executed. """
+
+    def __init__(self):
+        """ Constructor. """
+        super().__init__(level=logging.INFO)
+        self.messages = []
+
+    def emit(self, record):
+        """ Stores the formatted message. """
+        self.messages.append(
+            "%s: %s" % (record.levelname, record.getMessage()))
+
+
+class PubDaemon(object):
+    """
+    Serves pubq commands from a long running process.
+
+    Attributes:
+        the_app (TheApp):
+            The application whose state is kept warm.
+        socket_path (str):
+            Where we listen for requests.
+        watcher (TreeWatcher):
+            Invalidates cached plugins when their sources change.
+    """
+
+    def __init__(self, the_app, socket_path):
+        """
+        Constructor.
+
+        Arguments:
+            the_app (TheApp):
+                The application whose state is kept warm.
+            socket_path (str):
+                Where we listen for requests.
+        """
+        super().__init__()
+        self.the_app = the_app
+        self.socket_path = socket_path
+        self.lock = threading.Lock()
+        self.watcher = TreeWatcher(self.the_app.invalidate_plugin)
+        self.the_app.plugin_cache_enabled = self.watcher.available
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubDaemon(%s)' % self.socket_path
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubDaemon(%r, %r)' % (self.the_app, self.socket_path)
+
+    def serve(self):
+        """ Listens for requests until interrupted. """
+        socket_dir = os.path.dirname(os.path.abspath(self.socket_path))
+        if not is_private_dir(socket_dir):
+            logger.error("%s must be a directory that only the current "
+                         "user can access", socket_dir)
+            return False
+        if os.path.exists(self.socket_path):
+            if is_daemon_running(self.socket_path):
+                logger.error("A daemon is already listening at %s",
+                             self.socket_path)
+                return False
+            os.remove(self.socket_path)
+
+        self.the_app.toolset.ensure_found()
+        self.watcher.start()
+        server = PrivateUnixStreamServer(self.socket_path, RequestHandler)
+        server.daemon = self
+        logger.info("pubq daemon listening at %s", self.socket_path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("pubq daemon is shutting down")
+        finally:
+            server.server_close()
+            self.watcher.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        return True
+
+    def execute(self, request):
+        """
+        Runs a command received from a client.
+
+        Arguments:
+            request (dict):
+                The command and its arguments.
+
+        Returns:
+            A dictionary with the result code and the messages that were
+            logged while the command was executed.
+        """
+        command = request.get('command')
+        logger.debug("received %r", request)
+        collector = MessageCollector()
+        root_logger = logging.getLogger()
+        with self.lock:
+            root_logger.addHandler(collector)
+            try:
+                if command == 'install':
+                    result = self.install(request['args'])
+                elif command == 'ping':
+                    result = 0
+                else:
+                    logger.error("Unknown command %r", command)
+                    result = 1
+            finally:
+                root_logger.removeHandler(collector)
+        return {'result': result, 'messages': collector.messages}
+
+    def install(self, args):
+        """ Executes the install command with forwarded arguments. """
+        the_app = self.the_app
+        the_app.source_py = bool(args['source_py'])
+        the_app.link = bool(args.get('link'))
+        the_app.lazy_init = bool(args.get('lazy_init'))
+        the_app.optimize_images = bool(args.get('optimize_images'))
+        the_app.workers = None
+        if args.get('workers'):
+            from .worker import WorkerPool
+            the_app.workers = WorkerPool(args['workers'])
+        the_app.jobs = args.get('jobs')
+        the_app.profile = get_profile(args.get('profile'))
+        the_app.check = args.get('check', True)
+        the_app.destination = args['destination']
+        the_app.targets = args.get('targets')
+        the_app.qgis_version = args.get('qgis_version')
+        the_app.toolset.from_dict(args)
+        if args.get('from_repo'):
+            # The index of the repository stays in memory between requests.
+            return 0 if the_app.install_from_repo(
+                args['from_repo'], args['source'],
+                clear_opt=args['on_existing']) else 1
+
+        # Arm the watches before scanning so that changes made while the
+        # command runs invalidate the plugin for the next request.
+        for source in args['source']:
+            self.watcher.watch(source)
+        return 0 if the_app.install(
+            args['source'],
+            force_recompile=args['force_recompile'],
+            clear_opt=args['on_existing']) else 1
+
+
+def is_daemon_running(socket_path):
+    """ Tell if a daemon answers at given path. """
+    try:
+        response = send_request(socket_path, {'command': 'ping'})
+    except OSError:
+        return False
+    return response is not None and response.get('result') == 0
+
+
+def send_request(socket_path, request):
+    """
+    Sends a request to the daemon and waits for the answer.
+
+    Arguments:
+        socket_path (str):
+            The path of the unix socket.
+        request (dict):
+            The command and its arguments.
+
+    Returns:
+        The response as a dictionary.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as fin:
+            line = fin.readline()
+    if len(line) == 0:
+        return None
+    return json.loads(line.decode('utf-8'))
+
+
+def forward_to_daemon(command, args, socket_path):
+    """
+    Runs a command inside the daemon, if one is running.
+
+    Arguments:
+        command (str):
+            The name of the command.
+        args (dict):
+            The arguments of the command; must be serializable as json.
+        socket_path (str):
+            The path of the unix socket.
+
+    Returns:
+        None if no daemon could be reached, the result code otherwise.
+    """
+    if not os.path.exists(socket_path):
+        return None
+    if not is_private_dir(os.path.dirname(os.path.abspath(socket_path))):
+        # Anybody could be listening there.
+        logger.warning("ignoring the daemon at %s: its directory is not "
+                       "private", socket_path)
+        return None
+    try:
+        response = send_request(
+            socket_path, {'command': command, 'args': args})
+    except OSError:
+        logger.debug("no daemon is listening at %s", socket_path)
+        return None
+    if response is None:
+        return None
+
+    for message in response.get('messages', []):
+        print(message)
+    logger.debug("command %s was executed by the daemon", command)
+    return response.get('result', 0)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubTarExport class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import hashlib
+import io
+import logging
+import os
+import posixpath
+import stat
+import tarfile
+import time
+
+from pubqlib.utils.fileio import HASH_NAME, HashCache
+from .manifest import MANIFEST_NAME, PubManifest
+
+logger = logging.getLogger('pubq.export')
+
+# The compressions that can be applied to the stream.
+COMPRESSIONS = ('gz', 'bz2', 'xz')
+
+
+class PubTarExport(object):
+    """
+    Writes built plugins to a tar stream, the way they would be deployed.
+
+    The archive is written sequentially (tarfile's stream mode), so it
+    can go to a pipe: nothing is staged on disk. Each plugin is a
+    directory with the deployed files, the generated metadata.txt and
+    the manifest of a deploy, so extracting the stream in a plugin
+    directory gives the same result as installing there.
+
+    Attributes:
+        fileobj:
+            Where the stream is written.
+        compression (str):
+            One of COMPRESSIONS or None.
+        hashes (HashCache):
+            Hashes the files for the manifests.
+        archive (TarFile):
+            The open archive.
+        files (int):
+            The number of files written.
+        size (int):
+            The number of bytes of the files written (before
+            compression).
+    """
+
+    def __init__(self, fileobj, compression=None, hashes=None):
+        """
+        Constructor.
+
+        Arguments:
+            fileobj:
+                Where the stream is written; a binary file object.
+            compression (str):
+                One of COMPRESSIONS or None.
+            hashes (HashCache):
+                Hashes the files; by default the global cache.
+        """
+        super().__init__()
+        self.fileobj = fileobj
+        self.compression = compression
+        self.hashes = HashCache() if hashes is None else hashes
+        self.archive = None
+        self.files = 0
+        self.size = 0
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubTarExport(%s)' % (self.compression or 'uncompressed')
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubTarExport(%r, compression=%r)' % (
+            self.fileobj, self.compression)
+
+    def __enter__(self):
+        self.archive = tarfile.open(
+            fileobj=self.fileobj, mode='w|' + (self.compression or ''),
+            format=tarfile.PAX_FORMAT)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.archive.close()
+        self.archive = None
+        self.fileobj.flush()
+
+    def add_file(self, name, source):
+        """
+        Writes a file to the archive.
+
+        Arguments:
+            name (str):
+                The path of the file in the archive.
+            source (str):
+                The file that is written; symbolic links are followed.
+        """
+        with open(source, 'rb') as fin:
+            source_stat = os.fstat(fin.fileno())
+            info = tarfile.TarInfo(name)
+            info.size = source_stat.st_size
+            info.mtime = source_stat.st_mtime
+            info.mode = stat.S_IMODE(source_stat.st_mode)
+            self.archive.addfile(info, fin)
+        self.files = self.files + 1
+        self.size = self.size + info.size
+
+    def add_bytes(self, name, data):
+        """ Writes a file generated in memory to the archive. """
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0o644
+        self.archive.addfile(info, io.BytesIO(data))
+        self.files = self.files + 1
+        self.size = self.size + info.size
+
+    def add_directory(self, name):
+        """ Writes a directory entry to the archive. """
+        info = tarfile.TarInfo(name)
+        info.type = tarfile.DIRTYPE
+        info.mtime = time.time()
+        info.mode = 0o755
+        self.archive.addfile(info)
+
+    def add_plugin(self, plugin):
+        """
+        Writes a built plugin to the archive.
+
+        Arguments:
+            plugin (PubPlugin):
+                The plugin, compiled for the toolset it is exported for.
+        """
+        logger.debug("exporting plugin %s", plugin.name)
+        root = plugin.target_name
+        self.add_directory(root)
+        shipped = []
+        for file, rel_path in plugin.iter_deploy_pairs():
+            name = posixpath.join(root, rel_path.replace(os.sep, '/'))
+            self.add_file(name, file)
+            shipped.append((rel_path, file))
+
+        metadata = io.StringIO()
+        if plugin.to_metadata():
+            plugin.config_obj.write(metadata)
+        metadata = metadata.getvalue().encode('utf-8')
+        self.add_bytes(posixpath.join(root, 'metadata.txt'), metadata)
+
+        # Most files were hashed by previous builds or deploys.
+        digests = self.hashes.hash_many([file for _, file in shipped])
+        self.hashes.save()
+        manifest = PubManifest()
+        for rel_path, file in shipped:
+            manifest.add(rel_path, os.path.getsize(file), digests[file])
+        manifest.add(
+            'metadata.txt', len(metadata),
+            hashlib.new(HASH_NAME, metadata).hexdigest())
+        self.add_bytes(
+            posixpath.join(root, MANIFEST_NAME),
+            manifest.to_json().encode('utf-8'))
+        logger.debug("exported %d files of plugin %s",
+                     len(shipped) + 2, plugin.name)
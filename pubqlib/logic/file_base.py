@@ -5,6 +5,7 @@ Contains the definition of the PubFile class.
 from __future__ import unicode_literals
 from __future__ import print_function
 
+import copy
 import logging
 import os
 
@@ -20,8 +21,13 @@ class PubFile(object):
             The path of the source file.
         path_out (src):
             The path of the compiled file.
+        use_compiled (bool):
+            Deploy the compiled file instead of the source.
     """
 
+    # Plugins may hold a very large number of files.
+    __slots__ = ('path_in', 'path_out', 'use_compiled')
+
     def __init__(self, path_in=None, path_out=None, use_compiled=True):
         """
         Constructor.
@@ -58,6 +64,27 @@ class PubFile(object):
         """ Computes the default output file. """
         raise NotImplementedError
 
+    def retarget(self, source_root, build_root):
+        """
+        Creates a copy that writes its output inside another tree.
+
+        Arguments:
+            source_root (str):
+                The directory the input is relative to.
+            build_root (str):
+                The directory where the output will be placed, at the
+                same relative path.
+        """
+        result = copy.copy(self)
+        result.path_out = os.path.join(
+            build_root,
+            os.path.relpath(self.default_output(), source_root))
+        return result
+
+    def dependencies(self):
+        """ The files that decide the content of the output. """
+        return [self.path_in]
+
     def compile(self, toolset, force=False):
         """ Create path_out file from path_in. """
         raise NotImplementedError
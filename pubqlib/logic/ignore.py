@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubIgnore class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import logging
+import os
+import re
+
+logger = logging.getLogger('pubq.ignore')
+
+IGNORE_FILE = '.pubqignore'
+
+# Patterns that apply to every plugin, before any user pattern.
+DEFAULT_PATTERNS = (
+    '.git/',
+    '.hg/',
+    '.svn/',
+    '__pycache__/',
+    '/.pubq/',
+    IGNORE_FILE,
+)
+
+
+class PubIgnore(object):
+    """
+    Decides which files are left out, using gitignore-style patterns.
+
+    All patterns are compiled into a single regular expression. The
+    alternatives are placed in reverse order so that, as in git, the last
+    pattern that matches a path decides its fate; a pattern that starts
+    with `!` re-includes the paths it matches.
+
+    Paths are relative to the root of the plugin and use `/` as
+    separator. Directories that are ignored are pruned by `walk()`
+    so nothing below them is ever visited.
+
+    Attributes:
+        patterns (list):
+            The patterns in the order they were added.
+    """
+
+    def __init__(self, patterns=None, defaults=True):
+        """
+        Constructor.
+
+        Arguments:
+            patterns (list):
+                Initial list of patterns.
+            defaults (bool):
+                Start with the patterns in DEFAULT_PATTERNS.
+        """
+        super().__init__()
+        self.patterns = list(DEFAULT_PATTERNS) if defaults else []
+        if patterns is not None:
+            self.patterns.extend(patterns)
+        self._matcher = None
+        self._negated = None
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubIgnore(%d patterns)' % len(self.patterns)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubIgnore(%r, defaults=False)' % self.patterns
+
+    @classmethod
+    def from_plugin(cls, path, config_obj):
+        """
+        Creates the matcher for a plugin.
+
+        The patterns are, in order: the defaults, the content of the
+        `.pubqignore` file from the root of the plugin, the `exclude`
+        key and the `include` key of the `[extra]` section in metadata.
+
+        Arguments:
+            path (str):
+                The root directory of the plugin.
+            config_obj (ConfigParser):
+                The metadata of the plugin.
+        """
+        result = cls()
+        ignore_file = os.path.join(path, IGNORE_FILE)
+        if os.path.isfile(ignore_file):
+            with open(ignore_file, 'r', encoding='utf-8') as fin:
+                result.add_patterns(fin.read().split('\n'))
+        result.add_patterns(
+            config_obj.get('extra', 'exclude', fallback='').split('\n'))
+        result.add_patterns(
+            '!' + pattern.strip() for pattern in config_obj.get(
+                'extra', 'include', fallback='').split('\n')
+            if len(pattern.strip()) > 0)
+        logger.debug("%s for %s: %r", result, path, result.patterns)
+        return result
+
+    def add_patterns(self, patterns):
+        """ Appends patterns; empty lines and comments are skipped. """
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if len(pattern) > 0 and not pattern.startswith('#'):
+                self.patterns.append(pattern)
+        self._matcher = None
+
+    def compile(self):
+        """ Creates the regular expression for current patterns. """
+        alternatives = []
+        negated = set()
+        for index in reversed(range(len(self.patterns))):
+            pattern = self.patterns[index]
+            if pattern.startswith('!'):
+                negated.add('p%d' % index)
+                pattern = pattern[1:]
+            alternatives.append(
+                '(?P<p%d>%s)' % (index, translate(pattern)))
+        if len(alternatives) == 0:
+            alternatives.append('(?!)')
+        self._matcher = re.compile('|'.join(alternatives), re.DOTALL)
+        self._negated = negated
+
+    def match(self, rel_path, is_dir=False):
+        """
+        Tell if a path is ignored.
+
+        Arguments:
+            rel_path (str):
+                The path relative to the root of the plugin.
+            is_dir (bool):
+                True if the path is a directory.
+        """
+        if self._matcher is None:
+            self.compile()
+        if os.sep != '/':
+            rel_path = rel_path.replace(os.sep, '/')
+        if is_dir:
+            rel_path = rel_path + '/'
+        found = self._matcher.fullmatch(rel_path)
+        if found is None:
+            return False
+        return found.lastgroup not in self._negated
+
+    def walk(self, top, root):
+        """
+        Walks a directory tree skipping ignored files and directories.
+
+        Arguments:
+            top (str):
+                The directory to walk.
+            root (str):
+                The directory patterns are relative to.
+
+        Returns:
+            A generator producing the same tuples as `os.walk()`.
+        """
+        rel_top = os.path.relpath(top, root)
+        if rel_top == os.curdir:
+            rel_top = ''
+        for dir_path, dirs, files in os.walk(top):
+            rel_dir = os.path.relpath(dir_path, top)
+            if rel_dir == os.curdir:
+                rel_dir = rel_top
+            elif len(rel_top) > 0:
+                rel_dir = os.path.join(rel_top, rel_dir)
+            prefix = rel_dir + os.sep if len(rel_dir) > 0 else ''
+
+            # Pruning the list in place stops os.walk from descending.
+            dirs[:] = [
+                name for name in dirs
+                if not self.match(prefix + name, is_dir=True)]
+            files = [
+                name for name in files
+                if not self.match(prefix + name)]
+            yield dir_path, dirs, files
+
+
+def translate(pattern):
+    """
+    Converts a gitignore-style pattern into a regular expression.
+
+    The expression matches the path itself and everything below it;
+    directories are tested with a trailing `/`, so a pattern that ends in
+    `/` only matches directories and their content.
+    """
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    result = []
+    index = 0
+    length = len(pattern)
+    while index < length:
+        char = pattern[index]
+        if char == '*':
+            if pattern[index:index + 3] == '**/':
+                result.append('(?:.*/)?')
+                index += 3
+                continue
+            if pattern[index:index + 2] == '**':
+                result.append('.*')
+                index += 2
+                continue
+            result.append('[^/]*')
+        elif char == '?':
+            result.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', index + 1)
+            if end == -1:
+                result.append(re.escape(char))
+            else:
+                body = pattern[index + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                result.append('[%s]' % body.replace('\\', '\\\\'))
+                index = end
+        else:
+            result.append(re.escape(char))
+        index += 1
+
+    body = ''.join(result)
+    if not anchored:
+        body = '(?:.*/)?' + body
+    if dir_only:
+        return body + '/.*'
+    return body + '(?:/.*)?'
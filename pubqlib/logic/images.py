@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the ImageOptimizer class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import logging
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from pubqlib.utils import get_cache_dir
+from pubqlib.utils.fileio import HashCache, atomic_output
+from .status import format_size
+
+logger = logging.getLogger('pubq.images')
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Ancillary chunks that change how the image is rendered; the others
+# (text, time, physical size, ...) are dropped.
+KEPT_CHUNKS = frozenset([
+    b'tRNS', b'gAMA', b'cHRM', b'sRGB', b'iCCP', b'sBIT'])
+
+# Animated images; their frames live outside IDAT.
+ANIMATION_CHUNKS = frozenset([b'acTL', b'fcTL', b'fdAT'])
+
+# The zlib strategies tried on the image data; the smallest output wins.
+STRATEGIES = (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED)
+
+
+def read_chunks(data):
+    """
+    Splits a PNG file into its chunks.
+
+    Raises:
+        ValueError: the data is not a well-formed PNG file or a chunk
+            fails its CRC check.
+
+    Returns:
+        A list of (type, payload) tuples.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("not a PNG file")
+    result = []
+    offset = len(PNG_SIGNATURE)
+    while offset < len(data):
+        if offset + 12 > len(data):
+            raise ValueError("truncated chunk at %d" % offset)
+        length, kind = struct.unpack_from('>I4s', data, offset)
+        end = offset + 8 + length
+        if end + 4 > len(data):
+            raise ValueError("truncated %r chunk" % kind)
+        payload = data[offset + 8:end]
+        crc, = struct.unpack_from('>I', data, end)
+        if zlib.crc32(payload, zlib.crc32(kind)) != crc:
+            raise ValueError("bad CRC in %r chunk" % kind)
+        result.append((kind, payload))
+        offset = end + 4
+        if kind == b'IEND':
+            break
+    if len(result) == 0 or result[0][0] != b'IHDR' or \
+            result[-1][0] != b'IEND':
+        raise ValueError("missing IHDR or IEND chunk")
+    return result
+
+
+def write_chunk(kind, payload):
+    """ Serializes a chunk. """
+    return struct.pack('>I', len(payload)) + kind + payload + struct.pack(
+        '>I', zlib.crc32(payload, zlib.crc32(kind)))
+
+
+def deflate(raw):
+    """ Compresses the image data as small as zlib can. """
+    result = None
+    for strategy in STRATEGIES:
+        compressor = zlib.compressobj(
+            9, zlib.DEFLATED, zlib.MAX_WBITS, 9, strategy)
+        candidate = compressor.compress(raw) + compressor.flush()
+        if result is None or len(candidate) < len(result):
+            result = candidate
+    return result
+
+
+def optimize_png(data):
+    """
+    Recompresses a PNG file without changing its pixels.
+
+    The image data is inflated and deflated again at the highest level,
+    in a single IDAT chunk, and the ancillary chunks that do not change
+    the rendering are dropped. The filters of the scanlines are kept.
+
+    Arguments:
+        data (bytes):
+            The content of the file.
+
+    Raises:
+        ValueError: the data is not a valid PNG file.
+
+    Returns:
+        The optimized content or None if it is not smaller (or the image
+        is animated).
+    """
+    chunks = read_chunks(data)
+    if any(kind in ANIMATION_CHUNKS for kind, _ in chunks):
+        return None
+    try:
+        raw = zlib.decompress(b''.join(
+            payload for kind, payload in chunks if kind == b'IDAT'))
+    except zlib.error as exc:
+        raise ValueError("bad image data: %s" % exc)
+
+    parts = [PNG_SIGNATURE]
+    for kind, payload in chunks:
+        if kind == b'IDAT':
+            if raw is not None:
+                parts.append(write_chunk(kind, deflate(raw)))
+                raw = None
+        elif not kind[0] & 0x20 or kind in KEPT_CHUNKS:
+            # Critical chunks (upper case first letter) are always kept.
+            parts.append(write_chunk(kind, payload))
+    result = b''.join(parts)
+    return result if len(result) < len(data) else None
+
+
+def is_png(path):
+    """ Tell if a file is handled by the optimizer. """
+    return path.lower().endswith('.png')
+
+
+def optimize_entry(source, entry):
+    """
+    Optimizes one image into the cache; runs in a worker process.
+
+    Returns:
+        The size of the source and of the result; both are the same
+        if the image could not be made smaller.
+    """
+    with open(source, 'rb') as fin:
+        data = fin.read()
+    try:
+        result = optimize_png(data)
+    except ValueError as exc:
+        # Qt may still read it; it is deployed as it is.
+        logger.warning("%s is left as it is: %s", source, exc)
+        result = None
+    if result is None:
+        # Remember that there is nothing to gain.
+        entry = entry + '.orig'
+        result = b''
+    with atomic_output(entry) as temp_path:
+        with open(temp_path, 'wb') as fout:
+            fout.write(result)
+    return len(data), len(data) if len(result) == 0 else len(result)
+
+
+class ImageOptimizer(object):
+    """
+    Makes PNG images smaller before they are compiled into resources
+    or deployed.
+
+    The optimized images are kept in a cache shared by all pubq
+    processes on this machine, named after the hash of the original,
+    so an image is only optimized once. Images that are not in the
+    cache are optimized in worker processes.
+
+    Attributes:
+        path (str):
+            The directory holding the optimized images.
+        hashes (HashCache):
+            Hashes the original images.
+        jobs (int):
+            Maximum number of worker processes.
+        saved (int):
+            The bytes saved on the images seen by this instance.
+    """
+
+    def __init__(self, path=None, hashes=None, jobs=None):
+        """
+        Constructor.
+
+        Arguments:
+            path (str):
+                The directory holding the optimized images; by default a
+                directory in the cache of the program.
+            hashes (HashCache):
+                Hashes the original images; by default the global cache.
+            jobs (int):
+                Maximum number of worker processes.
+        """
+        super().__init__()
+        self.path = get_cache_dir('images') if path is None else path
+        self.hashes = HashCache() if hashes is None else hashes
+        self.jobs = jobs
+        self.saved = 0
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'ImageOptimizer(%s)' % self.path
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'ImageOptimizer(%r, jobs=%r)' % (self.path, self.jobs)
+
+    def lookup(self, digest):
+        """
+        Finds the result for an image in the cache.
+
+        Returns:
+            The optimized image, an empty string if the original is to
+            be used or None if the image was never optimized.
+        """
+        entry = os.path.join(self.path, digest + '.png')
+        if os.path.isfile(entry):
+            return entry
+        if os.path.isfile(entry + '.orig'):
+            return ''
+        return None
+
+    def optimize(self, files, dry_run=False):
+        """
+        Optimizes a list of images.
+
+        Arguments:
+            files (list):
+                The images; the files that are not PNG images are
+                ignored.
+            dry_run (bool):
+                Only look the images up in the cache; nothing is
+                optimized or written.
+
+        Returns:
+            A dictionary mapping the images that could be made smaller
+            to their optimized copy.
+        """
+        files = sorted(set(file for file in files if is_png(file)))
+        if len(files) == 0:
+            return {}
+        digests = self.hashes.hash_many(files)
+        if dry_run:
+            return {
+                file: self.lookup(digests[file]) for file in files
+                if self.lookup(digests[file])}
+        self.hashes.save()
+
+        pending = {}
+        for file in files:
+            if self.lookup(digests[file]) is None:
+                pending.setdefault(digests[file], file)
+        if len(pending) > 0:
+            logger.debug("optimizing %d images", len(pending))
+            entries = [
+                os.path.join(self.path, digest + '.png')
+                for digest in pending]
+            if len(pending) == 1:
+                sizes = [optimize_entry(list(pending.values())[0], entries[0])]
+            else:
+                with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                    sizes = list(executor.map(
+                        optimize_entry, pending.values(), entries))
+            saved = sum(before - after for before, after in sizes)
+            self.saved += saved
+            logger.info("optimized %d images, saving %s",
+                        len(pending), format_size(saved))
+
+        result = {}
+        for file in files:
+            entry = self.lookup(digests[file])
+            if entry:
+                result[file] = entry
+        return result
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubImportProfile class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+from .import_stub import DEFAULT_STUBS, END_MARKER, START_MARKER
+from .status import format_size
+
+logger = logging.getLogger('pubq.import_profile')
+
+# The script that loads the plugin in the child interpreter.
+STUB_SCRIPT = os.path.join(os.path.dirname(__file__), 'import_stub.py')
+
+# A line written by -X importtime: self and cumulative time in
+# microseconds, then the module indented by its nesting level.
+IMPORTTIME_RE = re.compile(
+    r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\| (\s*)(\S+)\s*$')
+
+
+def parse_importtime(text):
+    """
+    Extracts the imports made while the plugin was loaded.
+
+    Arguments:
+        text (str):
+            What the child interpreter wrote to stderr.
+
+    Returns:
+        A list of (module, self microseconds, cumulative microseconds,
+        nesting level) tuples, in the order written by python (a module
+        comes after the modules it imported).
+    """
+    result = []
+    inside = False
+    for line in text.splitlines():
+        if line == START_MARKER:
+            inside = True
+        elif line == END_MARKER:
+            break
+        elif inside:
+            match = IMPORTTIME_RE.match(line)
+            if match is not None:
+                result.append((
+                    match.group(4), int(match.group(1)),
+                    int(match.group(2)), len(match.group(3)) // 2))
+    return result
+
+
+class PubImportProfile(object):
+    """
+    Measures how expensive it is for QGis to load a deployed plugin.
+
+    The plugin is loaded in a fresh interpreter, with generated
+    stand-ins for the modules of QGis and Qt (see import_stub.py), so no
+    QGis installation is needed. The timing runs use -X importtime and
+    the best run is kept; a separate run under tracemalloc measures the
+    memory, as tracing slows imports down.
+
+    Attributes:
+        path (str):
+            The directory of the deployed plugin.
+        python (str):
+            The interpreter that loads the plugin.
+        stubs (list):
+            The top level modules replaced by stand-ins.
+        init_gui (bool):
+            Also call initGui() on the plugin.
+        imports (list):
+            (module, self us, cumulative us, level) for each import made
+            while loading the plugin, except the stand-ins.
+        import_ms (float):
+            The time it took to import the plugin package.
+        factory_ms (float):
+            The time it took to call classFactory().
+        init_gui_ms (float):
+            The time it took to call initGui() or None.
+        modules (int):
+            The number of modules that were loaded.
+        peak_bytes (int):
+            The peak of the memory allocated while loading the plugin.
+        allocations (list):
+            (file, bytes) for the files that allocated the most memory.
+        error (str):
+            The traceback of the failure to load the plugin or None.
+    """
+
+    def __init__(self, path, python=None, stubs=None, init_gui=False):
+        """
+        Constructor.
+
+        Arguments:
+            path (str):
+                The directory of the deployed plugin.
+            python (str):
+                The interpreter that loads the plugin; this one by default.
+            stubs (list):
+                More top level modules to replace by stand-ins.
+            init_gui (bool):
+                Also call initGui() on the plugin.
+        """
+        super().__init__()
+        self.path = path
+        self.python = sys.executable if python is None else python
+        self.stubs = list(DEFAULT_STUBS) + (
+            [] if stubs is None else list(stubs))
+        self.init_gui = init_gui
+        self.imports = []
+        self.import_ms = None
+        self.factory_ms = None
+        self.init_gui_ms = None
+        self.modules = None
+        self.peak_bytes = None
+        self.allocations = []
+        self.error = None
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubImportProfile("%s")' % self.path
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubImportProfile(%r, python=%r, init_gui=%r)' % (
+            self.path, self.python, self.init_gui)
+
+    @property
+    def total_ms(self):
+        """ The time spent in the plugin, from import to initGui(). """
+        return sum(value for value in (
+            self.import_ms, self.factory_ms, self.init_gui_ms)
+            if value is not None)
+
+    def load(self, memory=False):
+        """
+        Loads the plugin once in a child interpreter.
+
+        Returns:
+            The result written by the child and the imports it made.
+        """
+        handle, result_path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        command = [self.python]
+        if not memory:
+            command.extend(['-X', 'importtime'])
+        command.extend([STUB_SCRIPT, self.path, result_path])
+        if memory:
+            command.append('--memory')
+        if self.init_gui:
+            command.append('--init-gui')
+        for name in self.stubs[len(DEFAULT_STUBS):]:
+            command.extend(['--stub', name])
+        logger.debug("running %r", command)
+        try:
+            process = subprocess.run(
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                cwd=os.path.dirname(os.path.abspath(self.path)))
+            stderr = process.stderr.decode('utf-8', 'replace')
+            try:
+                with open(result_path, 'r') as fin:
+                    result = json.load(fin)
+            except ValueError:
+                raise OSError("the plugin could not be loaded:\n%s" % stderr)
+        finally:
+            os.remove(result_path)
+        imports = [
+            item for item in parse_importtime(stderr)
+            if item[0].split('.')[0] not in self.stubs]
+        return result, imports
+
+    def run(self, runs=3):
+        """
+        Measures the plugin.
+
+        Arguments:
+            runs (int):
+                How many times the plugin is loaded for the timing; the
+                fastest run is kept.
+        """
+        best = None
+        for _ in range(max(1, runs)):
+            result, imports = self.load()
+            if result['error']:
+                self.error = result['error']
+                return self
+            if best is None or result['import_ms'] + result['factory_ms'] < \
+                    best[0]['import_ms'] + best[0]['factory_ms']:
+                best = (result, imports)
+        result, self.imports = best
+        self.import_ms = result['import_ms']
+        self.factory_ms = result['factory_ms']
+        self.init_gui_ms = result['init_gui_ms']
+        self.modules = result['modules']
+
+        result, _ = self.load(memory=True)
+        if result['error']:
+            self.error = result['error']
+            return self
+        self.peak_bytes = result['peak_bytes']
+        self.allocations = [tuple(item) for item in result['allocations']]
+        return self
+
+    def by_package(self):
+        """ The self time of the imports summed by top level package. """
+        totals = {}
+        for name, self_us, cumulative_us, level in self.imports:
+            top = name.split('.')[0]
+            totals[top] = totals.get(top, 0) + self_us
+        return sorted(totals.items(), key=lambda item: -item[1])
+
+    def to_dict(self):
+        """ The measurements in a form that can be serialized. """
+        return {
+            'path': self.path,
+            'import_ms': self.import_ms,
+            'factory_ms': self.factory_ms,
+            'init_gui_ms': self.init_gui_ms,
+            'modules': self.modules,
+            'peak_bytes': self.peak_bytes,
+            'imports': [
+                {'module': name, 'self_us': self_us,
+                 'cumulative_us': cumulative_us, 'level': level}
+                for name, self_us, cumulative_us, level in self.imports],
+            'allocations': [
+                {'file': path, 'bytes': size}
+                for path, size in self.allocations],
+            'error': self.error,
+        }
+
+    def report(self, top=15):
+        """ The ranked report, as a list of lines. """
+        if self.error is not None:
+            return ['%s: failed to load' % self.path] + [
+                '  ' + line for line in self.error.splitlines()]
+
+        timings = 'import %.1f ms, classFactory %.1f ms' % (
+            self.import_ms, self.factory_ms)
+        if self.init_gui_ms is not None:
+            timings = timings + ', initGui %.1f ms' % self.init_gui_ms
+        result = ['%s: %s, %d modules, peak memory %s' % (
+            self.path, timings, self.modules, format_size(self.peak_bytes))]
+
+        result.append('  %10s %10s  %s' % ('self ms', 'cumul ms', 'module'))
+        ranked = sorted(self.imports, key=lambda item: -item[1])
+        for name, self_us, cumulative_us, level in ranked[:top]:
+            result.append('  %10.2f %10.2f  %s' % (
+                self_us / 1000.0, cumulative_us / 1000.0, name))
+
+        result.append('  %10s  %s' % ('self ms', 'package'))
+        for name, self_us in self.by_package()[:top]:
+            result.append('  %10.2f  %s' % (self_us / 1000.0, name))
+
+        result.append('  %10s  %s' % ('memory', 'allocated by'))
+        for path, size in self.allocations[:top]:
+            result.append('  %10s  %s' % (format_size(size), path))
+        return result
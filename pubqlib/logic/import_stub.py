@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Loads a deployed plugin the way QGis does, with stand-ins for the
+modules of QGis and Qt.
+
+This file is run as a script in a fresh interpreter by `pubq
+import-profile` and only uses the standard library, so it never imports
+pubq itself:
+
+    python -X importtime import_stub.py PLUGIN_DIR RESULT_FILE
+        [--memory] [--init-gui] [--stub NAME ...]
+
+The modules named by --stub (and all their sub-modules) are generated on
+demand: any name imported from them is a class that can be called,
+subclassed, combined with operators and used as a decorator. The
+plugin directory is imported as a package, then its classFactory() is
+called with a stand-in for iface. The measurements are written to
+RESULT_FILE as json; -X importtime writes the time of each import to
+stderr between the START and END markers.
+"""
+import argparse
+import importlib.abc
+import importlib.util
+import json
+import os
+import sys
+import time
+import traceback
+import types
+
+START_MARKER = 'pubq-import-profile: start'
+END_MARKER = 'pubq-import-profile: end'
+
+# Modules that QGis has already loaded when plugins are imported.
+DEFAULT_STUBS = ('qgis', 'PyQt4', 'PyQt5', 'PyQt6', 'sip')
+
+# The number of allocation sites written to the result.
+TOP_ALLOCATIONS = 25
+
+
+def stub_class(name):
+    """ Creates a new stand-in class. """
+    special = SPECIAL.get(name)
+    if special is not None:
+        return special
+    return StubMeta(name, (Stub, ), {})
+
+
+def load_ui_type(*args, **kwargs):
+    """ Stands for uic.loadUiType(), which returns two classes. """
+    return stub_class('FormClass'), stub_class('BaseClass')
+
+
+def identity_or_stub(*args, **kwargs):
+    """ Stands for decorators like pyqtSlot that may be used bare. """
+    if len(args) == 1 and len(kwargs) == 0 and \
+            isinstance(args[0], types.FunctionType):
+        return args[0]
+    return Stub()
+
+
+# Names whose stand-ins need a specific behaviour.
+SPECIAL = {
+    'loadUiType': load_ui_type,
+    'pyqtSlot': identity_or_stub,
+}
+
+
+def stub_self(self, *args, **kwargs):
+    """ Operators that return the stand-in itself. """
+    return self
+
+
+def stub_false(self, *args, **kwargs):
+    """ Comparisons and tests that are always false. """
+    return False
+
+
+class StubMeta(type):
+    """ The metaclass of the stand-in classes (for class attributes). """
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return stub_class(name)
+
+    def __iter__(cls):
+        return iter(())
+
+    def __int__(cls):
+        return 0
+
+    __index__ = __int__
+    __or__ = __ror__ = __and__ = __rand__ = __xor__ = __invert__ = stub_self
+    __add__ = __radd__ = __sub__ = __mul__ = stub_self
+    __lt__ = __le__ = __gt__ = __ge__ = stub_false
+
+
+class Stub(object, metaclass=StubMeta):
+    """ The base of the stand-in classes; also used for their results. """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Stub()
+
+    def __call__(self, *args, **kwargs):
+        # Decorators with arguments, like pyqtSlot(str), return the
+        # function they wrap.
+        if len(args) == 1 and len(kwargs) == 0 and \
+                isinstance(args[0], types.FunctionType):
+            return args[0]
+        return Stub()
+
+    def __mro_entries__(self, bases):
+        return (stub_class('StubBase'), )
+
+    def __getitem__(self, key):
+        return Stub()
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __int__(self):
+        return 0
+
+    def __float__(self):
+        return 0.0
+
+    def __str__(self):
+        return ''
+
+    __index__ = __int__
+    __or__ = __ror__ = __and__ = __rand__ = __xor__ = __invert__ = stub_self
+    __add__ = __radd__ = __sub__ = __mul__ = stub_self
+    __lt__ = __le__ = __gt__ = __ge__ = __bool__ = stub_false
+
+
+class StubModule(types.ModuleType):
+    """ A stand-in module that creates the names imported from it. """
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = stub_class(name)
+        setattr(self, name, value)
+        return value
+
+
+class StubFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """ Serves the stand-in modules. """
+
+    def __init__(self, names):
+        self.names = set(names)
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname.split('.')[0] not in self.names:
+            return None
+        return importlib.util.spec_from_loader(
+            fullname, self, is_package=True)
+
+    def create_module(self, spec):
+        return StubModule(spec.name)
+
+    def exec_module(self, module):
+        module.__path__ = []
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("plugin")
+    parser.add_argument("result")
+    parser.add_argument("--memory", default=False, action="store_true")
+    parser.add_argument("--init-gui", default=False, action="store_true")
+    parser.add_argument("--stub", action="append", default=[])
+    args = parser.parse_args()
+
+    plugin_dir = os.path.abspath(args.plugin)
+    sys.path.insert(0, os.path.dirname(plugin_dir))
+    sys.meta_path.insert(0, StubFinder(list(DEFAULT_STUBS) + args.stub))
+
+    result = {
+        'import_ms': None,
+        'factory_ms': None,
+        'init_gui_ms': None,
+        'modules': None,
+        'peak_bytes': None,
+        'allocations': [],
+        'error': None,
+    }
+    if args.memory:
+        import tracemalloc
+        tracemalloc.start()
+
+    modules_before = len(sys.modules)
+    sys.stderr.write(START_MARKER + '\n')
+    sys.stderr.flush()
+    try:
+        start = time.perf_counter()
+        # Like QGis; importlib.import_module() would not be timed by
+        # -X importtime.
+        package = __import__(os.path.basename(plugin_dir))
+        result['import_ms'] = (time.perf_counter() - start) * 1000.0
+
+        start = time.perf_counter()
+        plugin = package.classFactory(Stub())
+        result['factory_ms'] = (time.perf_counter() - start) * 1000.0
+
+        if args.init_gui:
+            start = time.perf_counter()
+            plugin.initGui()
+            result['init_gui_ms'] = (time.perf_counter() - start) * 1000.0
+    except BaseException:
+        result['error'] = traceback.format_exc()
+    sys.stderr.write(END_MARKER + '\n')
+    sys.stderr.flush()
+    result['modules'] = len(sys.modules) - modules_before
+
+    if args.memory:
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        result['allocations'] = [
+            [stat.traceback[0].filename, stat.size]
+            for stat in snapshot.statistics('filename')[:TOP_ALLOCATIONS]]
+
+    with open(args.result, 'w') as fout:
+        json.dump(result, fout)
+    return 1 if result['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the BuildJournal class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from pubqlib.utils.fileio import HashCache, atomic_output, hash_file
+from pubqlib.utils.locking import FileLock
+
+logger = logging.getLogger('pubq.journal')
+
+# Records are flushed right away, which is enough to survive the process
+# being killed; they are synced to the disk in batches.
+SYNC_EVERY = 64
+
+
+def stat_signature(stat):
+    """ A cheap fingerprint of a file based on its metadata. """
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+class BuildJournal(object):
+    """
+    Records the units of work that were completed by a build.
+
+    Each completed unit (a compiled form or module, a copied file) is
+    appended to the journal, and the journal is flushed right away, so
+    it survives an interrupted build. When the next build
+    replays the journal it skips every unit whose inputs did not
+    change and whose outputs are still the ones we produced.
+
+    Each record holds the unit key, a hash of the inputs and, for each
+    output, its stat signature and (optionally) its content hash. An
+    output is considered intact when its stat signature matches; when it
+    doesn't, the content hash decides.
+
+    Several processes may append to the same journal; writes and
+    compaction are serialized with a lock file next to the journal.
+
+    Attributes:
+        path (str):
+            The file holding the journal.
+        hashes (HashCache):
+            Used to hash the inputs.
+        entries (dict):
+            The last record for each unit key.
+    """
+
+    def __init__(self, path, hashes=None):
+        """
+        Constructor.
+
+        Arguments:
+            path (str):
+                The file holding the journal.
+            hashes (HashCache):
+                Used to hash the inputs; a new one is created by default.
+        """
+        super().__init__()
+        self.path = path
+        self.hashes = HashCache() if hashes is None else hashes
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.file_lock = FileLock(path + '.lock')
+        self.stream = None
+        self.unsynced = 0
+        self.load()
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'BuildJournal(%d entries)' % len(self.entries)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'BuildJournal(%r)' % self.path
+
+    def load(self):
+        """ Replays the journal from disk. """
+        self.entries = {}
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as fin:
+            for line in fin:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete if we were killed
+                    # while writing it.
+                    logger.debug("ignoring damaged journal line")
+                    continue
+                if entry.get('drop'):
+                    self.entries.pop(entry['unit'], None)
+                else:
+                    self.entries[entry['unit']] = entry
+        logger.debug("replayed %d units from %s",
+                     len(self.entries), self.path)
+
+    def append(self, entry):
+        """ Writes a record and flushes it. """
+        with self.lock, self.file_lock:
+            if self.stream is not None and not self.is_current():
+                # Another process compacted the journal.
+                self.stream.close()
+                self.stream = None
+            if self.stream is None:
+                directory = os.path.dirname(self.path)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                self.stream = open(self.path, 'a', encoding='utf-8')
+            self.stream.write(json.dumps(entry) + '\n')
+            self.stream.flush()
+            self.unsynced = self.unsynced + 1
+            if self.unsynced >= SYNC_EVERY:
+                os.fsync(self.stream.fileno())
+                self.unsynced = 0
+            if entry.get('drop'):
+                self.entries.pop(entry['unit'], None)
+            else:
+                self.entries[entry['unit']] = entry
+
+    def is_current(self):
+        """ Tell if our stream still writes to the file at path. """
+        try:
+            return os.stat(self.path).st_ino == \
+                os.fstat(self.stream.fileno()).st_ino
+        except OSError:
+            return False
+
+    def close(self):
+        """ Closes the journal file. """
+        with self.lock:
+            if self.stream is not None:
+                os.fsync(self.stream.fileno())
+                self.stream.close()
+                self.stream = None
+                self.unsynced = 0
+
+    def compact(self):
+        """ Rewrites the journal keeping only the last record of each unit. """
+        self.close()
+        with self.file_lock:
+            # Pick up the records of other processes.
+            self.load()
+            with atomic_output(self.path) as temp_path:
+                with open(temp_path, 'w', encoding='utf-8') as fout:
+                    for entry in self.entries.values():
+                        fout.write(json.dumps(entry) + '\n')
+                    fout.flush()
+                    os.fsync(fout.fileno())
+        self.hashes.save()
+
+    def input_hash(self, paths, *extra, root=None):
+        """
+        Computes a single hash for the content of several files.
+
+        Arguments:
+            paths (list):
+                The input files; missing files are hashed as missing.
+            extra:
+                Other values that influence the output (e.g. the profile).
+            root (str):
+                When given, paths are hashed relative to this directory,
+                so copies of a tree in different places hash the same.
+        """
+        digest = hashlib.sha256()
+        for value in extra:
+            digest.update(str(value).encode('utf-8') + b'\0')
+        for path in paths:
+            try:
+                file_digest = self.hashes.hash(path)
+            except OSError:
+                file_digest = 'missing'
+            name = path if root is None else os.path.relpath(path, root)
+            digest.update(
+                name.encode('utf-8') + b'\0' +
+                file_digest.encode('ascii') + b'\0')
+        return digest.hexdigest()
+
+    def is_done(self, unit, in_hash):
+        """
+        Tell if a unit was completed with the same inputs.
+
+        Arguments:
+            unit (str):
+                The key of the unit.
+            in_hash (str):
+                The hash of the current inputs.
+        """
+        entry = self.entries.get(unit)
+        if entry is None or entry['in'] != in_hash:
+            return False
+        for path, signature, digest in entry['out']:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False
+            if stat_signature(stat) == signature:
+                continue
+            if digest is None or hash_file(path, stat.st_size) != digest:
+                logger.debug("output %s of %s was changed", path, unit)
+                return False
+        return True
+
+    def record(self, unit, in_hash, outputs, digests=None, duration=None):
+        """
+        Records a completed unit.
+
+        Arguments:
+            unit (str):
+                The key of the unit.
+            in_hash (str):
+                The hash of the inputs.
+            outputs (list):
+                The files produced by the unit.
+            digests (dict):
+                Known content hashes of the outputs; the outputs that are
+                not listed here are hashed.
+            duration (float):
+                How long the unit took, in seconds.
+        """
+        out = []
+        for path in outputs:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if digests is not None and path in digests:
+                digest = digests[path]
+            else:
+                digest = hash_file(path, stat.st_size)
+            out.append([path, stat_signature(stat), digest])
+        entry = {'unit': unit, 'in': in_hash, 'out': out}
+        if duration is not None:
+            entry['time'] = round(duration, 4)
+        self.append(entry)
+
+    def mark(self, unit):
+        """ Records an event without outputs (e.g. the start of a deploy). """
+        self.append({'unit': unit, 'in': '', 'out': []})
+
+    def has(self, unit):
+        """ Tell if a unit or an event was recorded. """
+        return unit in self.entries
+
+    def drop(self, unit):
+        """ Forgets a unit. """
+        if unit in self.entries:
+            self.append({'unit': unit, 'drop': True})
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the deploy transform that makes QGis load plugins lazily.
+
+A plugin deployed with --lazy-init gets a generated __init__.py whose
+classFactory() returns a LazyPlugin (see lazy_plugin.py). The original
+__init__.py is deployed as _pubq_init.py and is imported, together with
+everything it imports, only after QGis has started.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import logging
+import os
+
+from pubqlib.utils.fileio import write_atomic
+
+logger = logging.getLogger('pubq.lazy')
+
+# The name of the original __init__.py in the deployed plugin.
+REAL_INIT_NAME = '_pubq_init.py'
+
+# The name of the proxy module in the deployed plugin.
+PROXY_NAME = '_pubq_lazy.py'
+
+# The file that is deployed as the proxy module.
+PROXY_SOURCE = os.path.join(os.path.dirname(__file__), 'lazy_plugin.py')
+
+INIT_TEMPLATE = '''# -*- coding: utf-8 -*-
+"""
+Generated by pubq; the plugin is loaded after QGis has started.
+
+The original __init__.py of the plugin is %(real_init)s.
+"""
+import importlib
+
+
+def classFactory(iface):
+    from .%(proxy)s import LazyPlugin
+    return LazyPlugin(iface, __name__ + '.%(real)s')
+
+
+def __getattr__(name):
+    # Other names defined by the original __init__.py.
+    if name.startswith('__'):
+        raise AttributeError(name)
+    return getattr(importlib.import_module(__name__ + '.%(real)s'), name)
+'''
+
+
+def init_source():
+    """ The content of the generated __init__.py. """
+    return INIT_TEMPLATE % {
+        'real_init': REAL_INIT_NAME,
+        'real': REAL_INIT_NAME[:-3],
+        'proxy': PROXY_NAME[:-3],
+    }
+
+
+def write_init(path):
+    """
+    Writes the generated __init__.py.
+
+    The file is only written if its content changed, so deploys do not
+    copy it again.
+    """
+    text = init_source()
+    try:
+        with open(path, 'r') as fin:
+            if fin.read() == text:
+                return path
+    except OSError:
+        pass
+    out_dir = os.path.dirname(path)
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    logger.debug("writing the lazy __init__.py at %s", path)
+    write_atomic(path, text)
+    return path
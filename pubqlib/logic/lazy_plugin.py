@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Deployed by pubq next to a plugin installed with --lazy-init.
+
+QGis gets a LazyPlugin from classFactory() at startup. The real plugin
+(the original __init__.py, deployed as _pubq_init.py) is only imported
+and initialized once QGis has finished starting, so its modules, forms
+and resources do not slow the startup down.
+
+This module is copied into the plugin; it must only depend on QGis.
+"""
+import importlib
+
+
+class LazyPlugin(object):
+    """
+    Stands for a plugin until QGis is running.
+
+    Attributes:
+        iface (QgisInterface):
+            What QGis passed to classFactory().
+        module_name (str):
+            The module with the classFactory() of the real plugin.
+        plugin:
+            The real plugin, once created.
+        gui (bool):
+            True once initGui() was called on the real plugin.
+        unloaded (bool):
+            True if the plugin was unloaded before it was initialized.
+    """
+
+    def __init__(self, iface, module_name):
+        """
+        Constructor.
+
+        Arguments:
+            iface (QgisInterface):
+                What QGis passed to classFactory().
+            module_name (str):
+                The module with the classFactory() of the real plugin.
+        """
+        super().__init__()
+        self.iface = iface
+        self.module_name = module_name
+        self.plugin = None
+        self.gui = False
+        self.unloaded = False
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'LazyPlugin(%s)' % self.module_name
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'LazyPlugin(%r, %r)' % (self.iface, self.module_name)
+
+    def load(self):
+        """ Imports and creates the real plugin. """
+        if self.plugin is None:
+            module = importlib.import_module(self.module_name)
+            self.plugin = module.classFactory(self.iface)
+        return self.plugin
+
+    def initGui(self):
+        """ Called by QGis; the real plugin is initialized later. """
+        from qgis.PyQt.QtCore import QTimer
+        self.unloaded = False
+        QTimer.singleShot(0, self.deferred_init)
+
+    def deferred_init(self):
+        """ Initializes the real plugin once the event loop runs. """
+        if self.unloaded or self.gui:
+            return
+        self.load().initGui()
+        self.gui = True
+
+    def unload(self):
+        """ Called by QGis when the plugin is disabled or reloaded. """
+        self.unloaded = True
+        if self.gui:
+            self.gui = False
+            self.plugin.unload()
+
+    def __getattr__(self, name):
+        # Everything else that QGis or other plugins look for (e.g.
+        # initProcessing) comes from the real plugin.
+        if name.startswith('__') or name == 'plugin':
+            raise AttributeError(name)
+        return getattr(self.load(), name)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubManifest class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import json
+import logging
+
+from pubqlib.utils.fileio import HASH_NAME, write_atomic
+
+logger = logging.getLogger('pubq.manifest')
+
+# The name of the manifest inside a deployed plugin or a plugin archive.
+MANIFEST_NAME = 'pubq-manifest.json'
+
+MANIFEST_VERSION = 1
+
+
+class PubManifest(object):
+    """
+    The list of files of a plugin with their size and content hash.
+
+    Paths are relative to the directory of the plugin and always use
+    forward slashes.
+
+    Attributes:
+        files (dict):
+            Maps relative paths to (size, hex digest) tuples.
+    """
+
+    def __init__(self, files=None):
+        """
+        Constructor.
+
+        Arguments:
+            files (dict):
+                Maps relative paths to (size, hex digest) tuples.
+        """
+        super().__init__()
+        self.files = {} if files is None else files
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubManifest(%d files)' % len(self.files)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubManifest(%r)' % self.files
+
+    def add(self, rel_path, size, digest):
+        """ Records a file. """
+        self.files[rel_path.replace('\\', '/')] = (size, digest)
+
+    def get(self, rel_path):
+        """ The (size, digest) of a file or None if not listed. """
+        return self.files.get(rel_path.replace('\\', '/'))
+
+    def to_json(self):
+        """
+        Serializes the manifest.
+
+        The text is not indented, which keeps the encoding in the C
+        accelerated path of the json module for large plugins.
+        """
+        return json.dumps({
+            'version': MANIFEST_VERSION,
+            'hash': HASH_NAME,
+            'files': {
+                path: {'size': size, HASH_NAME: digest}
+                for path, (size, digest) in sorted(self.files.items())},
+        }, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        """
+        Creates a manifest from its serialized form.
+
+        Raises:
+            ValueError if the text is not a manifest that we can use.
+        """
+        data = json.loads(text)
+        if not isinstance(data, dict) or \
+                data.get('version') != MANIFEST_VERSION:
+            raise ValueError("unsupported manifest version")
+        if data.get('hash') != HASH_NAME:
+            raise ValueError("unsupported hash %r" % data.get('hash'))
+        return cls({
+            path: (entry['size'], entry[HASH_NAME])
+            for path, entry in data.get('files', {}).items()})
+
+    @classmethod
+    def load(cls, path):
+        """ Reads a manifest file. """
+        with open(path, 'r', encoding='utf-8') as fin:
+            return cls.from_json(fin.read())
+
+    def save(self, path):
+        """ Writes a manifest file. """
+        write_atomic(path, self.to_json())
@@ -8,13 +8,113 @@ from __future__ import print_function
 import compileall
 import logging
 import os
-import pkgutil
+import re
 
+from .ignore import PubIgnore
 from .py_files import PubPy
 
 
 logger = logging.getLogger('pubq.module')
 
+# The kinds of entries that scan_directory() finds.
+PACKAGE = 'package'
+EXTENSION = 'extension'
+SOURCE = 'source'
+BYTECODE = 'bytecode'
+NAMESPACE = 'namespace'
+
+# When several entries define the same module the import system
+# prefers them in this order.
+PRIORITY = {
+    PACKAGE: 0,
+    EXTENSION: 1,
+    SOURCE: 2,
+    BYTECODE: 3,
+    NAMESPACE: 4,
+}
+
+# Extension modules of all platforms are recognized, as the plugin may
+# be built on a platform other than the one it is meant for.
+EXTENSION_SUFFIXES = ('.so', '.pyd')
+
+
+def module_kind(file_name):
+    """
+    Tell which module a file defines.
+
+    Returns:
+        A (module name, kind) tuple or (None, None) if the file is not
+        a module.
+    """
+    if file_name.endswith('.py'):
+        name, kind = file_name[:-3], SOURCE
+    elif file_name.endswith('.pyc'):
+        name, kind = file_name[:-4], BYTECODE
+    elif file_name.endswith(EXTENSION_SUFFIXES):
+        # Tags like .cpython-38-x86_64-linux-gnu.so come after the name.
+        name, kind = file_name.split('.', 1)[0], EXTENSION
+    else:
+        return None, None
+    if not name.isidentifier():
+        return None, None
+    return name, kind
+
+
+def scan_directory(path):
+    """
+    Lists the modules and packages in a directory without importing
+    anything.
+
+    A directory is a package if it has an __init__ module and a
+    namespace package otherwise. When a name is defined by several
+    entries only the one that the import system would use is kept, so
+    a source file hides a legacy .pyc file of the same module.
+
+    Returns:
+        A list of (module name, kind, path) tuples, with the __init__
+        module (if any) first and the others sorted by name.
+    """
+    found = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                name = entry.name
+                if not name.isidentifier() or name == '__pycache__':
+                    continue
+                if os.path.isfile(os.path.join(entry.path, '__init__.py')) \
+                        or os.path.isfile(
+                            os.path.join(entry.path, '__init__.pyc')):
+                    kind = PACKAGE
+                else:
+                    kind = NAMESPACE
+            else:
+                name, kind = module_kind(entry.name)
+                if name is None:
+                    continue
+            existing = found.get(name)
+            if existing is None or PRIORITY[kind] < PRIORITY[existing[0]]:
+                found[name] = (kind, entry.path)
+
+    init = found.pop('__init__', None)
+    if init is not None and init[0] == NAMESPACE:
+        init = None
+    result = [] if init is None else [('__init__', ) + init]
+    for name in sorted(found):
+        result.append((name, ) + found[name])
+    return result
+
+
+def module_file(path, kind, source_py):
+    """
+    Creates the record of a module found by scan_directory().
+
+    Only source files get compiled; .pyc files without a source and
+    extension modules are deployed as they are.
+    """
+    if kind == SOURCE:
+        return PubPy(path, path[:-3] + '.pyc', not source_py)
+    return PubPy(path, path, False)
+
 
 class PubModule(object):
     """
@@ -27,9 +127,14 @@ class PubModule(object):
             the file system path of the module
         exclude_modules (list):
             a list of module names that we export
+        ignore (PubIgnore):
+            patterns for files and directories that are left out
+        root (str):
+            the directory that ignore patterns are relative to
     """
 
-    def __init__(self, name, path, exclude_modules=None):
+    def __init__(self, name, path, exclude_modules=None,
+                 ignore=None, root=None):
         """
         Constructor.
 
@@ -40,12 +145,32 @@ class PubModule(object):
                 the file system path of the module
             exclude_modules (list):
                 a list of module names that we export
+            ignore (PubIgnore):
+                patterns for files and directories that are left out
+            root (str):
+                the directory that ignore patterns are relative to;
+                by default the parent of the module
         """
         super().__init__()
         self.name = name
         self.path = path
         self.exclude_modules = [] if exclude_modules is None else exclude_modules
+        self.ignore = PubIgnore() if ignore is None else ignore
+        self.root = os.path.dirname(path) if root is None else root
         self.files = []
+        self._exclude_re = None
+
+    @property
+    def exclude_re(self):
+        """ A single expression that matches any of the excluded modules. """
+        if self._exclude_re is None:
+            alternatives = [
+                getattr(regex, 'pattern', regex)
+                for regex in self.exclude_modules]
+            self._exclude_re = re.compile(
+                '|'.join('(?:%s)' % alt for alt in alternatives)
+                if len(alternatives) > 0 else '(?!)')
+        return self._exclude_re
 
     def __str__(self):
         """ Represent this object as a human-readable string. """
@@ -60,6 +185,9 @@ class PubModule(object):
         """
         Collects the files in a module.
 
+        Nothing is imported: the modules are found by looking at the
+        file system, the way the import system would find them.
+
         Arguments:
             source_py:
                 True if the source files are to be collected, False if
@@ -76,28 +204,36 @@ class PubModule(object):
         logger.debug("module %s is collecting files from %s(%r)",
                      self.name, pkg_name, pkg_path)
 
-        fs_name = os.path.join(pkg_path, '__init__')
-        self.files.append(PubPy.module_to_file(fs_name, source_py))
-
-        for importer, modname, is_pkg in pkgutil.walk_packages(
-                path=[pkg_path],
-                prefix='',
-                onerror=lambda x: None):
-
-            if not any(regex.match(modname) for regex in self.exclude_modules):
-                fs_name = os.path.join(pkg_path, modname)
-                self.files.append(PubPy.module_to_file(fs_name, source_py))
-                if os.path.isdir(fs_name):
-                    self.collect_py_files(
-                        source_py=source_py,
-                        pkg_name='%s.%s' % (pkg_name, modname),
-                        pkg_path=fs_name)
-            else:
+        for modname, kind, fs_name in scan_directory(pkg_path):
+            if modname == '__init__':
+                self.files.append(module_file(fs_name, kind, source_py))
+                continue
+
+            if self.exclude_re.match(modname):
                 logger.debug("module %r excluded by exclude_modules",
                              modname)
+                continue
+
+            is_pkg = kind in (PACKAGE, NAMESPACE)
+            rel_path = os.path.relpath(fs_name, self.root)
+            if self.ignore.match(rel_path, is_dir=is_pkg):
+                logger.debug("module %r excluded by ignore patterns",
+                             modname)
+                continue
+
+            if is_pkg:
+                self.collect_py_files(
+                    source_py=source_py,
+                    pkg_name='%s.%s' % (pkg_name, modname),
+                    pkg_path=fs_name)
+            else:
+                self.files.append(module_file(fs_name, kind, source_py))
 
-    def compile(self, toolset, force=False):
+    def compile(self, toolset, force=False, profile=None):
         """ Create path_out file from path_in. """
-        logger.debug("compiling module %s at %s", self.name, self.path)
-        compileall.compile_dir(dir=self.path, legacy=True)
+        optimize = 0 if profile is None else profile.optimize
+        logger.debug("compiling module %s at %s (optimize=%d)",
+                     self.name, self.path, optimize)
+        compileall.compile_dir(
+            dir=self.path, legacy=True, force=force, optimize=optimize)
         logger.debug("done compiling module %s at %s", self.name, self.path)
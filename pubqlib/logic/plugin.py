@@ -5,19 +5,101 @@ Contains the definition of the PubPlugin class.
 from __future__ import unicode_literals
 from __future__ import print_function
 
+import copy
 import logging
 import os
 import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import configparser
 
+from . import lazy
+from .artefacts import ArtefactCache
+from .ignore import PubIgnore
+from .images import ImageOptimizer
+from .journal import BuildJournal, stat_signature
+from .manifest import MANIFEST_NAME, PubManifest
 from .module import PubModule
+from .profile import get_profile
 from .qrc_files import PubQrc
+from .resources import (
+    SHARED_NAME, ResourceIndex, rewritten_qrc, shared_import, write_if_changed)
+from .schedule import BuildHistory, CompileSchedule, input_size
+from .worker import WorkerToolset
 from .ui_files import PubUi
+from .vendor import PubVendor
+from pubqlib.utils.fileio import (
+    copy_file, hash_file, link_file, write_atomic)
+from pubqlib.utils.locking import FileLock
 
 logger = logging.getLogger('pubq.plugin')
 
 
+def prepare_target(target, clear_opt):
+    """
+    Creates the directory of a deployed plugin or decides what to do
+    with the files that are already there.
+
+    Arguments:
+        target (str):
+            The directory of the deployed plugin.
+        clear_opt (str):
+            What to do when the directory exists and is not empty:
+            *error*, *clear* or *overwrite*.
+
+    Returns:
+        None if the deploy must not go forward, True if existing files
+        are to be replaced, False if the directory is empty.
+    """
+    if not os.path.isdir(target):
+        logger.debug("target does not exist; creating...")
+        os.makedirs(target)
+        return False
+
+    has_files = False
+    for _ in os.listdir(target):
+        has_files = True
+        break
+    if not has_files:
+        logger.debug("target exists but has no files")
+        return False
+
+    logger.debug("target exists and has files")
+    if clear_opt == 'error':
+        logger.error("Path %r exists and is not empty", target)
+        return None
+    if clear_opt == 'clear':
+        logger.debug("all files in %s are being deleted", target)
+        shutil.rmtree(target)
+        os.mkdir(target)
+        return False
+    if clear_opt == 'overwrite':
+        logger.debug("files with same name will be overwritten")
+        return True
+    raise ValueError(clear_opt)
+
+
+def parse_dependencies(text):
+    """
+    Parses the plugin_dependencies field of the metadata.
+
+    The field is a comma separated list of plugin names, each optionally
+    followed by `==version`; names may contain spaces.
+
+    Returns:
+        A list of (name, version or None) tuples.
+    """
+    result = []
+    for item in (text or '').split(','):
+        name, _, version = item.partition('==')
+        name, version = name.strip(), version.strip()
+        if len(name) > 0:
+            result.append((name, version if len(version) > 0 else None))
+    return result
+
+
 class PubPlugin(object):
     """
     This class .
@@ -93,13 +175,31 @@ class PubPlugin(object):
         super().__init__()
         self.source_path = source_path
         self.target_name = None
+        self.state_path = None
+        self.build_path = None
+        self.journal = None
+        self.history = None
+        self.schedules = []
+        self.hashes = None
+        self.source_py = False
+        self.lazy_init = False
+        self.optimize_images = False
+        self.images = {}
+        self.resources = None
+        self.shared_qrc = None
+        self.staged = {}
+        self.unwritten = set()
 
         self.config_obj = configparser.ConfigParser(
             allow_no_value=True)
+        self.ignore = PubIgnore()
         self.modules = [] if modules is None else modules
         self.extra_files = []
+        self.extra_dirs = []
+        self.extra_dir_files = None
         self.ui_files = []
         self.qrc_files = []
+        self.vendor = None
 
         # ---- Metadata ----
         self.about = about
@@ -143,7 +243,9 @@ class PubPlugin(object):
         """
         logger.debug("Initializing plugin from directory %s", path)
         self.source_path = path
+        self.source_py = source_py
         self.target_name = os.path.split(path)[1]
+        self.state_path = os.path.join(path, '.pubq')
 
         metadata_path = os.path.join(path, 'metadata.txt')
         if not os.path.isfile(metadata_path):
@@ -151,6 +253,7 @@ class PubPlugin(object):
                          metadata_path)
             return False
         self.read_metadata(metadata_path)
+        self.ignore = PubIgnore.from_plugin(path, self.config_obj)
 
         init_path = os.path.join(path, '__init__.py')
         if not os.path.isfile(init_path):
@@ -163,8 +266,12 @@ class PubPlugin(object):
         else:
             self.modules = self.load_modules(path, modules, source_py=source_py)
         self.extra_files = self.load_extra_files(path)
+        self.extra_dirs = self.load_extra_dirs(path)
+        self.extra_dir_files = None
         self.ui_files = self.load_ui_files(path)
         self.qrc_files = self.load_qrc_files(path)
+        self.vendor = PubVendor.from_plugin(
+            path, self.config_obj, source_py=source_py)
 
     def has_required_metadata(self):
         """
@@ -296,6 +403,10 @@ class PubPlugin(object):
 
         logger.debug("metadata has been read")
 
+    def required_plugins(self):
+        """ The plugins this one depends on, as (name, version) tuples. """
+        return parse_dependencies(self.plugin_dependencies)
+
     def write_metadata(self, out_file):
         """ Writes the metadata.txt file. """
         logger.debug("writing metadata to %s", out_file)
@@ -357,7 +468,8 @@ class PubPlugin(object):
         result = []
         for module_name in modules:
             m = PubModule(
-                    name=module_name, path=os.path.join(path, module_name))
+                    name=module_name, path=os.path.join(path, module_name),
+                    ignore=self.ignore, root=path)
             m.collect_py_files(source_py=source_py)
             result.append(m)
         logger.debug("created %d modules", len(result))
@@ -365,7 +477,7 @@ class PubPlugin(object):
 
     def load_extra_files(self, path):
         """
-        Creates modules instances and reads their files.
+        Finds the extra files listed in the metadata.
 
         Attributes:
             path (str):
@@ -380,9 +492,6 @@ class PubPlugin(object):
         include_files = self.config_obj.get('extra', 'files', fallback='')
         logger.debug("include_files = %r", include_files)
 
-        include_dirs = self.config_obj.get('extra', 'directories', fallback='')
-        logger.debug("include_dirs = %r", include_dirs)
-
         for file in include_files.split("\n"):
             if len(file) > 0:
                 file = os.path.join(path, file.strip())
@@ -392,22 +501,63 @@ class PubPlugin(object):
                 else:
                     logger.error("Extra file does not exist: %s", file)
 
+        logger.debug("found %d extra files", len(result))
+        return result
+
+    def load_extra_dirs(self, path):
+        """
+        Finds the extra directories listed in the metadata.
+
+        Their content is only listed when the plugin is deployed
+        (see iter_extra_files()).
+
+        Attributes:
+            path (str):
+                The path of the package.
+
+        Returns:
+            A list of directories.
+        """
+        result = []
+        include_dirs = self.config_obj.get('extra', 'directories', fallback='')
+        logger.debug("include_dirs = %r", include_dirs)
+
         for directory in include_dirs.split("\n"):
             directory = directory.strip()
             if len(directory) > 0:
                 file = os.path.join(path, directory)
                 if os.path.isdir(file):
-                    for root, dirs, files in os.walk(".", topdown=False):
-                        for name in files:
-                            to_add = os.path.join(root, name)
-                            logger.log(1, "- %s", to_add)
-                            result.append(to_add)
+                    result.append(file)
                 else:
                     logger.error("Extra directory does not exist: %s", file)
-
-        logger.debug("found %d extra files", len(result))
         return result
 
+    def iter_extra_files(self):
+        """
+        Generates the extra files, walking the extra directories lazily.
+
+        The content of the directories is remembered once it was listed
+        completely, so a plugin kept in memory walks them only once.
+        """
+        for file in self.extra_files:
+            yield file
+        if self.extra_dir_files is not None:
+            for file in self.extra_dir_files:
+                yield file
+            return
+
+        found = []
+        for directory in self.extra_dirs:
+            for root, dirs, files in self.ignore.walk(
+                    directory, self.source_path):
+                for name in files:
+                    to_add = os.path.join(root, name)
+                    logger.log(1, "- %s", to_add)
+                    found.append(to_add)
+                    yield to_add
+        logger.debug("found %d files in extra directories", len(found))
+        self.extra_dir_files = found
+
     def load_ui_files(self, path):
         """
         Finds ui files.
@@ -430,9 +580,12 @@ class PubPlugin(object):
                 if os.path.isfile(file):
                     result.append(PubQrc(file))
                 elif os.path.isdir(file):
-                    for ui_file in os.listdir(file):
-                        if ui_file.upper().endswith('.UI'):
-                            result.append(PubUi(os.path.join(file, ui_file)))
+                    for root, dirs, files in self.ignore.walk(file, path):
+                        del dirs[:]
+                        for ui_file in files:
+                            if ui_file.upper().endswith('.UI'):
+                                result.append(
+                                    PubUi(os.path.join(file, ui_file)))
                 else:
                     logger.error("Extra file does not exist: %s", file)
 
@@ -441,7 +594,7 @@ class PubPlugin(object):
             file = file.strip()
             if len(file) > 0:
                 file = os.path.join(path, file)
-                for root, dirs, files in os.walk(file):
+                for root, dirs, files in self.ignore.walk(file, path):
                     for ui_file in files:
                         if ui_file.upper().endswith('.UI'):
                             result.append(PubUi(os.path.join(root, ui_file)))
@@ -474,9 +627,12 @@ class PubPlugin(object):
                 if os.path.isfile(file):
                     result.append(PubQrc(file))
                 elif os.path.isdir(file):
-                    for qrc_file in os.listdir(file):
-                        if qrc_file.upper().endswith('.QRC'):
-                            result.append(PubQrc(os.path.join(file, qrc_file)))
+                    for root, dirs, files in self.ignore.walk(file, path):
+                        del dirs[:]
+                        for qrc_file in files:
+                            if qrc_file.upper().endswith('.QRC'):
+                                result.append(
+                                    PubQrc(os.path.join(file, qrc_file)))
                 else:
                     logger.error("Extra file does not exist: %s", file)
 
@@ -485,7 +641,7 @@ class PubPlugin(object):
             file = file.strip()
             if len(file) > 0:
                 file = os.path.join(path, file)
-                for root, dirs, files in os.walk(file):
+                for root, dirs, files in self.ignore.walk(file, path):
                     for qrc_file in files:
                         if qrc_file.upper().endswith('.QRC'):
                             result.append(PubQrc(os.path.join(root, qrc_file)))
@@ -493,37 +649,622 @@ class PubPlugin(object):
         logger.debug("found %d .qrc files", len(result))
         return result
 
-    def compile(self, toolset, force=False):
-        """ Creates output files from input files. """
-        logger.debug("plugin %s is being compiled ...", self.name)
-        for ui_file in self.ui_files:
-            ui_file.compile(toolset=toolset, force=force)
+    def read_state(self, name, default=None):
+        """ Reads a value saved by a previous build of this plugin. """
+        try:
+            with open(os.path.join(self.state_path, name), 'r') as fin:
+                return fin.read().strip()
+        except (OSError, TypeError):
+            return default
+
+    def write_state(self, name, value):
+        """ Saves a value for the next build of this plugin. """
+        if not os.path.isdir(self.state_path):
+            os.makedirs(self.state_path)
+        write_atomic(os.path.join(self.state_path, name), value)
+
+    def build_lock(self):
+        """
+        The lock that keeps other processes from building this plugin
+        at the same time.
+        """
+        return FileLock(os.path.join(self.state_path, 'lock'))
+
+    def compile(self, toolset, force=False, profile=None, workers=None,
+                jobs=None):
+        """
+        Creates output files from input files.
+
+        Arguments:
+            toolset (Toolset):
+                The tools used to compile forms and resources.
+            force (bool):
+                Compile even if the outputs are newer than inputs.
+            profile (DeployProfile):
+                How to compile the python files; outputs created with a
+                different profile are always recompiled.
+            workers (WorkerPool):
+                The workers that compile the forms and the resources,
+                if any.
+            jobs (int):
+                How many forms and resources are compiled at the same
+                time; by default one, or as many as the workers accept.
+        """
+        profile = get_profile(None) if profile is None else profile
+        if workers is not None:
+            toolset = WorkerToolset(toolset, workers)
+        self.schedules = []
+        with self.build_lock():
+            # Another process may have built the plugin while we waited.
+            self.get_journal().load()
+            self.get_history().load()
+            # The journal tells outputs of other profiles apart, but
+            # compileall only looks at timestamps.
+            force_python = self.profile_changed(profile) or force
+
+            logger.debug("plugin %s is being compiled with %s ...",
+                         self.name, profile)
+            self.optimize_assets()
+            self.share_resources()
+            self.compile_resources(
+                toolset=toolset, force=force, profile=profile, jobs=jobs)
+            self.compile_python(
+                toolset=toolset, force=force_python, profile=profile)
+            if self.lazy_init:
+                lazy.write_init(self.lazy_init_path)
+            self.write_state('profile', profile.name)
+        logger.debug("plugin %s was compiled", self.name)
+
+    def profile_changed(self, profile):
+        """ Tell if the previous build used a different profile. """
+        if self.read_state('profile') != profile.name:
+            logger.debug("previous build used a different profile")
+            return True
+        return False
+
+    def get_journal(self):
+        """ The journal of the builds of this plugin. """
+        if self.journal is None:
+            self.journal = BuildJournal(
+                os.path.join(self.state_path, 'journal'), hashes=self.hashes)
+        return self.journal
+
+    def get_history(self):
+        """ The durations of the units compiled by previous builds. """
+        if self.history is None:
+            self.history = BuildHistory(
+                os.path.join(self.state_path, 'history.json'))
+        return self.history
+
+    def stage_file(self, path, data, dry_run=False):
+        """
+        Writes a generated input of the build (a copy of a resource
+        file) unless it already holds the same content.
+
+        In a dry run nothing is written; the files that would change
+        are added to `unwritten`, so their users can be told stale.
+        """
+        self.staged[path] = data
+        if not dry_run:
+            write_if_changed(path, data)
+            return
+        try:
+            with open(path, 'rb') as fin:
+                if fin.read() == data:
+                    return
+        except OSError:
+            pass
+        self.unwritten.add(path)
+
+    def optimize_assets(self, dry_run=False):
+        """
+        Replaces the PNG images used by the resources and the extra
+        files with smaller copies.
+
+        A resource file that uses optimized images is compiled from a
+        copy in `.pubq/images`; the extra files are replaced when the
+        plugin is deployed (see iter_deploy_pairs()). Nothing is
+        replaced unless optimize_images is set.
+
+        Arguments:
+            dry_run (bool):
+                Only use the images optimized before and write nothing
+                (see stage_file()).
+        """
+        self.staged = {}
+        self.unwritten = set()
+        if not self.optimize_images:
+            self.images = {}
+            for qrc_file in self.qrc_files:
+                qrc_file.rc_input = None
+            return
+        images = [
+            file for qrc_file in self.qrc_files
+            for file in qrc_file.referenced_files()
+            if os.path.isfile(file)]
+        images.extend(self.iter_extra_files())
+        optimizer = ImageOptimizer(hashes=self.get_journal().hashes)
+        self.images = optimizer.optimize(images, dry_run=dry_run)
+        for qrc_file in self.qrc_files:
+            rewritten = os.path.join(
+                self.state_path, 'images',
+                os.path.relpath(qrc_file.path_in, self.source_path))
+            data = rewritten_qrc(qrc_file.path_in, replace=self.images)
+            qrc_file.rc_input = None if data is None else rewritten
+            if data is not None:
+                self.stage_file(rewritten, data, dry_run=dry_run)
+        logger.debug("%d images of plugin %s are optimized",
+                     len(self.images), self.name)
+
+    def share_resources(self, dry_run=False):
+        """
+        Moves the resources listed in more than one .qrc file to a
+        shared resource module.
+
+        Such entries are removed from copies of the .qrc files, in
+        `.pubq/resources`, and the modules compiled from them import
+        the shared module. Runs after optimize_assets(), with the same
+        dry_run.
+        """
+        resources_path = os.path.join(self.state_path, 'resources')
+        self.resources = ResourceIndex(
+            [qrc_file.path_in for qrc_file in self.qrc_files],
+            hashes=self.get_journal().hashes).build(save=not dry_run)
+        self.shared_qrc = None
         for qrc_file in self.qrc_files:
-            qrc_file.compile(toolset=toolset, force=force)
+            qrc_file.shared_import = None
+        if len(self.resources.shared) == 0:
+            return
+
+        shared_path = os.path.join(resources_path, SHARED_NAME + '.qrc')
+        self.stage_file(
+            shared_path, self.resources.shared_qrc(replace=self.images),
+            dry_run=dry_run)
+        self.shared_qrc = PubQrc(shared_path)
+        for qrc_file in self.qrc_files:
+            users = self.resources.users(qrc_file.path_in)
+            if len(users) == 0:
+                continue
+            rewritten = os.path.join(
+                resources_path,
+                os.path.relpath(qrc_file.path_in, self.source_path))
+            source = qrc_file.rc_input or qrc_file.path_in
+            self.stage_file(rewritten, rewritten_qrc(
+                source, exclude=users, data=self.staged.get(source)),
+                dry_run=dry_run)
+            qrc_file.rc_input = rewritten
+            qrc_file.shared_import = shared_import(os.path.relpath(
+                qrc_file.default_output(), self.source_path))
+        for line in self.resources.report():
+            logger.info("%s: %s", self.name, line)
+
+    def resource_files(self):
+        """ The forms and the resources to compile. """
+        result = self.ui_files + self.qrc_files
+        if self.shared_qrc is not None:
+            result.append(self.shared_qrc)
+        return result
+
+    def compile_resources(self, toolset, force=False, profile=None,
+                          jobs=None):
+        """
+        Compiles the forms and the resources.
+
+        The outputs are shared with other builds through the artefact
+        cache, so a form is compiled once for all the checkouts of
+        a plugin on this machine. With several jobs (or workers) the
+        files are compiled concurrently, longest first; the schedule
+        is appended to `schedules`.
+        """
+        profile = get_profile(None) if profile is None else profile
+        journal = self.get_journal()
+        artefacts = ArtefactCache()
+        if jobs is None:
+            jobs = getattr(toolset, 'jobs', 1)
+        schedule = CompileSchedule(self.get_history(), jobs=jobs)
+        for file in self.resource_files():
+            unit, in_hash = self.resource_unit(file, toolset, profile)
+            if not force and journal.is_done(unit, in_hash):
+                logger.debug("%s was compiled by a previous build",
+                             file.path_in)
+                continue
+            schedule.add(unit, type(file).__name__, file.dependencies(),
+                         (file, unit, in_hash))
+        schedule.order()
+
+        def compile_one(item):
+            file, unit, in_hash = item
+            outputs = [file.path_out, file.path_out + 'c']
+            compiled = False
+            start = time.perf_counter()
+            with artefacts.lock(in_hash):
+                if force or not artefacts.fetch(in_hash, outputs):
+                    file.compile(toolset=toolset, force=True, profile=profile)
+                    artefacts.store(in_hash, outputs)
+                    compiled = True
+            journal.record(unit, in_hash, outputs,
+                           duration=time.perf_counter() - start)
+            return compiled
+
+        if schedule.jobs > 1 and len(schedule.items) > 1:
+            with ThreadPoolExecutor(max_workers=schedule.jobs) as executor:
+                schedule.run(compile_one, executor)
+        else:
+            schedule.run(compile_one)
+        self.schedules.append(schedule)
+
+    def resource_unit(self, file, toolset, profile):
+        """
+        The journal unit that compiles a form or a resource file.
+
+        Returns:
+            The key of the unit and the hash of its inputs.
+        """
+        if file.path_out is None:
+            file.path_out = file.default_output()
+        in_hash = self.get_journal().input_hash(
+            file.dependencies(), type(file).__name__,
+            file.use_compiled, profile.name,
+            os.path.basename(file.path_out),
+            toolset.ui_compiler, toolset.rc_compiler,
+            getattr(file, 'shared_import', None),
+            root=self.source_path)
+        return 'compile:%s' % file.path_out, in_hash
+
+    def compile_python(self, toolset, force=False, profile=None):
+        """ Compiles the modules and vendored packages. """
+        if self.vendor is not None:
+            self.vendor.compile(
+                toolset=toolset, force=force, profile=profile, plugin=self)
+
+        profile = get_profile(None) if profile is None else profile
+        journal = self.get_journal()
+        history = self.get_history()
         for module in self.modules:
-            module.compile(toolset=toolset, force=force)
+            if not any(file.use_compiled for file in module.files):
+                # Only the sources are deployed.
+                continue
+            unit, in_hash = self.module_unit(module, profile)
+            if not force and journal.is_done(unit, in_hash):
+                logger.debug("module %s was compiled by a previous build",
+                             module.name)
+                continue
+            # compileall only looks at timestamps, so outputs that were
+            # damaged since the last build need a forced compilation.
+            damaged = journal.has(unit) and \
+                journal.entries[unit]['in'] == in_hash
+            start = time.perf_counter()
+            module.compile(
+                toolset=toolset, force=force or damaged, profile=profile)
+            duration = time.perf_counter() - start
+            journal.record(unit, in_hash, [
+                file.path_out for file in module.files
+                if file.path_in.endswith('.py')], duration=duration)
+            history.record(
+                unit, type(module).__name__,
+                input_size(self.module_inputs(module)), duration)
+        history.save()
+
+    def module_unit(self, module, profile):
+        """
+        The journal unit that compiles the sources of a module.
+
+        Returns:
+            The key of the unit and the hash of its inputs.
+        """
+        in_hash = self.get_journal().input_hash(
+            self.module_inputs(module), profile.name)
+        return 'module:%s' % module.path, in_hash
+
+    @staticmethod
+    def module_inputs(module):
+        """ The sources of a module that are byte-compiled. """
+        return [
+            file.path_in for file in module.files
+            if file.path_in.endswith('.py')]
+
+    @staticmethod
+    def copy_unit(source, output_path, stat=None):
+        """
+        The journal unit that copies a file into the deployed tree.
+
+        Copies are keyed by the stat signature of the source, so
+        deciding that a file is already in place reads nothing.
+
+        Returns:
+            The key of the unit and the hash of its inputs.
+        """
+        if stat is None:
+            stat = os.stat(source)
+        return 'copy:%s' % output_path, \
+            'stat:%d:%d:%d' % tuple(stat_signature(stat))
+
+    def variant(self, target, toolset=None):
+        """
+        Creates a copy of this plugin that builds into a separate tree.
+
+        The forms and the resources of the copy are compiled inside
+        `.pubq/build/<target>`; everything else is shared with this
+        instance. Bytecode only loads in the Python version that wrote
+        it, so the copy deploys sources when the Python of the target
+        is not the one running pubq.
+
+        Arguments:
+            target (str):
+                The name of the toolchain (e.g. qt4, qt5).
+            toolset (Toolset):
+                The tools of the target, if known.
+
+        Raises:
+            ValueError: the Python of the target cannot be run.
+        """
+        result = copy.copy(self)
+        if toolset is not None and not self.source_py and \
+                toolset.python_version() != tuple(sys.version_info[:2]):
+            logger.debug("%s runs python %d.%d; deploying sources",
+                         target, *toolset.python_version())
+            result.source_py = True
+            if self.vendor is not None:
+                result.vendor = copy.copy(self.vendor)
+                result.vendor.use_compiled = False
+        result.build_path = os.path.join(self.state_path, 'build', target)
+        result.ui_files = [
+            file.retarget(self.source_path, result.build_path)
+            for file in self.ui_files]
+        result.qrc_files = [
+            file.retarget(self.source_path, result.build_path)
+            for file in self.qrc_files]
+        if self.shared_qrc is not None:
+            result.shared_qrc = self.shared_qrc.retarget(
+                os.path.dirname(self.shared_qrc.path_in), result.build_path)
+        return result
+
+    def compile_targets(self, toolsets, force=False, profile=None,
+                        workers=None, jobs=None):
+        """
+        Builds the plugin for several toolchains at once.
+
+        Python modules are compiled once by the interpreter running pubq
+        and that bytecode is shared by the targets that run the same
+        Python version; the other targets deploy the sources (see
+        variant()). Forms and resources are compiled for all toolchains
+        concurrently, each in its own tree.
+
+        Arguments:
+            toolsets (dict):
+                Maps the name of each target to its Toolset.
+            force (bool):
+                Compile even if the outputs are newer than inputs.
+            profile (DeployProfile):
+                How to compile the python files.
+            workers (WorkerPool):
+                The workers that compile the forms and the resources,
+                if any.
+            jobs (int):
+                How many forms and resources of each target are compiled
+                at the same time.
+
+        Returns:
+            A dictionary mapping target names to plugin variants
+            ready to be deployed.
+        """
+        profile = get_profile(None) if profile is None else profile
+        if workers is not None:
+            toolsets = {
+                target: WorkerToolset(toolset, workers)
+                for target, toolset in toolsets.items()}
+        with self.build_lock():
+            # The variants must share a single journal, which may have
+            # been updated by another process while we waited.
+            self.get_journal().load()
+            self.get_history().load()
+            self.schedules = []
+            force_python = self.profile_changed(profile) or force
+            # Once for all the variants.
+            self.optimize_assets()
+            self.share_resources()
+
+            variants = {
+                target: self.variant(target, toolsets[target])
+                for target in toolsets}
+            logger.debug("plugin %s is being compiled for %r with %s ...",
+                         self.name, sorted(toolsets), profile)
+            with ThreadPoolExecutor(max_workers=len(toolsets)) as executor:
+                futures = [
+                    executor.submit(
+                        variants[target].compile_resources,
+                        toolset=toolsets[target], force=force,
+                        profile=profile, jobs=jobs)
+                    for target in toolsets]
+                if not all(variant.source_py
+                           for variant in variants.values()):
+                    self.compile_python(
+                        toolset=None, force=force_python, profile=profile)
+                for future in futures:
+                    future.result()
+
+            if self.lazy_init:
+                lazy.write_init(self.lazy_init_path)
+            self.write_state('profile', profile.name)
         logger.debug("plugin %s was compiled", self.name)
+        return variants
 
-    def collect_files_to_deploy(self):
-        """ Creates a single list of all files to be copied. """
-        logger.debug("collecting files to deploy...")
-        result = []
+    def relative_path(self, file):
+        """ The path of a file to deploy, relative to the plugin. """
+        if self.build_path is not None and \
+                file.startswith(self.build_path + os.sep):
+            return os.path.relpath(file, self.build_path)
+        return os.path.relpath(file, self.source_path)
 
+    def iter_files_to_deploy(self):
+        """
+        Generates the files to be copied.
+
+        Deploying consumes this lazily, so copying starts before all
+        the files were found.
+        """
         for module in self.modules:
             for file in module.files:
-                result.append(file.copy_target)
+                yield file.path_in if self.source_py else file.copy_target
 
-        result.extend(self.extra_files)
+        for file in self.iter_extra_files():
+            yield file
 
         for ui_file in self.ui_files:
-            result.append(ui_file.copy_target)
+            yield self.generated_target(ui_file)
         for qrc_file in self.qrc_files:
-            result.append(qrc_file.copy_target)
+            yield self.generated_target(qrc_file)
+        if self.vendor is not None:
+            for file in self.vendor.files:
+                yield file
+
+    def generated_target(self, file):
+        """
+        The file deployed for a form or a resource file: the generated
+        module when sources are deployed, its bytecode otherwise.
+        """
+        return file.path_out if self.source_py else file.copy_target
+
+    def write_manifest(self, target, shipped):
+        """
+        Writes the list of deployed files with their size and hash.
+
+        The hashes are those of the sources, which are only read if
+        they changed since they were last hashed. The deployed copies
+        are recorded in the hash cache with the same hash, so verifying
+        right after a deploy reads nothing.
+
+        Arguments:
+            target (str):
+                The directory of the deployed plugin.
+            shipped (list):
+                (path relative to the plugin, source, deployed path)
+                tuples.
+        """
+        hashes = self.get_journal().hashes
+        digests = hashes.hash_many([source for _, source, _ in shipped])
+        manifest = PubManifest()
+        for rel_path, source, output_path in shipped:
+            stat = os.stat(output_path)
+            manifest.add(rel_path, stat.st_size, digests[source])
+            if not os.path.islink(output_path) and \
+                    hashes.lookup(output_path, stat) != digests[source]:
+                hashes.store(output_path, stat, digests[source])
+        # Rewritten by every deploy; caching its hash would only force
+        # the cache to be saved again.
+        metadata_path = os.path.join(target, "metadata.txt")
+        manifest.add(
+            "metadata.txt", os.path.getsize(metadata_path),
+            hash_file(metadata_path))
+        manifest.save(os.path.join(target, MANIFEST_NAME))
+        hashes.save()
+        logger.debug("wrote the manifest of %d files in %s",
+                     len(manifest.files), target)
+
+    @property
+    def lazy_init_path(self):
+        """ The generated __init__.py of a plugin that loads lazily. """
+        return os.path.join(self.state_path, 'lazy', '__init__.py')
+
+    def iter_generated_files(self):
+        """
+        Generates (file, path relative to the deployed plugin) for the
+        deployed files that are created by the build or shipped by pubq;
+        a linked deploy copies them.
+        """
+        for file in self.resource_files():
+            for path in (file.copy_target, file.path_out):
+                if path is None:
+                    continue
+                if file is self.shared_qrc:
+                    # Deployed at the root (see iter_deploy_pairs()).
+                    yield path, os.path.basename(path)
+                else:
+                    yield path, self.relative_path(path)
+        if self.lazy_init:
+            yield self.lazy_init_path, "__init__.py"
+            yield lazy.PROXY_SOURCE, lazy.PROXY_NAME
+
+    @staticmethod
+    def remove_links(target):
+        """ Removes the symbolic links left by a linked deploy. """
+        for root, dirs, files in os.walk(target):
+            for name in files + dirs:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    logger.debug("removing link %r", path)
+                    os.remove(path)
+
+    def remove_dangling_links(self, target):
+        """
+        Removes the links of a linked deploy whose source was deleted
+        (or renamed) since.
+        """
+        for root, dirs, files in os.walk(target):
+            for name in files + dirs:
+                path = os.path.join(root, name)
+                if not os.path.islink(path) or os.path.exists(path):
+                    continue
+                source = os.readlink(path)
+                if source.startswith(self.source_path + os.sep):
+                    logger.debug("removing dangling link %r", path)
+                    os.remove(path)
+
+    @staticmethod
+    def deploy_link(file, output_path):
+        """
+        Makes a deployed file a symbolic link to its source.
+
+        Returns:
+            False if symbolic links cannot be created here.
+        """
+        file = os.path.abspath(file)
+        if os.path.islink(output_path) and \
+                os.readlink(output_path) == file:
+            logger.log(1, "%s is already linked", output_path)
+            return True
+
+        out_base = os.path.dirname(output_path)
+        if not os.path.isdir(out_base):
+            logger.debug("creating directory %r", out_base)
+            os.makedirs(out_base)
+        try:
+            link_file(file, output_path)
+        except (NotImplementedError, OSError) as exc:
+            logger.warning("cannot create symbolic links (%s), "
+                           "copying files instead", exc)
+            return False
+        logger.debug("linked %s to %s", output_path, file)
+        return True
 
+    def collect_files_to_deploy(self):
+        """ Creates a single list of all files to be copied. """
+        logger.debug("collecting files to deploy...")
+        result = list(self.iter_files_to_deploy())
         logger.debug("collected %d files to deploy", len(result))
         return result
 
-    def deploy(self, target, clear_opt='error'):
+    def iter_deploy_pairs(self):
+        """
+        Generates (source file, path relative to the deployed plugin)
+        for every file that is copied when deploying, including the
+        files that are always present.
+        """
+        init_path = os.path.join(self.source_path, "__init__.py")
+        if self.lazy_init:
+            yield init_path, lazy.REAL_INIT_NAME
+            yield self.lazy_init_path, "__init__.py"
+            yield lazy.PROXY_SOURCE, lazy.PROXY_NAME
+        else:
+            yield init_path, "__init__.py"
+        yield os.path.join(self.source_path, "setup.py"), "setup.py"
+        if self.shared_qrc is not None:
+            copy_target = self.generated_target(self.shared_qrc)
+            yield copy_target, os.path.basename(copy_target)
+        for file in self.iter_files_to_deploy():
+            yield self.images.get(file, file), self.relative_path(file)
+
+    def deploy(self, target, clear_opt='error', link=False):
         """
         Copies files to target directory.
 
@@ -535,48 +1276,71 @@ class PubPlugin(object):
                 - *error*: show an error and exit
                 - *clear*: remove all files and directories
                 - *overwrite*: replace each file but keep other files.
+            link (bool):
+                Place symbolic links to the source tree instead of
+                copies; only generated files (metadata.txt and the
+                compiled forms and resources) are copied.
+
+        A deploy that was interrupted is resumed: the target is not
+        cleared and the files that were already copied are skipped. A
+        linked deploy over a previous linked deploy is updated in the
+        same way.
+
+        Returns:
+            False if the target was refused (see prepare_target()).
         """
         target = os.path.join(target, self.target_name)
         logger.debug("deploying plugin %s to %s", self.name, target)
 
-        if not os.path.isdir(target):
-            logger.debug("target does not exist; creating...")
-            os.makedirs(target)
-        else:
-            has_files = False
-            for _ in os.listdir(target):
-                has_files = True
-                break
-
-            if has_files:
-                logger.debug("target exists and has files")
-                if clear_opt == 'error':
-                    logger.error("Path %r exists and is not empty", target)
-                    return
-                if clear_opt == 'clear':
-                    logger.debug("all files in %s are being deleted", target)
-                    shutil.rmtree(target)
-                    os.mkdir(target)
-                    clear_opt = False
-                elif clear_opt == 'overwrite':
-                    logger.debug("files with same name will be overwritten")
-                    clear_opt = True
-                else:
-                    raise ValueError
-            else:
-                logger.debug("target exists but has no files")
+        journal = self.get_journal()
+        deploy_unit = 'deploy:%s' % target
+        link_unit = 'link:%s' % target
+        if journal.has(deploy_unit) and os.path.isdir(target):
+            logger.info("resuming the interrupted deploy to %s", target)
+            clear_opt = 'overwrite'
+        elif link and journal.has(link_unit) and os.path.isdir(target):
+            logger.debug("updating the linked deploy in %s", target)
+            clear_opt = 'overwrite'
+
+        clear_opt = prepare_target(target, clear_opt)
+        if clear_opt is None:
+            return False
 
         self.write_metadata(os.path.join(target, "metadata.txt"))
-        shutil.copy(
-            os.path.join(self.source_path, "__init__.py"),
-            os.path.join(target, "__init__.py"))
-        shutil.copy(
-            os.path.join(self.source_path, "setup.py"),
-            os.path.join(target, "setup.py"))
-
-        for file in self.collect_files_to_deploy():
-            rel_path = os.path.relpath(file, self.source_path)
+        # A stale generated file in the source tree must not be linked
+        # in place of the one built for this plugin.
+        generated = {
+            rel_path: path
+            for path, rel_path in self.iter_generated_files()} if link else None
+        if link:
+            journal.mark(link_unit)
+        elif journal.has(link_unit):
+            self.remove_links(target)
+            journal.drop(link_unit)
+
+        journal.mark(deploy_unit)
+        shipped = []
+        for file, rel_path in self.iter_deploy_pairs():
             output_path = os.path.join(target, rel_path)
+            if link and rel_path in generated:
+                file = generated[rel_path]
+            shipped.append((rel_path, file, output_path))
+
+            if link and rel_path not in generated:
+                if self.deploy_link(file, output_path):
+                    continue
+                link = False
+
+            if os.path.islink(output_path):
+                # Left by a linked deploy; copying would write through it
+                # into the source tree.
+                os.remove(output_path)
+
+            unit, in_hash = self.copy_unit(file, output_path)
+            if journal.is_done(unit, in_hash):
+                logger.log(1, "%s is already in place", output_path)
+                continue
+
             if clear_opt and os.path.isfile(output_path):
                 logger.debug("removing %r", output_path)
                 os.remove(output_path)
@@ -584,9 +1348,18 @@ class PubPlugin(object):
             out_base, file_name = os.path.split(output_path)
             if not os.path.isdir(out_base):
                 logger.debug("creating directory %r", out_base)
-                os.mkdir(out_base)
+                os.makedirs(out_base)
 
             logger.debug("copying %s to %s", file, output_path)
-            shutil.copy(file, output_path)
+            copy_file(file, output_path)
+            journal.record(
+                unit, in_hash, [output_path], digests={output_path: None})
 
+        if journal.has(link_unit):
+            self.remove_dangling_links(target)
+        self.write_manifest(target, shipped)
+
+        journal.drop(deploy_unit)
+        journal.compact()
         logger.debug("plugin %s has been deployed to %s", self.name, target)
+        return True
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the DeployProfile class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import io
+import logging
+import marshal
+import os
+import py_compile
+import time
+import tokenize
+
+logger = logging.getLogger('pubq.profile')
+
+
+class DeployProfile(object):
+    """
+    Decides how the python files are compiled for deployment.
+
+    Attributes:
+        name (str):
+            The name used on the command line.
+        optimize (int):
+            The optimization level passed to the compiler: 0 keeps
+            everything, 1 removes asserts, 2 also removes docstrings.
+        strip_docstrings (bool):
+            Remove docstrings from the generated python sources
+            (forms and resources).
+    """
+
+    def __init__(self, name, optimize=0, strip_docstrings=False):
+        """
+        Constructor.
+
+        Arguments:
+            name (str):
+                The name used on the command line.
+            optimize (int):
+                The optimization level passed to the compiler.
+            strip_docstrings (bool):
+                Remove docstrings from the generated python sources.
+        """
+        super().__init__()
+        self.name = name
+        self.optimize = optimize
+        self.strip_docstrings = strip_docstrings
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'DeployProfile(%s)' % self.name
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'DeployProfile(%r, optimize=%r, strip_docstrings=%r)' % (
+            self.name, self.optimize, self.strip_docstrings)
+
+    def compile_file(self, path_in, path_out=None):
+        """
+        Compiles a single python file.
+
+        Arguments:
+            path_in (str):
+                The python source.
+            path_out (str):
+                Where to save the bytecode; by default next to the source.
+        """
+        if path_out is None:
+            path_out = path_in + 'c'
+        logger.debug("compiling %r to %r (optimize=%d)",
+                     path_in, path_out, self.optimize)
+        py_compile.compile(
+            path_in, cfile=path_out, doraise=True, optimize=self.optimize)
+
+    def process_generated(self, path):
+        """
+        Applies the profile to a python file that we have generated.
+
+        Arguments:
+            path (str):
+                The path of the generated file.
+        """
+        if self.strip_docstrings:
+            strip_docstrings(path)
+
+
+PROFILES = {
+    'debug': DeployProfile('debug', optimize=0),
+    'release': DeployProfile('release', optimize=1),
+    'release-slim': DeployProfile(
+        'release-slim', optimize=2, strip_docstrings=True),
+}
+
+DEFAULT_PROFILE = 'debug'
+
+
+def get_profile(name):
+    """ Retrieve a profile by its name. """
+    return PROFILES[DEFAULT_PROFILE if name is None else name]
+
+
+def docstring_spans(readline):
+    """
+    Finds the docstrings in a python source.
+
+    Only the tokens are looked at, so this works the same with every
+    version of python that runs pubq (the end of a node is only known by
+    ast since 3.8).
+
+    Arguments:
+        readline:
+            Returns the lines of the source, as text.
+
+    Returns:
+        A list of (first line, first column, last line, module) tuples;
+        lines are counted from 1. A docstring is only listed if it is a
+        statement by itself, so that removing its lines is safe.
+    """
+    insignificant = (tokenize.COMMENT, tokenize.NL,
+                     tokenize.INDENT, tokenize.DEDENT)
+    result = []
+    expect = True
+    is_module = True
+    header = False
+    depth = 0
+    candidate = None
+    for token in tokenize.generate_tokens(readline):
+        kind, text = token.type, token.string
+        if candidate is not None:
+            if kind == tokenize.COMMENT:
+                continue
+            if kind in (tokenize.NEWLINE, tokenize.ENDMARKER):
+                result.append(candidate)
+            candidate = None
+        if kind in insignificant:
+            continue
+        if expect == 'body':
+            # Only a body that starts on a new line can have a docstring.
+            expect = kind == tokenize.NEWLINE
+            if expect:
+                continue
+        if expect:
+            expect = False
+            if kind == tokenize.STRING:
+                candidate = (token.start[0], token.start[1],
+                             token.end[0], is_module)
+                continue
+        if kind == tokenize.OP and text in ('(', '[', '{'):
+            depth = depth + 1
+        elif kind == tokenize.OP and text in (')', ']', '}'):
+            depth = depth - 1
+        elif kind == tokenize.NAME and text in ('def', 'class') and \
+                depth == 0:
+            header = True
+        elif kind == tokenize.OP and text == ':' and header and depth == 0:
+            header = False
+            is_module = False
+            expect = 'body'
+    return result
+
+
+def strip_docstrings(path):
+    """
+    Removes the docstrings from a python source file.
+
+    Each docstring of a class or function is replaced by a `pass`
+    statement, so bodies that only consisted of a docstring stay valid;
+    the docstring of the module is simply removed (it may precede
+    `from __future__` imports).
+
+    Arguments:
+        path (str):
+            The file to change in place.
+
+    Returns:
+        The number of docstrings that were removed.
+    """
+    with open(path, 'rb') as fin:
+        source = fin.read()
+    encoding, _ = tokenize.detect_encoding(io.BytesIO(source).readline)
+    text = source.decode(encoding)
+    try:
+        spans = docstring_spans(io.StringIO(text).readline)
+    except (tokenize.TokenError, IndentationError) as exc:
+        raise SyntaxError("%s: %s" % (path, exc))
+
+    # Split as tokenize does, so the line numbers match.
+    lines = io.StringIO(text).readlines()
+    for start, column, end, is_module in reversed(spans):
+        before = lines[start - 1][:column]
+        lines[start - 1:end] = [] if is_module else [before + 'pass\n']
+
+    if len(spans) == 0:
+        return 0
+    with open(path, 'wb') as fout:
+        fout.write(''.join(lines).encode(encoding))
+    logger.debug("removed %d docstrings from %s", len(spans), path)
+    return len(spans)
+
+
+def compare_profiles(files, repeat=5):
+    """
+    Measures the bytecode produced by each profile.
+
+    The code objects are compiled in memory, so nothing is written to
+    disk. The load time is the time spent un-marshalling the bytecode,
+    which is the part of an import that depends on the profile.
+
+    Arguments:
+        files (list):
+            Paths of python source files.
+        repeat (int):
+            How many times to load the bytecode; the best time is kept.
+
+    Returns:
+        A list of (profile name, number of files, size in bytes,
+        load time in seconds) tuples.
+    """
+    sources = []
+    for path in files:
+        try:
+            with open(path, 'rb') as fin:
+                sources.append((path, fin.read()))
+        except OSError:
+            logger.debug("cannot read %s", path)
+
+    result = []
+    for name in sorted(PROFILES, key=lambda n: PROFILES[n].optimize):
+        profile = PROFILES[name]
+        blobs = []
+        for path, source in sources:
+            try:
+                code = compile(source, path, 'exec',
+                               dont_inherit=True, optimize=profile.optimize)
+            except SyntaxError as exc:
+                logger.error("%s: %s", path, exc)
+                continue
+            blobs.append(marshal.dumps(code))
+
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for blob in blobs:
+                marshal.loads(blob)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        result.append((name, len(blobs),
+                       sum(len(blob) for blob in blobs), best or 0.0))
+    return result
+
+
+def format_report(rows):
+    """ Creates a printable table from the result of compare_profiles(). """
+    lines = ['%-14s %7s %12s %10s %8s' % (
+        'profile', 'files', 'bytes', 'load ms', 'size')]
+    reference = rows[0][2] if len(rows) > 0 and rows[0][2] > 0 else 1
+    for name, count, size, elapsed in rows:
+        lines.append('%-14s %7d %12d %10.2f %7.1f%%' % (
+            name, count, size, elapsed * 1000.0, 100.0 * size / reference))
+    return '\n'.join(lines)
+
+
+def collect_sources(plugin):
+    """ Lists the python sources that a plugin would deploy. """
+    result = []
+    for module in plugin.modules:
+        for file in module.files:
+            if file.path_in.endswith('.py') and os.path.isfile(file.path_in):
+                result.append(file.path_in)
+    for file in plugin.ui_files + plugin.qrc_files:
+        if file.path_out is not None and os.path.isfile(file.path_out):
+            result.append(file.path_out)
+    return result
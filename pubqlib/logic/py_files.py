@@ -19,6 +19,8 @@ class PubPy(PubFile):
 
     """
 
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         """
         Constructor.
@@ -59,14 +61,7 @@ class PubPy(PubFile):
         Returns:
             PubPy instance
         """
-        result = PubPy()
         if os.path.isdir(path):
-            result.path_in = os.path.join(path, "__init__.py")
-            result.path_out = os.path.join(path, "__init__.pyc")
-        else:
-            result.path_in = path + ".py"
-            result.path_out = path + ".pyc"
-        result.use_compiled = not source_py
-        logger.debug("Constructed %r", result)
-        return result
+            path = os.path.join(path, "__init__")
+        return PubPy(path + ".py", path + ".pyc", not source_py)
 
@@ -7,8 +7,11 @@ from __future__ import print_function
 
 import logging
 import os
+from xml.etree import ElementTree
 
+from pubqlib.utils.fileio import atomic_output
 from .file_base import PubFile
+from .profile import get_profile
 
 logger = logging.getLogger('PubQrc')
 
@@ -16,13 +19,25 @@ logger = logging.getLogger('PubQrc')
 class PubQrc(PubFile):
     """
     This class represents a resource about to be converted.
+
+    Attributes:
+        rc_input (str):
+            The resource file given to the compiler, if not path_in
+            (e.g. a copy that uses optimized images).
+        shared_import (str):
+            Code appended to the generated module to load the module of
+            the resources it shares with other modules, or None.
     """
 
+    __slots__ = ('rc_input', 'shared_import')
+
     def __init__(self, *args, **kwargs):
         """
         Constructor.
         """
         super().__init__(*args, **kwargs)
+        self.rc_input = None
+        self.shared_import = None
 
     def __str__(self):
         """ Represent this object as a human-readable string. """
@@ -50,8 +65,30 @@ class PubQrc(PubFile):
                      self.path_in, result)
         return result
 
-    def compile(self, toolset, force=False):
-        """ Create path_out file from path_in. """
+    def referenced_files(self, qrc_path=None):
+        """ The files listed in a resource file (path_in by default). """
+        qrc_path = self.path_in if qrc_path is None else qrc_path
+        base_path = os.path.dirname(qrc_path)
+        try:
+            tree = ElementTree.parse(qrc_path)
+        except (OSError, ElementTree.ParseError):
+            return []
+        return [
+            os.path.join(base_path, element.text.strip())
+            for element in tree.iter('file') if element.text]
+
+    def dependencies(self):
+        """ The compiled resource file and all the files it references. """
+        qrc_path = self.rc_input or self.path_in
+        return [qrc_path] + self.referenced_files(qrc_path)
+
+    def compile(self, toolset, force=False, profile=None):
+        """
+        Create path_out file from path_in.
+
+        The generated python file is then adjusted and compiled
+        according to the deploy profile.
+        """
         if not self.use_compiled:
             logger.debug("%r will not be compiled because "
                          "use_compiled is false", self.path_in)
@@ -60,6 +97,20 @@ class PubQrc(PubFile):
         if self.path_out is None:
             self.path_out = self.default_output()
 
+        if not force and not self.changed():
+            logger.debug("%r is up to date", self.path_out)
+            return
+
         logger.debug("compiling %r to %r", self.path_in, self.path_out)
-        toolset.compile_rc_file(
-            in_file=self.path_in, out_file=self.path_out)
+        out_dir = os.path.dirname(self.path_out)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir, exist_ok=True)
+        profile = get_profile(None) if profile is None else profile
+        with atomic_output(self.path_out) as temp_path:
+            toolset.compile_rc_file(
+                in_file=self.rc_input or self.path_in, out_file=temp_path)
+            if self.shared_import:
+                with open(temp_path, 'a') as fout:
+                    fout.write(self.shared_import)
+            profile.process_generated(temp_path)
+        profile.compile_file(self.path_out)
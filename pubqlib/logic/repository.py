@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubRepository class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import hashlib
+import json
+import logging
+import os
+import re
+from urllib.parse import unquote, urlparse
+from xml.etree import ElementTree
+
+from pubqlib.utils import get_cache_dir
+from pubqlib.utils.fileio import write_atomic
+from .plugin import parse_dependencies
+from .vendor import version_key
+
+logger = logging.getLogger('pubq.repository')
+
+# Bump this when the cached form of plugins.xml changes.
+CACHE_VERSION = 1
+
+
+def repository_path(url):
+    """
+    Converts the location of a local repository to a directory.
+
+    Raises:
+        ValueError for repositories that are not local.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == 'file':
+        return unquote(parsed.path)
+    if parsed.scheme == '' or re.match(r'^[A-Za-z]$', parsed.scheme):
+        # A plain path (possibly with a Windows drive letter).
+        return url
+    raise ValueError("only local repositories are supported, not %r" % url)
+
+
+def version_compatible(qgis_version, minimum, maximum):
+    """
+    Tell if a QGis version is inside the range declared by a plugin.
+
+    Versions are compared on as many components as qgis_version has, so
+    `3` accepts every plugin that works with some 3.x release.
+
+    Arguments:
+        qgis_version (str):
+            The version of QGis, e.g. `3` or `3.28`.
+        minimum (str):
+            qgisMinimumVersion of the plugin or None.
+        maximum (str):
+            qgisMaximumVersion of the plugin or None. QGis assumes the
+            last release of the major version of minimum when missing.
+    """
+    parts = len(qgis_version.split('.'))
+
+    def key(version):
+        return version_key('.'.join(version.split('.')[:parts]))
+
+    if minimum and key(qgis_version) < key(minimum):
+        return False
+    if not maximum and minimum:
+        maximum = minimum.split('.')[0] + '.99'
+    if maximum and key(qgis_version) > key(maximum):
+        return False
+    return True
+
+
+class PubRepository(object):
+    """
+    A local plugin repository: a directory with a plugins.xml file
+    describing the plugins and their zip files.
+
+    The parsed plugins.xml is cached together with the size and the
+    modification time of the file; the cache is used as long as those
+    did not change (the local equivalent of a conditional request).
+    Dependency resolution results are memoized for the lifetime of the
+    instance, as long as plugins.xml stays the same.
+
+    Attributes:
+        url (str):
+            The location of the repository.
+        path (str):
+            The directory of the repository.
+        plugins (dict):
+            Maps lower-case plugin names to the list of available
+            versions, each a dictionary.
+        validator (list):
+            The size and modification time of plugins.xml when it was
+            parsed.
+    """
+
+    def __init__(self, url, cache_dir=None):
+        """
+        Constructor.
+
+        Arguments:
+            url (str):
+                The location of the repository (a `file://` url or a path).
+            cache_dir (str):
+                Where parsed indexes are kept; by default a directory in
+                the cache of the program.
+        """
+        super().__init__()
+        self.url = url
+        self.path = repository_path(url)
+        self.cache_dir = get_cache_dir('repositories') \
+            if cache_dir is None else cache_dir
+        self.plugins = {}
+        self.validator = None
+        self.selected = {}
+        self.closures = {}
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubRepository(%s)' % self.url
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubRepository(%r, cache_dir=%r)' % (self.url, self.cache_dir)
+
+    @property
+    def index_path(self):
+        """ The plugins.xml file. """
+        return os.path.join(self.path, 'plugins.xml')
+
+    @property
+    def cache_path(self):
+        """ The file where the parsed index is kept. """
+        return os.path.join(self.cache_dir, '%s.json' % hashlib.sha1(
+            os.path.abspath(self.index_path).encode('utf-8')).hexdigest())
+
+    def refresh(self):
+        """ Makes sure the index reflects the current plugins.xml. """
+        stat = os.stat(self.index_path)
+        validator = [stat.st_size, stat.st_mtime_ns]
+        if validator == self.validator:
+            return
+
+        self.selected = {}
+        self.closures = {}
+        try:
+            with open(self.cache_path, 'r') as fin:
+                cached = json.load(fin)
+        except (OSError, ValueError):
+            cached = {}
+        if cached.get('version') == CACHE_VERSION and \
+                cached.get('validator') == validator:
+            logger.debug("using the cached index of %s", self.url)
+            self.plugins = cached['plugins']
+        else:
+            logger.debug("parsing %s", self.index_path)
+            self.plugins = self.parse(self.index_path)
+            write_atomic(self.cache_path, json.dumps({
+                'version': CACHE_VERSION,
+                'validator': validator,
+                'plugins': self.plugins,
+            }))
+        self.validator = validator
+
+    @staticmethod
+    def parse(path):
+        """ Reads the plugins listed in a plugins.xml file. """
+        result = {}
+        for element in ElementTree.parse(path).getroot().iter(
+                'pyqgis_plugin'):
+            def text(tag):
+                child = element.find(tag)
+                if child is None or child.text is None:
+                    return None
+                return child.text.strip()
+
+            entry = {
+                'name': element.get('name', '').strip(),
+                'version': element.get('version', '').strip(),
+                'qgis_minimum_version': text('qgis_minimum_version'),
+                'qgis_maximum_version': text('qgis_maximum_version'),
+                'file_name': text('file_name'),
+                'download_url': text('download_url'),
+                'dependencies': parse_dependencies(
+                    text('plugin_dependencies')),
+            }
+            if len(entry['name']) == 0:
+                continue
+            result.setdefault(entry['name'].lower(), []).append(entry)
+        return result
+
+    def archive_path(self, entry):
+        """ The zip file of a plugin version. """
+        url = entry['download_url']
+        if url:
+            parsed = urlparse(url)
+            if parsed.scheme == 'file':
+                return unquote(parsed.path)
+            if parsed.scheme == '':
+                return os.path.join(self.path, url)
+        if entry['file_name']:
+            return os.path.join(self.path, entry['file_name'])
+        raise ValueError("%s %s has no local archive" % (
+            entry['name'], entry['version']))
+
+    def select(self, name, version, qgis_version):
+        """
+        Chooses the version of a plugin to install.
+
+        Arguments:
+            name (str):
+                The name of the plugin.
+            version (str):
+                The exact version or None for the highest one.
+            qgis_version (str):
+                The QGis version the plugin must work with.
+
+        Raises:
+            ValueError if no version matches.
+        """
+        key = (name.lower(), version, qgis_version)
+        if key in self.selected:
+            return self.selected[key]
+
+        candidates = [
+            entry for entry in self.plugins.get(name.lower(), [])
+            if (version is None or entry['version'] == version) and
+            version_compatible(
+                qgis_version, entry['qgis_minimum_version'],
+                entry['qgis_maximum_version'])]
+        if len(candidates) == 0:
+            raise ValueError("%s%s is not available for QGis %s in %s" % (
+                name, '' if version is None else '==' + version,
+                qgis_version, self.url))
+        result = max(candidates, key=lambda entry: version_key(
+            entry['version']))
+        self.selected[key] = result
+        return result
+
+    def closure(self, name, version, qgis_version, stack=()):
+        """
+        A plugin with all its direct and indirect dependencies.
+
+        Returns:
+            A dictionary mapping lower-case names to (entry, level); a
+            plugin only depends on plugins with lower levels.
+
+        Raises:
+            ValueError for missing plugins, circular dependencies and
+            conflicting versions.
+        """
+        key = (name.lower(), version, qgis_version)
+        if key in self.closures:
+            return self.closures[key]
+        if name.lower() in stack:
+            raise ValueError("circular dependency: %s" % ' -> '.join(
+                stack + (name.lower(),)))
+
+        entry = self.select(name, version, qgis_version)
+        result = {}
+        level = 0
+        for dep_name, dep_version in entry['dependencies']:
+            dependency = self.closure(
+                dep_name, dep_version, qgis_version, stack + (name.lower(),))
+            merge_closures(result, dependency)
+            level = max(level, dependency[dep_name.lower()][1] + 1)
+        merge_closures(result, {name.lower(): (entry, level)})
+        self.closures[key] = result
+        return result
+
+    def resolve(self, requirements, qgis_version):
+        """
+        Computes what needs to be installed for a list of requirements.
+
+        Arguments:
+            requirements (list):
+                (name, version or None) tuples.
+            qgis_version (str):
+                The QGis version the plugins must work with.
+
+        Returns:
+            A list of waves, each a list of plugin versions (dictionaries)
+            that only depend on plugins in previous waves.
+        """
+        self.refresh()
+        plan = {}
+        for name, version in requirements:
+            merge_closures(plan, self.closure(name, version, qgis_version))
+        waves = []
+        for entry, level in sorted(plan.values(), key=lambda x: x[1]):
+            while len(waves) <= level:
+                waves.append([])
+            waves[level].append(entry)
+        return [wave for wave in waves if len(wave) > 0]
+
+
+def merge_closures(target, source):
+    """ Adds the plugins of a closure to another one. """
+    for key, (entry, level) in source.items():
+        existing = target.get(key)
+        if existing is None:
+            target[key] = (entry, level)
+        elif existing[0]['version'] != entry['version']:
+            raise ValueError("%s is required both as %s and as %s" % (
+                entry['name'], existing[0]['version'], entry['version']))
+        else:
+            target[key] = (entry, max(level, existing[1]))
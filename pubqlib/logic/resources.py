@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the ResourceIndex class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import logging
+import os
+import posixpath
+from xml.etree import ElementTree
+
+from pubqlib.utils.fileio import HashCache, atomic_output
+from .status import format_size
+
+logger = logging.getLogger('pubq.resources')
+
+# The module holding the resources listed in more than one .qrc file.
+SHARED_NAME = '_pubq_shared_rc'
+
+# Appended to the resource modules that lost entries to the shared
+# module; resource modules may also be imported as top level modules.
+SHARED_IMPORT = '''
+# Resources shared with other modules (moved there by pubq).
+try:
+    from %(dots)s import %(name)s
+except ImportError:
+    import %(name)s
+'''
+
+
+def resource_path(prefix, name):
+    """ The path seen by Qt for a file of a resource file. """
+    return '/' + posixpath.normpath('%s/%s' % (prefix, name)).lstrip('/')
+
+
+def qrc_entries(qrc_path):
+    """
+    Lists the files of a resource file.
+
+    Returns:
+        A list of (language, resource path, file) tuples; the resource
+        path is the one seen by Qt, after the prefix and the alias.
+    """
+    base_path = os.path.dirname(os.path.abspath(qrc_path))
+    result = []
+    tree = ElementTree.parse(qrc_path)
+    for resource in tree.iter('qresource'):
+        prefix = resource.get('prefix', '/')
+        lang = resource.get('lang', '')
+        for element in resource.iter('file'):
+            if not element.text:
+                continue
+            name = element.text.strip()
+            result.append((
+                lang, resource_path(prefix, element.get('alias', name)),
+                os.path.join(base_path, name)))
+    return result
+
+
+def rewritten_qrc(qrc_path, replace=None, exclude=None, data=None):
+    """
+    The content of a copy of a resource file that can live in another
+    directory.
+
+    Each file is named by its absolute path, with an alias that keeps
+    the path seen by the application unchanged.
+
+    Arguments:
+        qrc_path (str):
+            The original resource file.
+        replace (dict):
+            Maps files to the ones that take their place.
+        exclude (set):
+            The (language, resource path) of the entries to leave out.
+        data (bytes):
+            The content of the original, when it is not (yet) the one
+            on disk.
+
+    Returns:
+        The content of the copy or None if it would only differ from
+        the original in the paths.
+    """
+    replace = {} if replace is None else replace
+    exclude = set() if exclude is None else exclude
+    base_path = os.path.dirname(os.path.abspath(qrc_path))
+    try:
+        if data is None:
+            root = ElementTree.parse(qrc_path).getroot()
+        else:
+            root = ElementTree.fromstring(data)
+    except (OSError, ElementTree.ParseError) as exc:
+        logger.debug("cannot read %s: %s", qrc_path, exc)
+        return None
+
+    changed = False
+    for resource in root.iter('qresource'):
+        prefix = resource.get('prefix', '/')
+        lang = resource.get('lang', '')
+        for element in list(resource.iter('file')):
+            if not element.text:
+                continue
+            name = element.text.strip()
+            alias = element.get('alias', name)
+            if (lang, resource_path(prefix, alias)) in exclude:
+                resource.remove(element)
+                changed = True
+                continue
+            file = os.path.join(base_path, name)
+            if file in replace:
+                file = replace[file]
+                changed = True
+            element.set('alias', alias)
+            element.text = file
+    if not changed:
+        return None
+    return ElementTree.tostring(root, encoding='utf-8')
+
+
+def write_if_changed(path, data):
+    """
+    Writes a file unless it already holds the same content.
+
+    Returns:
+        True if the file was written.
+    """
+    try:
+        with open(path, 'rb') as fin:
+            if fin.read() == data:
+                return False
+    except OSError:
+        pass
+    out_dir = os.path.dirname(path)
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    with atomic_output(path) as temp_path:
+        with open(temp_path, 'wb') as fout:
+            fout.write(data)
+    return True
+
+
+def shared_import(rel_path):
+    """
+    The code that makes a resource module load the shared module.
+
+    Arguments:
+        rel_path (str):
+            The path of the resource module in the deployed plugin.
+    """
+    depth = len(os.path.normpath(rel_path).split(os.sep))
+    return SHARED_IMPORT % {'dots': '.' * depth, 'name': SHARED_NAME}
+
+
+class ResourceIndex(object):
+    """
+    All the resources compiled into the modules of a plugin.
+
+    Qt merges the resources of all registered modules, so an entry
+    listed with the same path and the same content in several .qrc
+    files only needs to be compiled once: such entries are moved to a
+    shared module that the other modules import. Identical content
+    under different paths cannot be shared and is only reported.
+
+    Attributes:
+        qrc_paths (list):
+            The resource files of the plugin.
+        hashes (HashCache):
+            Hashes the files.
+        entries (dict):
+            Maps each resource file to its (language, resource path,
+            file) tuples.
+        shared (dict):
+            Maps the (language, resource path) of the shared entries to
+            their file.
+        saved (int):
+            The bytes that are no longer compiled more than once.
+        same_content (list):
+            (size, resource paths) of the files that are compiled more
+            than once under different paths.
+        conflicts (list):
+            The resource paths given to different files.
+    """
+
+    def __init__(self, qrc_paths, hashes=None):
+        """
+        Constructor.
+
+        Arguments:
+            qrc_paths (list):
+                The resource files of the plugin.
+            hashes (HashCache):
+                Hashes the files; by default the global cache.
+        """
+        super().__init__()
+        self.qrc_paths = list(qrc_paths)
+        self.hashes = HashCache() if hashes is None else hashes
+        self.entries = {}
+        self.shared = {}
+        self.saved = 0
+        self.same_content = []
+        self.conflicts = []
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'ResourceIndex(%d files)' % len(self.qrc_paths)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'ResourceIndex(%r)' % self.qrc_paths
+
+    def build(self, save=True):
+        """
+        Reads the resource files and finds the duplicates.
+
+        Arguments:
+            save (bool):
+                Save the hashes of the files in the cache.
+        """
+        for qrc_path in self.qrc_paths:
+            try:
+                self.entries[qrc_path] = [
+                    entry for entry in qrc_entries(qrc_path)
+                    if os.path.isfile(entry[2])]
+            except (OSError, ElementTree.ParseError) as exc:
+                logger.debug("cannot read %s: %s", qrc_path, exc)
+                self.entries[qrc_path] = []
+        files = set(
+            entry[2] for entries in self.entries.values()
+            for entry in entries)
+        digests = self.hashes.hash_many(sorted(files))
+        if save:
+            self.hashes.save()
+
+        # (language, resource path) -> {digest: [(qrc, file), ...]}
+        by_path = {}
+        for qrc_path in self.qrc_paths:
+            for lang, res_path, file in self.entries[qrc_path]:
+                by_path.setdefault((lang, res_path), {}).setdefault(
+                    digests[file], []).append((qrc_path, file))
+        # digest -> resource paths still compiled once each
+        by_digest = {}
+        for key, variants in sorted(by_path.items()):
+            if len(variants) > 1:
+                self.conflicts.append(key[1])
+                continue
+            digest, users = list(variants.items())[0]
+            by_digest.setdefault(digest, []).append(key[1])
+            if len(set(qrc_path for qrc_path, _ in users)) > 1:
+                self.shared[key] = users[0][1]
+                self.saved = self.saved + \
+                    os.path.getsize(users[0][1]) * (len(users) - 1)
+        sizes = {digests[file]: os.path.getsize(file) for file in files}
+        for digest, paths in sorted(by_digest.items()):
+            if len(paths) > 1:
+                self.same_content.append((sizes[digest], paths))
+        self.same_content.sort(key=lambda item: -item[0] * len(item[1]))
+        return self
+
+    def users(self, qrc_path):
+        """ The shared entries listed by a resource file. """
+        return set(
+            (lang, res_path)
+            for lang, res_path, _ in self.entries.get(qrc_path, [])
+            if (lang, res_path) in self.shared)
+
+    def shared_qrc(self, replace=None):
+        """
+        The content of the resource file of the shared module.
+
+        Arguments:
+            replace (dict):
+                Maps files to the ones that take their place.
+        """
+        replace = {} if replace is None else replace
+        root = ElementTree.Element('RCC', version='1.0')
+        for lang in sorted(set(lang for lang, _ in self.shared)):
+            resource = ElementTree.SubElement(root, 'qresource', prefix='/')
+            if lang:
+                resource.set('lang', lang)
+            for key, file in sorted(self.shared.items()):
+                if key[0] == lang:
+                    element = ElementTree.SubElement(
+                        resource, 'file', alias=key[1][1:])
+                    element.text = replace.get(file, file)
+        return ElementTree.tostring(root, encoding='utf-8')
+
+    def report(self, top=10):
+        """ The shared resources and the bytes saved, as a list of lines. """
+        result = [
+            '%d resources listed in more than one .qrc file are compiled '
+            'once, saving %s' % (len(self.shared), format_size(self.saved))]
+        if len(self.same_content) > 0:
+            wasted = sum(
+                size * (len(paths) - 1) for size, paths in self.same_content)
+            result.append(
+                '%d files are compiled more than once under different '
+                'paths (%s):' % (len(self.same_content), format_size(wasted)))
+            for size, paths in self.same_content[:top]:
+                result.append('  %10s  %s' % (
+                    format_size(size), ', '.join(paths)))
+        for res_path in self.conflicts:
+            result.append(
+                'warning: %s is given to different files' % res_path)
+        return result
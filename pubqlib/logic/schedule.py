@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the CompileSchedule class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+
+from pubqlib.utils.fileio import write_atomic
+
+logger = logging.getLogger('pubq.schedule')
+
+# Seconds per byte of input assumed for a kind of unit that was never
+# compiled; only the order of the estimates matters.
+DEFAULT_RATE = 1e-6
+
+
+def input_size(paths):
+    """ The total size of the files that exist in a list. """
+    result = 0
+    for path in paths:
+        try:
+            result = result + os.path.getsize(path)
+        except OSError:
+            pass
+    return result
+
+
+def makespan(durations, jobs):
+    """
+    How long a list of units takes when each one is started, in order,
+    as soon as one of `jobs` slots is free.
+    """
+    slots = [0.0] * max(1, jobs)
+    for duration in durations:
+        heapq.heapreplace(slots, slots[0] + duration)
+    return max(slots)
+
+
+class BuildHistory(object):
+    """
+    The durations of the units compiled by previous builds of a plugin.
+
+    Only units that actually ran a compiler are recorded; outputs taken
+    from the artefact cache say nothing about the cost of a unit. The
+    duration of a unit is averaged with the previous one, so a single
+    slow build does not reorder everything.
+
+    Attributes:
+        path (str):
+            The file holding the history.
+        units (dict):
+            Maps unit keys to their kind, input size and duration.
+        changed (bool):
+            There are records that were not saved yet.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor.
+
+        Arguments:
+            path (str):
+                The file holding the history.
+        """
+        super().__init__()
+        self.path = path
+        self.units = {}
+        self.changed = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'BuildHistory(%d units)' % len(self.units)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'BuildHistory(%r)' % self.path
+
+    def load(self):
+        """ Reads the history from disk. """
+        self.units = {}
+        self.changed = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fin:
+                self.units = json.load(fin)['units']
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            if os.path.exists(self.path):
+                logger.debug("ignoring the history in %s: %s",
+                             self.path, exc)
+
+    def save(self):
+        """ Writes the history if it changed. """
+        with self.lock:
+            if not self.changed:
+                return
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            write_atomic(self.path, json.dumps(
+                {'units': self.units}, indent=1, sort_keys=True))
+            self.changed = False
+
+    def record(self, unit, kind, size, duration):
+        """
+        Records the duration of a compiled unit.
+
+        Arguments:
+            unit (str):
+                The key of the unit (as in the journal).
+            kind (str):
+                The kind of unit (PubUi, PubQrc, PubModule).
+            size (int):
+                The size of its inputs, in bytes.
+            duration (float):
+                How long the unit took, in seconds.
+        """
+        with self.lock:
+            previous = self.units.get(unit)
+            if previous is not None:
+                duration = (previous['time'] + duration) / 2
+            self.units[unit] = {
+                'kind': kind, 'size': size, 'time': round(duration, 4)}
+            self.changed = True
+
+    def rate(self, kind):
+        """ The seconds per byte of input seen for a kind of unit. """
+        size = 0
+        duration = 0.0
+        for entry in self.units.values():
+            if entry.get('kind') == kind:
+                size = size + entry['size']
+                duration = duration + entry['time']
+        if size == 0 or duration == 0:
+            return DEFAULT_RATE
+        return duration / size
+
+    def estimate(self, unit, kind, size):
+        """
+        How long a unit is expected to take.
+
+        Returns:
+            The duration in seconds and where it comes from: 'history'
+            for units compiled before, 'size' for the others.
+        """
+        entry = self.units.get(unit)
+        if entry is not None:
+            return entry['time'], 'history'
+        return size * self.rate(kind), 'size'
+
+
+class CompileSchedule(object):
+    """
+    The order in which a set of units is compiled.
+
+    With several jobs the units are started longest first (longest
+    processing time ordering), so the pool does not sit idle at the
+    end while one large form or resource file compiles alone. The
+    expected duration of a unit comes from the build history or, for
+    units that were never compiled, from the size of its inputs.
+
+    Attributes:
+        history (BuildHistory):
+            Gives the estimates and records the actual durations.
+        jobs (int):
+            The number of units compiled at the same time.
+        items (list):
+            One dictionary per unit, in the order they are started,
+            with the unit, kind, size, estimate, source of the estimate
+            and, once run, the actual duration.
+        naive (float):
+            The expected makespan when units are started in the order
+            they were listed.
+        predicted (float):
+            The expected makespan of this schedule.
+        actual (float):
+            The measured makespan, once run.
+    """
+
+    def __init__(self, history, jobs=1):
+        """
+        Constructor.
+
+        Arguments:
+            history (BuildHistory):
+                Gives the estimates and records the actual durations.
+            jobs (int):
+                The number of units compiled at the same time.
+        """
+        super().__init__()
+        self.history = history
+        self.jobs = max(1, jobs)
+        self.items = []
+        self.naive = 0.0
+        self.predicted = 0.0
+        self.actual = None
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'CompileSchedule(%d units, %d jobs)' % (
+            len(self.items), self.jobs)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'CompileSchedule(%r, jobs=%r)' % (self.history, self.jobs)
+
+    def add(self, unit, kind, inputs, payload):
+        """
+        Adds a unit to compile.
+
+        Arguments:
+            unit (str):
+                The key of the unit.
+            kind (str):
+                The kind of unit (PubUi, PubQrc, PubModule).
+            inputs (list):
+                The files that are compiled; their size is the estimate
+                for units that were never compiled.
+            payload:
+                Passed to the function that compiles the unit.
+        """
+        size = input_size(inputs)
+        estimate, source = self.history.estimate(unit, kind, size)
+        self.items.append({
+            'unit': unit, 'kind': kind, 'size': size,
+            'estimate': estimate, 'source': source,
+            'actual': None, 'payload': payload})
+
+    def order(self):
+        """ Sorts the units longest first and computes the predictions. """
+        self.naive = makespan(
+            [item['estimate'] for item in self.items], self.jobs)
+        if self.jobs > 1:
+            self.items.sort(key=lambda item: (-item['estimate'], item['unit']))
+        self.predicted = makespan(
+            [item['estimate'] for item in self.items], self.jobs)
+        return self
+
+    def run(self, function, executor=None):
+        """
+        Compiles the units in the order of the schedule.
+
+        Arguments:
+            function:
+                Called with the payload of each unit; it returns True if
+                a compiler ran, so the duration is worth recording.
+            executor (Executor):
+                Runs the units concurrently; its queue must start them in
+                the order they are submitted (as ThreadPoolExecutor does).
+        """
+        def run_one(item):
+            start = time.perf_counter()
+            compiled = function(item['payload'])
+            item['actual'] = time.perf_counter() - start
+            if compiled:
+                self.history.record(
+                    item['unit'], item['kind'], item['size'], item['actual'])
+
+        start = time.perf_counter()
+        if executor is None:
+            for item in self.items:
+                run_one(item)
+        else:
+            for future in [
+                    executor.submit(run_one, item) for item in self.items]:
+                future.result()
+        self.actual = time.perf_counter() - start
+        self.history.save()
+
+    def report(self, top=10):
+        """ The schedule and its makespans, as a list of lines. """
+        result = [
+            '%d units on %d jobs: predicted %.2fs (%.2fs in listed order), '
+            'actual %s' % (
+                len(self.items), self.jobs, self.predicted, self.naive,
+                'n/a' if self.actual is None else '%.2fs' % self.actual)]
+        for item in self.items[:top]:
+            result.append('  %8.3fs %-7s %8s  %s' % (
+                item['estimate'], item['source'],
+                '' if item['actual'] is None else '%.3fs' % item['actual'],
+                item['unit']))
+        if len(self.items) > top:
+            result.append('  ... %d more' % (len(self.items) - top))
+        return result
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubStatus class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import logging
+import os
+
+from .journal import stat_signature
+from .manifest import MANIFEST_NAME
+
+logger = logging.getLogger('pubq.status')
+
+# Directories in the deployed tree that are created by python itself.
+IGNORED_DEPLOYED = ('__pycache__',)
+
+
+def format_size(size):
+    """ A short human-readable size. """
+    if size < 1024:
+        return '%d B' % size
+    for unit in ('KiB', 'MiB', 'GiB'):
+        size = size / 1024.0
+        if size < 1024 or unit == 'GiB':
+            return '%.1f %s' % (size, unit)
+
+
+class PubStatus(object):
+    """
+    Compares a plugin with its build outputs and with a deployed copy.
+
+    Nothing is written: neither the outputs, nor the journal, nor the
+    caches. Files are compared by their stat data first (against the
+    journal of the previous build and deploy) and their content is
+    hashed only when that is not conclusive.
+
+    Attributes:
+        plugin (PubPlugin):
+            The plugin (or the variant of a plugin) being compared.
+        toolset (Toolset):
+            The tools that would build the plugin.
+        profile (DeployProfile):
+            The profile that would build the plugin.
+        target (str):
+            The directory where the plugin is deployed.
+        stale (list):
+            (unit, seconds it took last time or None, input bytes) for the
+            units that need to be rebuilt.
+        modified (list):
+            Deployed files that differ from their source.
+        missing (list):
+            Files that should be deployed but are not.
+        extra (list):
+            Deployed files that are not part of the plugin.
+        unbuilt (list):
+            Files to deploy that were not generated yet.
+        unchanged (int):
+            The number of deployed files that are up to date.
+        copy_bytes (int):
+            The size of the files that a deploy would copy.
+    """
+
+    def __init__(self, plugin, toolset, profile, target):
+        """
+        Constructor.
+
+        Arguments:
+            plugin (PubPlugin):
+                The plugin being compared.
+            toolset (Toolset):
+                The tools that would build the plugin.
+            profile (DeployProfile):
+                The profile that would build the plugin.
+            target (str):
+                The directory where the plugin is deployed (the directory
+                named after the plugin).
+        """
+        super().__init__()
+        self.plugin = plugin
+        self.toolset = toolset
+        self.profile = profile
+        self.target = target
+        self.stale = []
+        self.modified = []
+        self.missing = []
+        self.extra = []
+        self.unbuilt = []
+        self.unchanged = 0
+        self.copy_bytes = 0
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubStatus(%s)' % self.plugin.name
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubStatus(%r, %r, %r, %r)' % (
+            self.plugin, self.toolset, self.profile, self.target)
+
+    @property
+    def up_to_date(self):
+        """ Tell if nothing needs to be built or deployed. """
+        return len(self.stale) + len(self.modified) + len(self.missing) + \
+            len(self.extra) + len(self.unbuilt) == 0
+
+    def compute(self):
+        """ Performs the comparison. """
+        self.compare_outputs()
+        self.compare_deployed()
+        return self
+
+    def compare_outputs(self):
+        """ Finds the compile units that a build would redo. """
+        plugin = self.plugin
+        journal = plugin.get_journal()
+        units = []
+        for file in plugin.resource_files():
+            unit, in_hash = plugin.resource_unit(
+                file, self.toolset, self.profile)
+            units.append((unit, in_hash, file.dependencies()))
+        for module in plugin.modules:
+            unit, in_hash = plugin.module_unit(module, self.profile)
+            units.append((unit, in_hash, [
+                file.path_in for file in module.files
+                if file.path_in.endswith('.py')]))
+
+        for unit, in_hash, inputs in units:
+            # A copy of a resource file that the build would rewrite.
+            if plugin.unwritten.isdisjoint(inputs) and \
+                    journal.is_done(unit, in_hash):
+                continue
+            entry = journal.entries.get(unit, {})
+            size = 0
+            for path in inputs:
+                try:
+                    size = size + os.path.getsize(path)
+                except OSError:
+                    pass
+            self.stale.append((unit, entry.get('time'), size))
+
+    def expected_files(self):
+        """ Maps the relative paths of deployed files to their source. """
+        return {
+            rel_path: file
+            for file, rel_path in self.plugin.iter_deploy_pairs()}
+
+    def compare_deployed(self):
+        """ Finds the deployed files that a deploy would change. """
+        expected = self.expected_files()
+        journal = self.plugin.get_journal()
+        hashes = journal.hashes
+
+        for rel_path, source in sorted(expected.items()):
+            output = os.path.join(self.target, rel_path)
+            try:
+                in_stat = os.stat(source)
+            except OSError:
+                self.unbuilt.append(rel_path)
+                continue
+            try:
+                out_stat = os.stat(output)
+            except OSError:
+                self.missing.append(rel_path)
+                self.copy_bytes = self.copy_bytes + in_stat.st_size
+                continue
+
+            unit, in_hash = self.plugin.copy_unit(source, output, in_stat)
+            entry = journal.entries.get(unit)
+            if entry is not None and entry['in'] == in_hash and \
+                    len(entry['out']) == 1 and \
+                    entry['out'][0][1] == stat_signature(out_stat):
+                # Copied by the last deploy and not touched since.
+                self.unchanged = self.unchanged + 1
+                continue
+
+            if in_stat.st_size == out_stat.st_size and \
+                    hashes.hash(source) == hashes.hash(output):
+                self.unchanged = self.unchanged + 1
+                continue
+            self.modified.append(rel_path)
+            self.copy_bytes = self.copy_bytes + in_stat.st_size
+
+        if not os.path.isdir(self.target):
+            return
+        for root, dirs, files in os.walk(self.target):
+            dirs[:] = [name for name in dirs if name not in IGNORED_DEPLOYED]
+            for name in files:
+                rel_path = os.path.relpath(
+                    os.path.join(root, name), self.target)
+                if rel_path not in expected and \
+                        rel_path not in ('metadata.txt', MANIFEST_NAME):
+                    self.extra.append(rel_path)
+        self.extra.sort()
+
+    def estimate(self):
+        """
+        Estimates the cost of bringing the deployed plugin up to date.
+
+        Returns:
+            (seconds, units without a known duration, input bytes to
+            compile, bytes to copy)
+        """
+        seconds = 0.0
+        unknown = 0
+        compile_bytes = 0
+        for unit, duration, size in self.stale:
+            compile_bytes = compile_bytes + size
+            if duration is None:
+                unknown = unknown + 1
+            else:
+                seconds = seconds + duration
+        return seconds, unknown, compile_bytes, self.copy_bytes
+
+    def unit_name(self, unit):
+        """ The unit key with paths relative to the plugin. """
+        kind, path = unit.split(':', 1)
+        return '%s:%s' % (kind, self.plugin.relative_path(path))
+
+    def summary(self):
+        """ A few lines describing the comparison. """
+        seconds, unknown, compile_bytes, copy_bytes = self.estimate()
+        result = [
+            '%s in %s: %d stale units, %d modified, %d missing, '
+            '%d extra, %d unbuilt, %d up to date' % (
+                self.plugin.name, self.target,
+                len(self.stale), len(self.modified),
+                len(self.missing), len(self.extra), len(self.unbuilt),
+                self.unchanged)]
+        if len(self.stale) > 0 or copy_bytes > 0:
+            estimate = '  estimated rebuild: %.2f s' % seconds
+            if unknown > 0:
+                estimate = estimate + ' (+%d units never built)' % unknown
+            result.append(
+                estimate + ', %s to compile, %s to copy' % (
+                    format_size(compile_bytes), format_size(copy_bytes)))
+        return result
+
+    def details(self):
+        """ One line for each difference. """
+        result = []
+        for unit, duration, size in self.stale:
+            result.append('stale     %s' % self.unit_name(unit))
+        for label, paths in (('unbuilt', self.unbuilt),
+                             ('modified', self.modified),
+                             ('missing', self.missing),
+                             ('extra', self.extra)):
+            for path in paths:
+                result.append('%-9s %s' % (label, path))
+        return result
@@ -7,13 +7,26 @@ from __future__ import print_function
 
 import logging
 import os
+import threading
 
-from pubqlib.logic.plugin import PubPlugin
 from pubqlib.logic.toolset import Toolset
 
 logger = logging.getLogger('TheApp')
 
 
+def installed_version(path):
+    """ The version of the plugin installed in a directory, if any. """
+    import configparser
+
+    config = configparser.ConfigParser(allow_no_value=True)
+    try:
+        with open(os.path.join(path, 'metadata.txt'), 'r') as fin:
+            config.read_file(fin)
+    except (OSError, configparser.Error):
+        return None
+    return config.get('general', 'version', fallback=None)
+
+
 class TheApp(object):
     """
     This class .
@@ -33,7 +46,21 @@ class TheApp(object):
         self.toolset = Toolset()
         self.source_py = False
         self.destination = None
+        self.profile = None
+        self.check = True
+        self.targets = None
+        self.link = False
+        self.lazy_init = False
+        self.optimize_images = False
+        self.workers = None
+        self.jobs = None
+        self.checker = None
         self.plugins = []
+        self.plugin_cache = {}
+        self.plugin_cache_enabled = False
+        self.qgis_version = None
+        self.checker_lock = threading.Lock()
+        self.repositories = {}
 
     def __str__(self):
         """ Represent this object as a human-readable string. """
@@ -44,30 +71,395 @@ class TheApp(object):
         return 'TheApp()'
 
     def install(self, sources, force_recompile=False, clear_opt='error'):
-        """ The install command is implemented here. """
+        """
+        The install command is implemented here.
+
+        Returns:
+            True if all the plugins were installed.
+        """
         logger.debug("Installing %r (forced=%r, clear_opt=%r",
                      sources, force_recompile, clear_opt)
-        if not os.path.isdir(self.destination):
-            logger.debug("Destination %s does not exist; creating ...",
-                         self.destination)
-            os.makedirs(self.destination)
+        from pubqlib.logic.archive import is_plugin_archive
 
+        archives = [
+            source for source in sources if is_plugin_archive(source)]
+        result = True
+        for archive in archives:
+            if not self.install_archive(os.path.abspath(archive), clear_opt):
+                result = False
+        self.plugins = []
         for source in sources:
-            source = os.path.abspath(source)
-            plugin = PubPlugin()
-            plugin.init_from_directory(source, source_py=self.source_py)
-            self.plugins.append(plugin)
+            if source in archives:
+                continue
+            plugin = self.try_load_plugin(source)
+            if plugin is None:
+                result = False
+            else:
+                self.plugins.append(plugin)
         logger.debug("Collected %d plugins", len(self.plugins))
 
+        if self.check:
+            checked = [
+                plugin for plugin in self.plugins
+                if self.check_plugin(plugin)]
+            if len(checked) != len(self.plugins):
+                result = False
+            self.plugins = checked
         for plugin in self.plugins:
-            plugin.compile(toolset=self.toolset, force=force_recompile)
-            plugin.deploy(self.destination, clear_opt=clear_opt)
+            if not self.build_plugin(
+                    plugin, force_recompile=force_recompile,
+                    clear_opt=clear_opt):
+                result = False
 
         logger.debug("Installing done")
+        return result
+
+    def check_plugin(self, plugin):
+        """
+        Validates a plugin before it is deployed.
+
+        Returns:
+            True if the plugin passed the checks.
+        """
+        with self.checker_lock:
+            if self.checker is None:
+                from pubqlib.logic.checker import PubChecker
+                self.checker = PubChecker()
+            if self.checker.check(plugin):
+                return True
+        logger.error("Plugin %s will not be deployed because "
+                     "it failed the checks", plugin.source_path)
+        return False
+
+    def build_plugin(self, plugin, force_recompile=False, clear_opt='error'):
+        """
+        Compiles a plugin and deploys it for each target.
+
+        Arguments:
+            plugin (PubPlugin):
+                The plugin to build.
+            force_recompile (bool):
+                Compile even if the outputs are up to date.
+            clear_opt (str):
+                What to do when the plugin is already installed.
+
+        Returns:
+            True if the plugin was deployed for all the targets.
+        """
+        plugin.lazy_init = self.lazy_init
+        # Linked files must stay the sources.
+        plugin.optimize_images = self.optimize_images and not self.link
+        if self.targets is None:
+            destination = self.target_destination(None)
+            try:
+                plugin.compile(toolset=self.toolset, force=force_recompile,
+                               profile=self.profile, workers=self.workers,
+                               jobs=self.jobs)
+            except (OSError, ValueError) as exc:
+                logger.error("Plugin %s was not built: %s",
+                             plugin.source_path, exc)
+                return False
+            return plugin.deploy(
+                destination, clear_opt=clear_opt, link=self.link)
+        else:
+            toolsets = {
+                target: self.toolset.for_target(target)
+                for target in self.targets}
+            try:
+                variants = plugin.compile_targets(
+                    toolsets, force=force_recompile, profile=self.profile,
+                    workers=self.workers, jobs=self.jobs)
+            except (OSError, ValueError) as exc:
+                logger.error("Plugin %s was not built: %s",
+                             plugin.source_path, exc)
+                return False
+            result = True
+            for target in self.targets:
+                if not variants[target].deploy(
+                        self.target_destination(target), clear_opt=clear_opt,
+                        link=self.link):
+                    result = False
+            return result
+
+    def export(self, sources, fileobj, compression=None,
+               force_recompile=False):
+        """
+        Builds plugins and writes them to a tar stream instead of
+        deploying them.
+
+        Arguments:
+            sources (list):
+                The source directories of the plugins.
+            fileobj:
+                Where the stream is written.
+            compression (str):
+                How the stream is compressed (gz, bz2, xz) or None.
+            force_recompile (bool):
+                Compile even if the outputs are up to date.
+
+        Returns:
+            True if all the plugins were exported.
+
+        Raises:
+            ValueError: more than one target was selected; an archive
+                holds a single build of each plugin.
+        """
+        from pubqlib.logic.export import PubTarExport
+        from pubqlib.logic.status import format_size
+
+        if self.targets is not None and len(self.targets) != 1:
+            raise ValueError(
+                "an archive is built for a single target, not %s" % (
+                    ', '.join(self.targets) or 'none'))
+        plugins = [self.try_load_plugin(source) for source in sources]
+        result = None not in plugins
+        plugins = [plugin for plugin in plugins if plugin is not None]
+        if self.check:
+            checked = [
+                plugin for plugin in plugins if self.check_plugin(plugin)]
+            if len(checked) != len(plugins):
+                result = False
+            plugins = checked
+
+        with PubTarExport(fileobj, compression=compression) as export:
+            for plugin in plugins:
+                plugin.lazy_init = self.lazy_init
+                plugin.optimize_images = self.optimize_images
+                if self.targets is None:
+                    plugin.compile(toolset=self.toolset,
+                                   force=force_recompile,
+                                   profile=self.profile)
+                else:
+                    target, = self.targets
+                    plugin = plugin.compile_targets(
+                        {target: self.toolset.for_target(target)},
+                        force=force_recompile, profile=self.profile)[target]
+                export.add_plugin(plugin)
+        logger.info("exported %d files of %d plugins (%s)",
+                    export.files, len(plugins), format_size(export.size))
+        return result
+
+    def install_archive(self, path, clear_opt='error', targets=None,
+                        version=None):
+        """
+        Installs a released plugin from its zip file.
+
+        The archive is already built, so it is neither checked nor
+        compiled; it is extracted into the destination of each target.
+
+        Arguments:
+            path (str):
+                The zip file.
+            clear_opt (str):
+                What to do when the plugin is already installed.
+            targets (list):
+                Where to install; by default the targets of the
+                application.
+            version (str):
+                The version of the plugin in the archive, if known; the
+                installation is skipped where this version is installed.
+
+        Returns:
+            True if the plugin was installed everywhere.
+        """
+        import zipfile
+        from pubqlib.logic.archive import PubArchive
+
+        try:
+            archive = PubArchive(path).load()
+        except (OSError, ValueError, zipfile.BadZipFile) as exc:
+            logger.error("Cannot install %s: %s", path, exc)
+            return False
+        if targets is None:
+            targets = [None] if self.targets is None else self.targets
+        result = True
+        for target in targets:
+            destination = self.target_destination(target)
+            if version is not None and version == installed_version(
+                    os.path.join(destination, archive.target_name)):
+                logger.info("%s %s is already installed in %s",
+                            archive.target_name, version, destination)
+                continue
+            if not archive.deploy(destination, clear_opt=clear_opt):
+                logger.error("Plugin %s was not installed completely",
+                             path)
+                result = False
+        return result
+
+    def install_from_repo(self, url, names, clear_opt='error'):
+        """
+        Installs plugins and their dependencies from a local repository.
+
+        Plugins that do not depend on each other are installed
+        concurrently.
 
-    def get_plugin_directory(self):
+        Arguments:
+            url (str):
+                The location of the repository.
+            names (list):
+                Plugin names, optionally followed by `==version`, or
+                source directories of plugins whose dependencies are to
+                be installed before the plugins themselves.
+            clear_opt (str):
+                What to do when a plugin is already installed.
+
+        Returns:
+            True if all plugins were installed.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from pubqlib.logic.plugin import parse_dependencies
+        from pubqlib.logic.repository import PubRepository
+
+        repository = self.repositories.get(url)
+        if repository is None:
+            repository = PubRepository(url)
+            self.repositories[url] = repository
+
+        requirements = []
+        sources = []
+        for name in names:
+            if os.path.isdir(name):
+                plugin = self.try_load_plugin(name)
+                if plugin is None:
+                    return False
+                requirements.extend(plugin.required_plugins())
+                sources.append(name)
+            else:
+                requirements.extend(parse_dependencies(name))
+
+        targets = [None] if self.targets is None else self.targets
+        for target in targets:
+            qgis_version = self.qgis_version or \
+                ('3' if target == 'qt5' else '2')
+            try:
+                waves = [
+                    [(entry, repository.archive_path(entry))
+                     for entry in wave]
+                    for wave in repository.resolve(
+                        requirements, qgis_version)]
+            except (OSError, ValueError) as exc:
+                logger.error("Cannot install from %s: %s", url, exc)
+                return False
+
+            # Created here so that the threads below do not race for it.
+            self.target_destination(target)
+            for wave in waves:
+                logger.debug("installing %s", ', '.join(
+                    '%s %s' % (entry['name'], entry['version'])
+                    for entry, path in wave))
+                with ThreadPoolExecutor() as executor:
+                    outcomes = list(executor.map(
+                        lambda item: self.install_archive(
+                            item[1], clear_opt=clear_opt, targets=[target],
+                            version=item[0]['version']),
+                        wave))
+                if not all(outcomes):
+                    # Plugins in later waves would miss a dependency.
+                    return False
+
+        if len(sources) > 0:
+            return self.install(sources, clear_opt=clear_opt)
+        return True
+
+    def load_plugin(self, source):
+        """
+        Creates a plugin from a source directory.
+
+        When the cache is enabled (the daemon tracks changes in source
+        directories) a plugin that was loaded before is reused.
+
+        Arguments:
+            source (str):
+                The absolute path of the plugin source.
+
+        Returns:
+            A PubPlugin instance.
+
+        Raises:
+            ValueError: the configuration of the plugin is not valid.
+        """
+        key = (source, self.source_py)
+        if self.plugin_cache_enabled:
+            plugin = self.plugin_cache.get(key)
+            if plugin is not None:
+                logger.debug("reusing cached plugin %s", source)
+                return plugin
+
+        from pubqlib.logic.plugin import PubPlugin
+
+        plugin = PubPlugin()
+        plugin.init_from_directory(source, source_py=self.source_py)
+        if self.plugin_cache_enabled:
+            self.plugin_cache[key] = plugin
+        return plugin
+
+    def try_load_plugin(self, source):
+        """
+        Creates a plugin from a source directory, logging the errors.
+
+        Arguments:
+            source (str):
+                The path of the plugin source.
+
+        Returns:
+            A PubPlugin instance or None if the plugin cannot be used.
+        """
+        try:
+            return self.load_plugin(os.path.abspath(source))
+        except (OSError, ValueError) as exc:
+            logger.error("Cannot load plugin %s: %s", source, exc)
+            return None
+
+    def invalidate_plugin(self, source):
+        """ Drops the cached plugins loaded from a source directory. """
+        for key in list(self.plugin_cache):
+            if key[0] == source:
+                logger.debug("plugin %s is no longer cached", source)
+                self.plugin_cache.pop(key, None)
+
+    def target_destination(self, target, create=True):
+        """
+        Decides where the plugins built for a target are installed.
+
+        Without an explicit destination the plugin directory of the QGis
+        version using that target is used. When several targets are
+        built into an explicit destination each gets a sub-directory.
+
+        Arguments:
+            target (str):
+                The name of the target or None when not building for
+                explicit targets.
+            create (bool):
+                Create the directory if it does not exist.
+        """
+        if self.destination is None:
+            result = self.get_plugin_directory(target)
+        elif target is not None and len(self.targets) > 1:
+            result = os.path.join(self.destination, target)
+        else:
+            result = self.destination
+
+        if create and not os.path.isdir(result):
+            logger.debug("Destination %s does not exist; creating ...",
+                         result)
+            os.makedirs(result, exist_ok=True)
+        return result
+
+    def get_plugin_directory(self, target=None):
+        """
+        The directory where QGis looks for python plugins.
+
+        Arguments:
+            target (str):
+                qt4 for QGis 2, qt5 for the default profile of QGis 3;
+                QGis 2 is assumed if None.
+        """
         home = os.path.expanduser('~')
-        self.destination = os.path.join(home, '.qgis2', 'python', 'plugins')
-        logger.debug("detected qgis plugin directory is at %s",
-                     self.destination)
-        return self.destination
+        if target == 'qt5':
+            result = os.path.join(
+                home, '.local', 'share', 'QGIS', 'QGIS3', 'profiles',
+                'default', 'python', 'plugins')
+        else:
+            result = os.path.join(home, '.qgis2', 'python', 'plugins')
+        logger.debug("detected qgis plugin directory is at %s", result)
+        return result
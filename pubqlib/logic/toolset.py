@@ -5,63 +5,157 @@ Contains the definition of the Toolset class.
 from __future__ import unicode_literals
 from __future__ import print_function
 
+import argparse
 import logging
 import os
 import subprocess
+import sys
 
 logger = logging.getLogger('Toolset')
 
+# The names of the tools for each supported Qt flavour; without a target
+# the first tool that is found, in any flavour, is used.
+TARGETS = {
+    'qt4': {
+        'lupdate': ('pylupdate4',),
+        'lrelease': ('lrelease-qt4', 'lrelease'),
+        'rc_compiler': ('pyrcc4',),
+        'ui_compiler': ('pyuic4',),
+    },
+    'qt5': {
+        'lupdate': ('pylupdate5',),
+        'lrelease': ('lrelease-qt5', 'lrelease'),
+        'rc_compiler': ('pyrcc5',),
+        'ui_compiler': ('pyuic5',),
+    },
+}
+# The version of Python that QGis runs for each Qt flavour, used when
+# the interpreter of a target is not given; other flavours are assumed
+# to run the same Python as pubq.
+PYTHON_VERSIONS = {
+    'qt4': (2, 7),
+}
+DEFAULT_TOOLS = {
+    'lupdate': ('pylupdate5', 'pylupdate4'),
+    'lrelease': ('lrelease', 'lrelease-qt5', 'lrelease-qt4'),
+    'rc_compiler': ('pyrcc5', 'pyrcc4'),
+    'ui_compiler': ('pyuic5', 'pyuic4'),
+}
+
 
 class Toolset(object):
     """
     This class groups tools used by the program.
 
     Attributes:
-
+        target (str):
+            The Qt flavour (a key in TARGETS) or None to use any.
+        python (str):
+            The Python interpreter that QGis runs for this flavour,
+            if known.
+        pythons (dict):
+            Maps Qt flavours to the interpreters given by the user.
     """
 
-    def __init__(self):
+    def __init__(self, target=None):
         """
         Constructor.
 
         Arguments:
-
+            target (str):
+                The Qt flavour (a key in TARGETS) or None to use any.
         """
         super().__init__()
+        self.target = target
         self.lupdate = None
         self.lrelease = None
         self.rc_compiler = None
         self.ui_compiler = None
         self.zip_tool = None
-        self.find()
+        self.found = False
+        self.found_compilers = (None, None)
+        self.python = None
+        self.pythons = {}
+        self.found_version = None
 
     def __str__(self):
         """ Represent this object as a human-readable string. """
-        return 'Toolset()'
+        return 'Toolset(%s)' % (self.target or 'any')
 
     def __repr__(self):
         """ Represent this object as a python constructor. """
-        return 'Toolset()'
+        return 'Toolset(target=%r)' % self.target
 
     def find(self):
         """ Locates the tools. """
-        self.lupdate = find_app(('pylupdate5', 'pylupdate4'))
-        self.lrelease = find_app(('lrelease', 'lrelease-qt5', 'lrelease-qt4'))
-        self.rc_compiler = find_app(('pyrcc5', 'pyrcc4'))
-        self.ui_compiler = find_app(('pyuic5', 'pyuic4'))
+        self.found = True
+        names = DEFAULT_TOOLS if self.target is None else TARGETS[self.target]
+        self.lupdate = find_app(names['lupdate'])
+        self.lrelease = find_app(names['lrelease'])
+        self.rc_compiler = find_app(names['rc_compiler'])
+        self.ui_compiler = find_app(names['ui_compiler'])
         self.zip_tool = find_app(('zip', '7z'))
+        self.found_compilers = (self.rc_compiler, self.ui_compiler)
         logger.debug("rc_compiler: %r", self.rc_compiler)
         logger.debug("ui_compiler: %r", self.ui_compiler)
         logger.debug("lupdate: %r", self.lupdate)
         logger.debug("lrelease: %r", self.lrelease)
         logger.debug("zip_tool: %r", self.zip_tool)
 
+    def for_target(self, target):
+        """
+        Creates the toolset for a Qt flavour.
+
+        Arguments:
+            target (str):
+                A key in TARGETS.
+        """
+        result = Toolset(target=target)
+        result.python = self.pythons.get(target)
+        result.find()
+        if result.ui_compiler is None or result.rc_compiler is None:
+            logger.error("The tools for %s could not be found", target)
+        return result
+
+    def python_version(self):
+        """
+        The (major, minor) version of the Python that loads the
+        compiled files.
+
+        Raises:
+            ValueError: the interpreter of the target cannot be run.
+        """
+        if self.found_version is not None:
+            return self.found_version
+        if self.python is None:
+            self.found_version = PYTHON_VERSIONS.get(
+                self.target, tuple(sys.version_info[:2]))
+            return self.found_version
+        try:
+            output = subprocess.check_output([
+                self.python, '-c',
+                'import sys; print("%d.%d" % sys.version_info[:2])'])
+            self.found_version = tuple(
+                int(part) for part in output.decode('ascii').split('.'))
+        except (OSError, subprocess.CalledProcessError, ValueError) as exc:
+            raise ValueError("cannot get the version of %s: %s" % (
+                self.python, exc))
+        logger.debug("%s runs python %d.%d", self.python, *self.found_version)
+        return self.found_version
+
+    def ensure_found(self):
+        """ Locates the tools unless this was done before. """
+        if not self.found:
+            self.find()
+
     def from_args(self, args):
         """ Initialize the paths from arguments. """
+        self.ensure_found()
         if args.rc_compiler is not None and len(args.rc_compiler) > 0:
             self.rc_compiler = args.rc_compiler
         if args.ui_compiler is not None and len(args.ui_compiler) > 0:
             self.ui_compiler = args.ui_compiler
+        self.pythons = dict(args.target_python or ())
 
         logger.debug("rc_compiler: %r", self.rc_compiler)
         logger.debug("ui_compiler: %r", self.ui_compiler)
@@ -69,15 +163,41 @@ class Toolset(object):
         logger.debug("lrelease: %r", self.lrelease)
         logger.debug("zip_tool: %r", self.zip_tool)
 
+    def from_dict(self, values):
+        """
+        Initialize the paths from a dictionary of arguments.
+
+        The compilers given by a previous call are forgotten, so a
+        long running process does not apply the options of one request
+        to the next.
+        """
+        self.ensure_found()
+        self.rc_compiler, self.ui_compiler = self.found_compilers
+        if values.get('rc_compiler'):
+            self.rc_compiler = values['rc_compiler']
+        if values.get('ui_compiler'):
+            self.ui_compiler = values['ui_compiler']
+        self.pythons = dict(values.get('target_python') or ())
+
     def prepare_parser(self, parser):
         parser.add_argument(
-            "--rc-compiler", default=self.rc_compiler,
+            "--rc-compiler", default=None,
             action="store",
-            help="the path of the rc compiler")
+            help="the path of the rc compiler; by default it is searched "
+                 "in PATH")
         parser.add_argument(
-            "--ui-compiler", default=self.ui_compiler,
+            "--ui-compiler", default=None,
             action="store",
-            help="the path of the ui compiler")
+            help="the path of the ui compiler; by default it is searched "
+                 "in PATH")
+        parser.add_argument(
+            "--target-python", default=None,
+            action="append", type=target_python,
+            help="the Python interpreter that QGis runs for a Qt flavour, "
+                 "as TARGET=PATH; compiled files are only deployed for "
+                 "the targets whose Python is the one running pubq, the "
+                 "others get sources (by default qt4 is assumed to run "
+                 "Python 2); may be repeated")
 
     def run(self, command, *arguments):
         """ Executes an outside command. """
@@ -91,6 +211,16 @@ class Toolset(object):
         self.run(self.rc_compiler, '-o', out_file, in_file)
 
 
+def target_python(value):
+    """ Parses the interpreter of a Qt flavour, given as TARGET=PATH. """
+    target, sep, path = value.partition('=')
+    if target not in TARGETS or not sep or not path:
+        raise argparse.ArgumentTypeError(
+            "expected TARGET=PATH with TARGET one of %s" % (
+                ', '.join(sorted(TARGETS))))
+    return target, path
+
+
 def find_app(names):
     """
     Locates an executable within the PATH.
@@ -8,7 +8,9 @@ from __future__ import print_function
 import logging
 import os
 
+from pubqlib.utils.fileio import atomic_output
 from .file_base import PubFile
+from .profile import get_profile
 
 logger = logging.getLogger('PubUi')
 
@@ -21,6 +23,8 @@ class PubUi(PubFile):
 
     """
 
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         """
         Constructor.
@@ -56,8 +60,13 @@ class PubUi(PubFile):
                      self.path_in, result)
         return result
 
-    def compile(self, toolset, force=False):
-        """ Create path_out file from path_in. """
+    def compile(self, toolset, force=False, profile=None):
+        """
+        Create path_out file from path_in.
+
+        The generated python file is then adjusted and compiled
+        according to the deploy profile.
+        """
         if not self.use_compiled:
             logger.debug("%r will not be compiled because "
                          "use_compiled is false", self.path_in)
@@ -66,6 +75,16 @@ class PubUi(PubFile):
         if self.path_out is None:
             self.path_out = self.default_output()
 
+        if not force and not self.changed():
+            logger.debug("%r is up to date", self.path_out)
+            return
+
         logger.debug("compiling %r to %r", self.path_in, self.path_out)
-        toolset.compile_ui_file(
-            in_file=self.path_in, out_file=self.path_out)
+        out_dir = os.path.dirname(self.path_out)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir, exist_ok=True)
+        profile = get_profile(None) if profile is None else profile
+        with atomic_output(self.path_out) as temp_path:
+            toolset.compile_ui_file(in_file=self.path_in, out_file=temp_path)
+            profile.process_generated(temp_path)
+        profile.compile_file(self.path_out)
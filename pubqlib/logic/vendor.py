@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubVendor class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import compileall
+import logging
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from pubqlib.utils import get_cache_dir
+from pubqlib.utils.fileio import HashCache
+
+logger = logging.getLogger('pubq.vendor')
+
+WHEEL_RE = re.compile(
+    r'^(?P<name>[^-]+)-(?P<version>[^-]+)(-(?P<build>\d[^-]*))?'
+    r'-(?P<python>[^-]+)-(?P<abi>[^-]+)-(?P<platform>[^-]+)\.whl$')
+
+REQUIREMENT_RE = re.compile(
+    r'^\s*(?P<name>[A-Za-z0-9][A-Za-z0-9._-]*)\s*'
+    r'(==\s*(?P<version>[^\s;]+))?\s*$')
+
+
+def normalize_name(name):
+    """ Normalizes a distribution name as described by PEP 503. """
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def version_key(version):
+    """ A sort key that orders dotted versions numerically. """
+    return tuple(
+        (0, int(part), '') if part.isdigit() else (1, 0, part)
+        for part in re.split(r'[.+-]', version))
+
+
+def vendor_path(path, target):
+    """
+    Locates the directory that receives the vendored packages.
+
+    The directory is deleted and rebuilt by each build, so it must be
+    a sub-directory of the plugin.
+
+    Arguments:
+        path (str):
+            The root directory of the plugin.
+        target (str):
+            The value of `target` in the `[vendor]` section.
+
+    Raises:
+        ValueError: the target is empty, absolute, the plugin itself,
+            outside of it or inside the state of pubq.
+    """
+    target = target.strip()
+    root = os.path.realpath(path)
+    result = os.path.realpath(os.path.join(root, target))
+    if len(target) == 0 or os.path.isabs(target) or \
+            not result.startswith(root + os.sep) or \
+            os.path.relpath(result, root).split(os.sep)[0] == '.pubq':
+        raise ValueError(
+            "[vendor] target must be a sub-directory of the plugin, "
+            "not %r" % target)
+    return os.path.join(path, os.path.normpath(target))
+
+
+def extract_wheel(wheel, digest, cache_dir):
+    """
+    Extracts a wheel into the cache, unless it was extracted before.
+
+    The wheel is first extracted into a temporary directory that is
+    renamed at the end, so an interrupted extraction is never reused.
+
+    Arguments:
+        wheel (str):
+            The path of the wheel.
+        digest (str):
+            The sha256 of the wheel.
+        cache_dir (str):
+            The directory holding all extractions.
+
+    Returns:
+        The directory where the content of the wheel can be found.
+    """
+    result = os.path.join(cache_dir, digest)
+    if os.path.isdir(result):
+        logger.debug("%s was extracted before", wheel)
+        return result
+
+    logger.debug("extracting %s to %s", wheel, result)
+    temp_dir = tempfile.mkdtemp(prefix='.%s.' % digest, dir=cache_dir)
+    try:
+        with zipfile.ZipFile(wheel) as archive:
+            archive.extractall(temp_dir)
+        os.rename(temp_dir, result)
+    except OSError:
+        # Another process may have finished the same extraction.
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        if not os.path.isdir(result):
+            raise
+    return result
+
+
+def merge_tree(source, target):
+    """ Copies the content of a directory over an existing directory. """
+    for root, dirs, files in os.walk(source):
+        out_dir = os.path.join(target, os.path.relpath(root, source))
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        for name in files:
+            shutil.copy2(os.path.join(root, name), os.path.join(out_dir, name))
+
+
+class PubVendor(object):
+    """
+    Third party pure-python packages bundled with the plugin.
+
+    The `[vendor]` section of the metadata file lists the requirements
+    (`name` or `name==version`, one per line) under `requirements` and,
+    optionally, directories with wheels under `wheels`. The wheel cache of
+    the program is always searched, after those directories.
+
+    Wheels are extracted (once per wheel content) in the cache, then
+    copied into a directory of the plugin (`ext-libs` by default) that is
+    compiled and deployed with the rest of the plugin. That directory is
+    rebuilt from scratch when the wheels change, so pubq refuses to use
+    a directory that it did not create.
+
+    Attributes:
+        path (str):
+            The directory where packages are placed.
+        requirements (list):
+            (normalized name, version or None) tuples.
+        wheel_dirs (list):
+            Where wheels are searched.
+        wheels (list):
+            The wheels that were selected by resolve().
+        use_compiled (bool):
+            Deploy compiled files instead of sources.
+    """
+
+    def __init__(self, path, requirements=None, wheel_dirs=None,
+                 use_compiled=True):
+        """
+        Constructor.
+
+        Arguments:
+            path (str):
+                The directory where packages are placed.
+            requirements (list):
+                (normalized name, version or None) tuples.
+            wheel_dirs (list):
+                Where wheels are searched.
+            use_compiled (bool):
+                Deploy compiled files instead of sources.
+        """
+        super().__init__()
+        self.path = path
+        self.requirements = [] if requirements is None else requirements
+        self.wheel_dirs = [] if wheel_dirs is None else wheel_dirs
+        self.wheels = []
+        self.use_compiled = use_compiled
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubVendor(%d requirements)' % len(self.requirements)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubVendor(%r, %r, %r)' % (
+            self.path, self.requirements, self.wheel_dirs)
+
+    @classmethod
+    def from_plugin(cls, path, config_obj, source_py=False):
+        """
+        Creates the instance for a plugin.
+
+        Arguments:
+            path (str):
+                The root directory of the plugin.
+            config_obj (ConfigParser):
+                The metadata of the plugin.
+            source_py (bool):
+                Deploy sources instead of compiled files.
+
+        Returns:
+            None if the plugin has no requirements, an instance otherwise.
+
+        Raises:
+            ValueError: the target directory is not inside the plugin.
+        """
+        requirements = []
+        for line in config_obj.get(
+                'vendor', 'requirements', fallback='').split('\n'):
+            line = line.split('#')[0].strip()
+            if len(line) == 0:
+                continue
+            match = REQUIREMENT_RE.match(line)
+            if match is None:
+                logger.error("Unsupported requirement %r; only name and "
+                             "name==version are accepted", line)
+                continue
+            requirements.append(
+                (normalize_name(match.group('name')), match.group('version')))
+        if len(requirements) == 0:
+            return None
+
+        wheel_dirs = [
+            os.path.join(path, line.strip())
+            for line in config_obj.get(
+                'vendor', 'wheels', fallback='').split('\n')
+            if len(line.strip()) > 0]
+        wheel_dirs.append(get_cache_dir('wheels'))
+        target = config_obj.get('vendor', 'target', fallback='ext-libs')
+        return cls(
+            path=vendor_path(path, target),
+            requirements=requirements, wheel_dirs=wheel_dirs,
+            use_compiled=not source_py)
+
+    def available_wheels(self):
+        """ Lists pure-python wheels in the search directories. """
+        result = {}
+        for directory in self.wheel_dirs:
+            if not os.path.isdir(directory):
+                logger.debug("wheel directory %s does not exist", directory)
+                continue
+            for entry in os.scandir(directory):
+                match = WHEEL_RE.match(entry.name)
+                if match is None:
+                    continue
+                if match.group('abi') != 'none' or \
+                        match.group('platform') != 'any':
+                    logger.log(1, "%s is not pure python", entry.name)
+                    continue
+                name = normalize_name(match.group('name'))
+                result.setdefault(name, []).append(
+                    (match.group('version'), entry.path))
+        return result
+
+    def resolve(self):
+        """
+        Selects a wheel for each requirement.
+
+        The highest version is used when the requirement does not name
+        one. Dependencies of the packages are not followed; they must be
+        listed explicitly.
+
+        Returns:
+            True if all requirements were satisfied.
+        """
+        available = self.available_wheels()
+        self.wheels = []
+        result = True
+        for name, version in self.requirements:
+            candidates = [
+                candidate for candidate in available.get(name, [])
+                if version is None or candidate[0] == version]
+            if len(candidates) == 0:
+                logger.error("No wheel found for %s%s in %r", name,
+                             '' if version is None else '==' + version,
+                             self.wheel_dirs)
+                result = False
+                continue
+            candidates.sort(key=lambda c: version_key(c[0]))
+            logger.debug("%s resolved to %s", name, candidates[-1][1])
+            self.wheels.append(candidates[-1][1])
+        return result
+
+    def compile(self, toolset, force=False, profile=None, plugin=None):
+        """
+        Places the packages inside the plugin and compiles them.
+
+        Arguments:
+            toolset (Toolset):
+                Not used; present for symmetry with other units.
+            force (bool):
+                Rebuild the directory even if the wheels did not change.
+            profile (DeployProfile):
+                Decides the optimization level.
+            plugin (PubPlugin):
+                Used to remember the wheels from the previous build and
+                the directory that pubq created for them.
+
+        Raises:
+            ValueError: a requirement could not be satisfied (the plugin
+                would not work if it was deployed) or the target
+                directory exists but was not created by pubq.
+        """
+        if not self.resolve():
+            raise ValueError("Vendored packages are incomplete")
+
+        cache_dir = get_cache_dir('vendor')
+        hashes = HashCache()
+        known = hashes.hash_many(self.wheels)
+        hashes.save()
+        digests = [known[wheel] for wheel in self.wheels]
+        stamp = ','.join(sorted(digests))
+
+        if force or plugin is None or \
+                plugin.read_state('vendor') != stamp or \
+                not os.path.isdir(self.path) or \
+                not self.is_owned(plugin):
+            with ThreadPoolExecutor() as executor:
+                extracted = list(executor.map(
+                    extract_wheel, self.wheels, digests,
+                    [cache_dir] * len(digests)))
+
+            if os.path.lexists(self.path):
+                if not self.is_owned(plugin):
+                    raise ValueError(
+                        "%s was not created by pubq; remove it or choose "
+                        "another [vendor] target" % self.path)
+                shutil.rmtree(self.path)
+            os.makedirs(self.path)
+            if plugin is not None:
+                plugin.write_state('vendor-dir', self.owner_key(plugin))
+            for directory in extracted:
+                logger.debug("copying %s to %s", directory, self.path)
+                merge_tree(directory, self.path)
+            if plugin is not None:
+                plugin.write_state('vendor', stamp)
+        else:
+            logger.debug("vendored packages are up to date")
+
+        optimize = 0 if profile is None else profile.optimize
+        compileall.compile_dir(
+            dir=self.path, legacy=True, force=force,
+            optimize=optimize, quiet=1)
+
+    def owner_key(self, plugin):
+        """ How the target directory is recorded in the state of pubq. """
+        return os.path.relpath(self.path, plugin.source_path)
+
+    def is_owned(self, plugin):
+        """ Tell if the target directory was created by pubq. """
+        return plugin is not None and \
+            not os.path.islink(self.path) and \
+            plugin.read_state('vendor-dir') == self.owner_key(plugin)
+
+    @property
+    def files(self):
+        """ The files that are to be deployed. """
+        result = []
+        for root, dirs, files in os.walk(self.path):
+            dirs[:] = [name for name in dirs if name != '__pycache__']
+            for name in files:
+                if name.endswith('.pyc'):
+                    continue
+                if name.endswith('.py') and self.use_compiled:
+                    name = name + 'c'
+                result.append(os.path.join(root, name))
+        return result
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubVerifier class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from pubqlib.utils.fileio import HashCache, hash_file
+from .manifest import MANIFEST_NAME, PubManifest
+from .status import IGNORED_DEPLOYED
+
+logger = logging.getLogger('pubq.verify')
+
+
+class PubVerifier(object):
+    """
+    Compares an installed plugin with the manifest written when it was
+    deployed.
+
+    Files whose size differs are reported without reading them. The
+    others are hashed by a pool of threads, except the files that still
+    have the inode, size and modification time they had when they were
+    last hashed (see HashCache).
+
+    Attributes:
+        path (str):
+            The directory of the installed plugin.
+        manifest (PubManifest):
+            The manifest found in the plugin.
+        modified (list):
+            Files whose content differs from the manifest.
+        missing (list):
+            Files listed in the manifest that are not installed.
+        extra (list):
+            Installed files that are not listed in the manifest.
+        hashed (int):
+            The number of files that were read.
+        unchanged (int):
+            The number of files that match the manifest.
+    """
+
+    def __init__(self, path, hashes=None, jobs=None, full=False):
+        """
+        Constructor.
+
+        Arguments:
+            path (str):
+                The directory of the installed plugin.
+            hashes (HashCache):
+                Known hashes of files; by default the cache of the program.
+            jobs (int):
+                Maximum number of threads hashing files.
+            full (bool):
+                Hash all files, even the ones with a known hash.
+        """
+        super().__init__()
+        self.path = path
+        self.hashes = HashCache() if hashes is None else hashes
+        self.jobs = jobs
+        self.full = full
+        self.manifest = None
+        self.modified = []
+        self.missing = []
+        self.extra = []
+        self.hashed = 0
+        self.unchanged = 0
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubVerifier("%s")' % self.path
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubVerifier(%r, jobs=%r, full=%r)' % (
+            self.path, self.jobs, self.full)
+
+    @property
+    def intact(self):
+        """ Tell if the installed plugin matches its manifest. """
+        return len(self.modified) + len(self.missing) + len(self.extra) == 0
+
+    def verify(self):
+        """
+        Checks all the files of the plugin.
+
+        Raises:
+            OSError, ValueError if the manifest cannot be read.
+        """
+        self.manifest = PubManifest.load(
+            os.path.join(self.path, MANIFEST_NAME))
+
+        pending = []
+        for rel_path, (size, digest) in sorted(self.manifest.files.items()):
+            output = os.path.join(self.path, *rel_path.split('/'))
+            try:
+                stat = os.stat(output)
+            except OSError:
+                self.missing.append(rel_path)
+                continue
+            if stat.st_size != size:
+                self.modified.append(rel_path)
+                continue
+            known = None if self.full else self.hashes.lookup(output, stat)
+            if known is None:
+                pending.append((rel_path, output, stat, digest))
+            elif known == digest:
+                self.unchanged = self.unchanged + 1
+            else:
+                self.modified.append(rel_path)
+
+        if len(pending) > 0:
+            logger.debug("hashing %d files in %s", len(pending), self.path)
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                digests = executor.map(
+                    lambda item: hash_file(item[1], item[2].st_size),
+                    pending)
+                for (rel_path, output, stat, digest), actual in zip(
+                        pending, digests):
+                    self.hashes.store(output, stat, actual)
+                    if actual == digest:
+                        self.unchanged = self.unchanged + 1
+                    else:
+                        self.modified.append(rel_path)
+            self.hashed = len(pending)
+            self.hashes.save()
+        self.modified.sort()
+
+        for root, dirs, files in os.walk(self.path):
+            dirs[:] = [name for name in dirs if name not in IGNORED_DEPLOYED]
+            for name in files:
+                rel_path = os.path.relpath(
+                    os.path.join(root, name), self.path)
+                if rel_path != MANIFEST_NAME and \
+                        self.manifest.get(rel_path) is None:
+                    self.extra.append(rel_path)
+        self.extra.sort()
+        return self
+
+    def summary(self):
+        """ A line describing the result. """
+        return '%s: %d files, %d modified, %d missing, %d extra ' \
+               '(%d hashed)' % (
+                   self.path, len(self.manifest.files), len(self.modified),
+                   len(self.missing), len(self.extra), self.hashed)
+
+    def details(self):
+        """ One line for each difference. """
+        result = []
+        for label, paths in (('modified', self.modified),
+                             ('missing', self.missing),
+                             ('extra', self.extra)):
+            for path in paths:
+                result.append('%-9s %s' % (label, path))
+        return result
@@ -0,0 +1,791 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubWorker and WorkerPool classes.
+
+A worker (`pubq worker`) runs the form and resource compilers for other
+machines. A build started with --workers sends each compilation to a
+worker as content-addressed inputs: the worker says which files it does
+not have yet, receives only those and returns the generated module.
+Everything that follows (adjusting and compiling the python module)
+still happens locally, so the result does not depend on where the
+compiler ran. When no worker can take a unit it is compiled locally.
+
+Workers must be trusted: the module a worker returns is deployed as it
+is and runs inside QGis. Unix sockets only accept the user running the
+worker; TCP workers require a shared token, taken from the
+PUBQ_WORKER_TOKEN environment variable on both sides, and listen on the
+loopback interface unless told otherwise. A worker only reads the
+files it was sent: names and digests are validated, and resource files
+may not reference anything else.
+
+Each message is a json header on one line, followed by the payloads
+whose sizes are listed in the header:
+
+    {"command": "missing", "digests": [...]}
+        -> {"result": 0, "missing": [...]}
+    {"command": "compile", "kind": "ui" or "rc", "target": ...,
+     "tool": ..., "input": name, "files": {name: digest},
+     "blobs": [digest, ...], "sizes": [...]} + the missing files
+        -> {"result": 0, "sizes": [size]} + the generated module
+    {"command": "hello", "token": ...}
+        -> {"result": 0, "jobs": ..., "tools": {...}}
+
+Each connection starts with a hello message.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import socketserver
+import subprocess
+import tempfile
+import threading
+from xml.etree import ElementTree
+
+from pubqlib.utils import get_cache_dir, get_runtime_dir
+from pubqlib.utils.fileio import HASH_NAME, atomic_output, hash_file
+from .daemon import PrivateUnixStreamServer
+
+logger = logging.getLogger('pubq.worker')
+
+# The longest header accepted by either side.
+MAX_HEADER = 16 * 1024 * 1024
+
+# How long a client waits for a worker, in seconds.
+DEFAULT_TIMEOUT = 120.0
+
+# The compilers a worker runs for each kind of unit.
+KINDS = {
+    'ui': 'ui_compiler',
+    'rc': 'rc_compiler',
+}
+
+# The environment variable holding the token shared by the workers
+# listening on TCP and their clients.
+TOKEN_VARIABLE = 'PUBQ_WORKER_TOKEN'
+
+# The content addresses (HASH_NAME digests).
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def get_worker_socket():
+    """ The default path of the unix socket of a worker. """
+    return os.path.join(get_runtime_dir(), 'worker.sock')
+
+
+def parse_address(text):
+    """
+    Decodes the address of a worker.
+
+    Arguments:
+        text (str):
+            host:port for TCP (a port alone or :port means the loopback
+            interface), a path (or unix:path) for a unix socket.
+
+    Returns:
+        The socket family and the address in the form expected by
+        socket.connect().
+    """
+    if text.startswith('unix:'):
+        return socket.AF_UNIX, text[5:]
+    if text.isdigit():
+        return socket.AF_INET, ('127.0.0.1', int(text))
+    if os.sep in text or ':' not in text:
+        return socket.AF_UNIX, text
+    host, port = text.rsplit(':', 1)
+    try:
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    except ValueError:
+        raise ValueError("invalid worker address %r" % text)
+
+
+def send_message(wfile, header, payloads=()):
+    """ Writes a header and its payloads. """
+    header = dict(header, sizes=[len(payload) for payload in payloads])
+    wfile.write(json.dumps(header).encode('utf-8') + b'\n')
+    for payload in payloads:
+        wfile.write(payload)
+    wfile.flush()
+
+
+def read_message(rfile):
+    """
+    Reads a header and its payloads.
+
+    Returns:
+        The header and the list of payloads; the header is None at the
+        end of the stream.
+
+    Raises:
+        ValueError: the message is malformed.
+    """
+    line = rfile.readline(MAX_HEADER)
+    if len(line) == 0:
+        return None, []
+    if not line.endswith(b'\n'):
+        raise ValueError("the header is too long")
+    header = json.loads(line.decode('utf-8'))
+    if not isinstance(header, dict):
+        raise ValueError("the header is not an object")
+    sizes = header.get('sizes', [])
+    if not isinstance(sizes, list) or not all(
+            is_count(size) for size in sizes):
+        raise ValueError("invalid payload sizes")
+    payloads = []
+    for size in sizes:
+        payload = rfile.read(size)
+        if len(payload) != size:
+            raise ValueError("truncated message")
+        payloads.append(payload)
+    return header, payloads
+
+
+def is_count(value):
+    """ Tell if a value received from the other side is an integer >= 0. """
+    return isinstance(value, int) and not isinstance(value, bool) and \
+        value >= 0
+
+
+def digest_of(data):
+    """ The content address of some bytes. """
+    return hashlib.new(HASH_NAME, data).hexdigest()
+
+
+def check_digest(digest):
+    """
+    Makes sure a value received from a client is a content address.
+
+    Raises:
+        ValueError: it is not (it could name any file of the worker).
+    """
+    if not isinstance(digest, str) or not DIGEST_PATTERN.match(digest):
+        raise ValueError("invalid digest %r" % (digest, ))
+    return digest
+
+
+def check_name(name):
+    """
+    Makes sure a file name received from a client stays in the sandbox.
+
+    Raises:
+        ValueError: the name is absolute, empty or goes up.
+    """
+    if not isinstance(name, str) or len(name) == 0 or \
+            name.startswith('/') or '\\' in name or '\0' in name:
+        raise ValueError("invalid name %r" % (name, ))
+    for part in name.split('/'):
+        if part in ('', '.', '..'):
+            raise ValueError("invalid name %r" % (name, ))
+    return name
+
+
+def check_qrc(data, files):
+    """
+    Makes sure a resource file only references the files sent with it.
+
+    Raises:
+        ValueError: the resource file cannot be parsed or references
+            other files (rcc would read them from the worker).
+    """
+    try:
+        root = ElementTree.fromstring(data)
+    except ElementTree.ParseError as exc:
+        raise ValueError("invalid resource file: %s" % exc)
+    for element in root.iter('file'):
+        name = (element.text or '').strip()
+        if name not in files:
+            raise ValueError("the resource file references %r" % name)
+
+
+def rc_bundle(qrc_path):
+    """
+    Describes a resource file and the files it references by content.
+
+    The resource file is rewritten so that it names each file by its
+    content address, with an alias that keeps the path seen by the
+    application.
+
+    Returns:
+        The content of the rewritten resource file and a dictionary
+        mapping names relative to it to (local file, digest).
+
+    Raises:
+        ValueError: the file references something that is not a file.
+    """
+    base_path = os.path.dirname(os.path.abspath(qrc_path))
+    tree = ElementTree.parse(qrc_path)
+    files = {}
+    for element in tree.iter('file'):
+        if not element.text:
+            continue
+        name = element.text.strip()
+        path = os.path.join(base_path, name)
+        if not os.path.isfile(path):
+            raise ValueError("%s is not a file" % path)
+        digest = hash_file(path)
+        remote_name = '%s/%s' % (digest, os.path.basename(path))
+        element.set('alias', element.get('alias', name))
+        element.text = remote_name
+        files[remote_name] = (path, digest)
+    return ElementTree.tostring(tree.getroot(), encoding='utf-8'), files
+
+
+class WorkerHandler(socketserver.StreamRequestHandler):
+    """ Serves the messages of one connection. """
+
+    def handle(self):
+        """ Answers messages until the client closes the connection. """
+        worker = self.server.worker
+        authenticated = False
+        while True:
+            try:
+                header, payloads = read_message(self.rfile)
+                if header is None:
+                    return
+                if not authenticated:
+                    # The first message must be a hello with the token.
+                    if header.get('command') != 'hello' or \
+                            not worker.check_token(header.get('token')):
+                        logger.warning("refused a client at %s",
+                                       self.client_address or 'socket')
+                        send_message(self.wfile, {
+                            'result': 1, 'error': 'not authenticated'})
+                        return
+                    authenticated = True
+                response, payloads = worker.execute(header, payloads)
+            except (OSError, ValueError) as exc:
+                logger.debug("dropping connection: %s", exc)
+                return
+            except Exception as exc:
+                logger.error("Request failed", exc_info=True)
+                response, payloads = {'result': -2, 'error': str(exc)}, ()
+            try:
+                send_message(self.wfile, response, payloads)
+            except OSError:
+                return
+
+
+class ThreadingUnixStreamServer(socketserver.ThreadingMixIn,
+                                PrivateUnixStreamServer):
+    """
+    A unix socket server that serves each connection of its user in
+    a thread.
+    """
+
+    daemon_threads = True
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn,
+                         socketserver.TCPServer):
+    """ A TCP server that serves each connection in a thread. """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class PubWorker(object):
+    """
+    Compiles forms and resources for other pubq processes.
+
+    Inputs and results are stored by content address, so a file is
+    only transferred once and a unit that was compiled before (for any
+    client) is answered from the store.
+
+    Attributes:
+        address (str):
+            Where the worker listens (see parse_address()).
+        jobs (int):
+            How many compilers run at the same time.
+        toolset (Toolset):
+            The compilers of the worker.
+        store (str):
+            The directory holding the inputs and the results.
+        token (str):
+            The secret clients must present; required on TCP.
+    """
+
+    def __init__(self, address, toolset, jobs=None, store=None, token=None):
+        """
+        Constructor.
+
+        Arguments:
+            address (str):
+                Where the worker listens (see parse_address()).
+            toolset (Toolset):
+                The compilers used when a request does not name a
+                target.
+            jobs (int):
+                How many compilers run at the same time; by default the
+                number of processors.
+            store (str):
+                The directory holding the inputs and the results; by
+                default a directory in the cache of the program.
+            token (str):
+                The secret clients must present; required on TCP.
+        """
+        super().__init__()
+        self.address = address
+        self.toolset = toolset
+        self.jobs = jobs or os.cpu_count() or 1
+        self.store = get_cache_dir('worker') if store is None else store
+        self.token = token
+        self.toolsets = {}
+        self.slots = threading.BoundedSemaphore(self.jobs)
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubWorker(%s)' % self.address
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubWorker(%r, jobs=%r)' % (self.address, self.jobs)
+
+    def check_token(self, token):
+        """ Tell if a client presented the right secret (if any). """
+        if self.token is None:
+            return True
+        return isinstance(token, str) and hmac.compare_digest(
+            token.encode('utf-8'), self.token.encode('utf-8'))
+
+    def blob_path(self, digest):
+        """ Where an input is stored. """
+        check_digest(digest)
+        return os.path.join(self.store, 'blobs', digest[:2], digest)
+
+    def result_path(self, key):
+        """ Where a result is stored. """
+        return os.path.join(self.store, 'results', key[:2], key)
+
+    def get_toolset(self, target):
+        """ The compilers for a Qt flavour (or the default ones). """
+        if target is None:
+            return self.toolset
+        with self.lock:
+            if target not in self.toolsets:
+                self.toolsets[target] = self.toolset.for_target(target)
+            return self.toolsets[target]
+
+    def execute(self, header, payloads):
+        """
+        Answers a message.
+
+        Returns:
+            The header of the response and its payloads.
+        """
+        command = header.get('command')
+        if command == 'hello':
+            return {
+                'result': 0,
+                'jobs': self.jobs,
+                'tools': {
+                    kind: os.path.basename(
+                        getattr(self.toolset, attribute) or '')
+                    for kind, attribute in KINDS.items()},
+            }, ()
+        if command == 'missing':
+            return {
+                'result': 0,
+                'missing': [
+                    digest for digest in header['digests']
+                    if not os.path.isfile(self.blob_path(digest))],
+            }, ()
+        if command == 'compile':
+            return self.compile(header, payloads)
+        return {'result': 1, 'error': 'unknown command %r' % command}, ()
+
+    def save_blobs(self, digests, payloads):
+        """ Stores the inputs sent by a client, checking their address. """
+        for digest, payload in zip(digests, payloads):
+            if digest_of(payload) != digest:
+                raise ValueError("content does not match %s" % digest)
+            path = self.blob_path(digest)
+            if os.path.isfile(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_output(path) as temp_path:
+                with open(temp_path, 'wb') as fout:
+                    fout.write(payload)
+
+    def compile(self, header, payloads):
+        """ Runs a compiler on content-addressed inputs. """
+        kind = header['kind']
+        if kind not in KINDS:
+            return {'result': 1, 'error': 'unknown kind %r' % kind}, ()
+        self.save_blobs(header.get('blobs', []), payloads)
+
+        toolset = self.get_toolset(header.get('target'))
+        tool = getattr(toolset, KINDS[kind])
+        if tool is None or os.path.basename(tool) != header['tool']:
+            # The client would get a different output from its tool.
+            return {'result': 1, 'error': 'no %s here' % header['tool']}, ()
+        files = header['files']
+        input_name = header['input']
+        if not isinstance(files, dict):
+            raise ValueError("invalid file list")
+        for name, digest in files.items():
+            check_name(name)
+            if not os.path.isfile(self.blob_path(digest)):
+                return {'result': 1, 'error': 'missing %s' % name}, ()
+        # The input is passed on the command line of the compiler.
+        if input_name not in files or '/' in input_name or \
+                input_name.startswith('-'):
+            raise ValueError("invalid input %r" % (input_name, ))
+        if kind == 'rc':
+            with open(self.blob_path(files[input_name]), 'rb') as fin:
+                check_qrc(fin.read(), files)
+
+        key = digest_of(json.dumps(
+            [kind, tool, input_name, sorted(files.items())]).encode('utf-8'))
+        result_path = self.result_path(key)
+        if os.path.isfile(result_path):
+            logger.debug("%s: answered from the store", input_name)
+            with open(result_path, 'rb') as fin:
+                return {'result': 0, 'cached': True}, (fin.read(), )
+
+        with self.slots:
+            sandbox = tempfile.mkdtemp(prefix='pubq-worker-')
+            try:
+                for name, digest in files.items():
+                    path = os.path.join(sandbox, *name.split('/'))
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    shutil.copyfile(self.blob_path(digest), path)
+                process = subprocess.run(
+                    [tool, '-o', 'pubq-output', input_name],
+                    cwd=sandbox, stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT)
+                if process.returncode != 0:
+                    return {
+                        'result': 1,
+                        'error': process.stdout.decode('utf-8', 'replace'),
+                    }, ()
+                with open(os.path.join(sandbox, 'pubq-output'), 'rb') as fin:
+                    output = fin.read()
+            finally:
+                shutil.rmtree(sandbox, ignore_errors=True)
+        logger.info("compiled %s with %s", input_name, tool)
+        os.makedirs(os.path.dirname(result_path), exist_ok=True)
+        with atomic_output(result_path) as temp_path:
+            with open(temp_path, 'wb') as fout:
+                fout.write(output)
+        return {'result': 0, 'cached': False}, (output, )
+
+    def serve(self):
+        """ Listens for requests until interrupted. """
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.remove(address)
+            server = ThreadingUnixStreamServer(address, WorkerHandler)
+        else:
+            if not self.token:
+                logger.error("A worker listening on TCP needs a token; "
+                             "set %s", TOKEN_VARIABLE)
+                return False
+            server = ThreadingTCPServer(address, WorkerHandler)
+        server.worker = self
+        self.toolset.ensure_found()
+        logger.info("pubq worker listening at %s with %d jobs",
+                    self.address, self.jobs)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("pubq worker is shutting down")
+        finally:
+            server.server_close()
+            if family == socket.AF_UNIX and os.path.exists(address):
+                os.remove(address)
+        return True
+
+
+class WorkerPool(object):
+    """
+    The workers a build sends its compilations to.
+
+    Each worker takes as many units at a time as it has jobs. A worker
+    that cannot be reached is not used again by this pool.
+
+    Attributes:
+        addresses (list):
+            The addresses of the workers.
+        timeout (float):
+            How long to wait for a worker, in seconds.
+        capacity (dict):
+            Maps the address of each available worker to the number of
+            units it can take at the same time.
+        busy (dict):
+            Maps the address of each worker to the number of units it
+            is compiling.
+        remote (int):
+            The number of units compiled by the workers.
+        local (int):
+            The number of units that were compiled locally instead.
+        token (str):
+            The secret presented to the workers.
+    """
+
+    def __init__(self, addresses, timeout=DEFAULT_TIMEOUT, token=None):
+        """
+        Constructor.
+
+        Arguments:
+            addresses (list):
+                The addresses of the workers (see parse_address()).
+            timeout (float):
+                How long to wait for a worker, in seconds.
+            token (str):
+                The secret presented to the workers; by default the
+                value of PUBQ_WORKER_TOKEN.
+        """
+        super().__init__()
+        self.addresses = list(addresses)
+        self.timeout = timeout
+        self.token = os.environ.get(TOKEN_VARIABLE) \
+            if token is None else token
+        self.capacity = None
+        self.busy = {}
+        self.remote = 0
+        self.local = 0
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'WorkerPool(%s)' % ','.join(self.addresses)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'WorkerPool(%r)' % self.addresses
+
+    def hello(self, stream):
+        """
+        Introduces this client on a new connection.
+
+        Returns:
+            The answer of the worker.
+
+        Raises:
+            ValueError: the worker refused the connection.
+        """
+        send_message(stream, {'command': 'hello', 'token': self.token})
+        header, _ = read_message(stream)
+        if header is None or header.get('result') != 0:
+            raise ValueError("refused (%s)" % (
+                'closed' if header is None else header.get('error')))
+        return header
+
+    def connect(self, address):
+        """ Opens a connection to a worker. """
+        family, target = parse_address(address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def start(self):
+        """ Asks each worker how many units it takes at the same time. """
+        with self.lock:
+            if self.capacity is not None:
+                return
+            self.capacity = {}
+        for address in self.addresses:
+            try:
+                with self.connect(address) as sock, \
+                        sock.makefile('rwb') as stream:
+                    header = self.hello(stream)
+                if not is_count(header.get('jobs')):
+                    raise ValueError(
+                        "invalid number of jobs %r" % (header.get('jobs'), ))
+            except (OSError, ValueError) as exc:
+                logger.warning("worker %s is not available: %s",
+                               address, exc)
+                continue
+            self.capacity[address] = max(1, header['jobs'])
+            self.busy[address] = 0
+        logger.debug("workers: %r", self.capacity)
+
+    @property
+    def jobs(self):
+        """ How many units the pool (and this machine) take at once. """
+        self.start()
+        return sum(self.capacity.values()) + 1
+
+    def acquire(self):
+        """ Reserves the least busy worker, or returns None. """
+        self.start()
+        with self.lock:
+            free = [
+                address for address in self.capacity
+                if self.busy[address] < self.capacity[address]]
+            if len(free) == 0:
+                return None
+            address = min(
+                free, key=lambda item: self.busy[item] / self.capacity[item])
+            self.busy[address] += 1
+            return address
+
+    def release(self, address, failed=False):
+        """ Returns a worker to the pool; failed workers are dropped. """
+        with self.lock:
+            self.busy[address] -= 1
+            if failed and address in self.capacity:
+                logger.warning("worker %s is no longer used", address)
+                del self.capacity[address]
+
+    def compile(self, kind, toolset, in_file, out_file):
+        """
+        Compiles a form or a resource file on a worker.
+
+        Returns:
+            False if the unit has to be compiled locally.
+        """
+        address = self.acquire()
+        if address is None:
+            with self.lock:
+                self.local += 1
+            return False
+        failed = False
+        try:
+            done = self.send(address, kind, toolset, in_file, out_file)
+        except (OSError, ValueError) as exc:
+            logger.warning("worker %s failed (%s); compiling %s locally",
+                           address, exc, in_file)
+            failed = True
+            done = False
+        finally:
+            self.release(address, failed=failed)
+        with self.lock:
+            if done:
+                self.remote += 1
+            else:
+                self.local += 1
+        return done
+
+    def send(self, address, kind, toolset, in_file, out_file):
+        """
+        Runs one unit on a worker.
+
+        Raises:
+            ValueError: the worker gave an answer of the wrong shape.
+        """
+        tool = getattr(toolset, KINDS[kind])
+        input_name = os.path.basename(in_file)
+        if kind == 'rc':
+            data, files = rc_bundle(in_file)
+        else:
+            with open(in_file, 'rb') as fin:
+                data = fin.read()
+            files = {}
+        digests = {name: digest for name, (_, digest) in files.items()}
+        digests[input_name] = digest_of(data)
+        sources = {digest: path for path, digest in files.values()}
+
+        with self.connect(address) as sock, sock.makefile('rwb') as stream:
+            self.hello(stream)
+            send_message(stream, {
+                'command': 'missing',
+                'digests': sorted(set(digests.values()))})
+            header, _ = read_message(stream)
+            if header is None or header.get('result') != 0:
+                raise ValueError("unexpected answer")
+            blobs = header.get('missing')
+            known = list(digests.values())
+            if not isinstance(blobs, list) or \
+                    not all(digest in known for digest in blobs):
+                raise ValueError("unexpected list of missing files")
+            payloads = []
+            for digest in blobs:
+                if digest == digests[input_name]:
+                    payloads.append(data)
+                else:
+                    with open(sources[digest], 'rb') as fin:
+                        payloads.append(fin.read())
+            send_message(stream, {
+                'command': 'compile',
+                'kind': kind,
+                'target': toolset.target,
+                'tool': os.path.basename(tool or ''),
+                'input': input_name,
+                'files': digests,
+                'blobs': blobs,
+            }, payloads)
+            header, payloads = read_message(stream)
+        if header is None:
+            raise ValueError("the worker closed the connection")
+        if header.get('result') != 0:
+            logger.debug("worker %s cannot compile %s: %s",
+                         address, in_file, header.get('error'))
+            return False
+        if len(payloads) != 1:
+            raise ValueError(
+                "expected one output, got %d" % len(payloads))
+        with open(out_file, 'wb') as fout:
+            fout.write(payloads[0])
+        logger.debug("%s was compiled by worker %s%s", in_file, address,
+                     ' (stored)' if header.get('cached') else '')
+        return True
+
+
+class WorkerToolset(object):
+    """
+    A toolset whose form and resource compilers run on workers.
+
+    The units that no worker can take are compiled by the wrapped
+    toolset. Everything else is taken from the wrapped toolset.
+
+    Attributes:
+        toolset (Toolset):
+            The local toolset.
+        pool (WorkerPool):
+            The workers.
+    """
+
+    def __init__(self, toolset, pool):
+        """
+        Constructor.
+
+        Arguments:
+            toolset (Toolset):
+                The local toolset.
+            pool (WorkerPool):
+                The workers.
+        """
+        super().__init__()
+        self.toolset = toolset
+        self.pool = pool
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'WorkerToolset(%s, %s)' % (self.toolset, self.pool)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'WorkerToolset(%r, %r)' % (self.toolset, self.pool)
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ('toolset', 'pool'):
+            raise AttributeError(name)
+        return getattr(self.toolset, name)
+
+    @property
+    def jobs(self):
+        """ How many units can be compiled at the same time. """
+        return self.pool.jobs
+
+    def compile_ui_file(self, in_file, out_file):
+        if not self.pool.compile('ui', self.toolset, in_file, out_file):
+            self.toolset.compile_ui_file(in_file, out_file)
+
+    def compile_rc_file(self, in_file, out_file):
+        if not self.pool.compile('rc', self.toolset, in_file, out_file):
+            self.toolset.compile_rc_file(in_file, out_file)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the PubWorkspace class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import configparser
+import glob
+import logging
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from pubqlib.utils.fileio import HashCache
+
+logger = logging.getLogger('pubq.workspace')
+
+# The name of the file describing a workspace.
+WORKSPACE_NAME = 'pubq-workspace.ini'
+
+
+def run_graph(nodes, dependencies, func, jobs=None):
+    """
+    Calls a function for each node of a graph, in parallel, never
+    before the function finished for all the dependencies of the node.
+
+    A node is started as soon as its dependencies are done, not when
+    the whole previous level is done.
+
+    Arguments:
+        nodes (list):
+            The nodes, in the order in which ready nodes are started.
+        dependencies (dict):
+            Maps each node to the nodes it depends on.
+        func (callable):
+            Called with a node; a false result (or an exception) marks
+            the node as failed and its dependents are skipped.
+        jobs (int):
+            Maximum number of nodes processed at the same time.
+
+    Returns:
+        A dictionary mapping each node to True (done), False (failed)
+        or None (skipped because a dependency failed).
+    """
+    dependents = {node: [] for node in nodes}
+    waiting = {}
+    for node in nodes:
+        waiting[node] = len(dependencies.get(node, ()))
+        for dependency in dependencies.get(node, ()):
+            dependents[dependency].append(node)
+
+    result = {}
+    ready = [node for node in nodes if waiting[node] == 0]
+
+    def skip(node):
+        for dependent in dependents[node]:
+            if dependent not in result:
+                result[dependent] = None
+                skip(dependent)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while len(ready) > 0 or len(running) > 0:
+            for node in ready:
+                running[executor.submit(func, node)] = node
+            ready = []
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                try:
+                    outcome = bool(future.result())
+                except Exception:
+                    logger.exception("%s failed", node)
+                    outcome = False
+                result[node] = outcome
+                if not outcome:
+                    skip(node)
+                    continue
+                for dependent in dependents[node]:
+                    waiting[dependent] = waiting[dependent] - 1
+                    if waiting[dependent] == 0 and dependent not in result:
+                        ready.append(dependent)
+    return result
+
+
+class PubWorkspace(object):
+    """
+    A set of plugins that are built together.
+
+    The workspace file lists the root directories of the plugins (glob
+    patterns are allowed) in the `plugins` key of the `[workspace]`
+    section, one per line, relative to the file:
+
+        [workspace]
+        plugins =
+            shared/core
+            plugins/*
+
+    A plugin that names another plugin of the workspace in its
+    plugin_dependencies is built after it. Plugins that do not depend
+    on each other are built in parallel; they all share the toolset,
+    the hash cache and the artefact cache of the program.
+
+    Attributes:
+        path (str):
+            The workspace file.
+        roots (list):
+            The root directories of the plugins.
+        plugins (dict):
+            Maps root directories to loaded plugins.
+        dependencies (dict):
+            Maps root directories to the roots they depend on.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor.
+
+        Arguments:
+            path (str):
+                The workspace file or the directory containing it.
+        """
+        super().__init__()
+        if os.path.isdir(path):
+            path = os.path.join(path, WORKSPACE_NAME)
+        self.path = os.path.abspath(path)
+        self.roots = []
+        self.plugins = {}
+        self.dependencies = {}
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'PubWorkspace(%d plugins)' % len(self.roots)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'PubWorkspace(%r)' % self.path
+
+    def read(self):
+        """ Reads the list of plugin roots. """
+        config = configparser.ConfigParser(allow_no_value=True)
+        with open(self.path, 'r') as fin:
+            config.read_file(fin)
+        base_path = os.path.dirname(self.path)
+        self.roots = []
+        for line in config.get(
+                'workspace', 'plugins', fallback='').split('\n'):
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            matches = sorted(glob.glob(os.path.join(base_path, line)))
+            matches = [
+                match for match in matches
+                if os.path.isfile(os.path.join(match, 'metadata.txt'))]
+            if len(matches) == 0:
+                logger.error("No plugin found at %s", line)
+            for match in matches:
+                if match not in self.roots:
+                    self.roots.append(match)
+        logger.debug("workspace %s has %d plugins",
+                     self.path, len(self.roots))
+        return self
+
+    def load(self, the_app, jobs=None):
+        """
+        Scans all plugins and computes the dependency graph.
+
+        Arguments:
+            the_app (TheApp):
+                Loads the plugins.
+            jobs (int):
+                Maximum number of plugins scanned at the same time.
+        """
+        hashes = HashCache()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            plugins = list(executor.map(the_app.load_plugin, self.roots))
+        self.plugins = dict(zip(self.roots, plugins))
+
+        by_name = {}
+        for root, plugin in self.plugins.items():
+            plugin.hashes = hashes
+            if plugin.name:
+                by_name[plugin.name.lower()] = root
+
+        self.dependencies = {}
+        for root, plugin in self.plugins.items():
+            self.dependencies[root] = []
+            for name, version in plugin.required_plugins():
+                dependency = by_name.get(name.lower())
+                if dependency is None:
+                    logger.debug("%s depends on %s, outside the workspace",
+                                 plugin.name, name)
+                elif dependency == root:
+                    raise ValueError("%s depends on itself" % plugin.name)
+                else:
+                    self.dependencies[root].append(dependency)
+        self.check_cycles()
+        return self
+
+    def check_cycles(self):
+        """ Raises a ValueError if the dependencies form a cycle. """
+        state = {}
+
+        def visit(root, stack):
+            if state.get(root) == 'done':
+                return
+            if state.get(root) == 'visiting':
+                names = [self.plugins[item].name for item in stack + [root]]
+                raise ValueError(
+                    "circular dependency: %s" % ' -> '.join(names))
+            state[root] = 'visiting'
+            for dependency in self.dependencies[root]:
+                visit(dependency, stack + [root])
+            state[root] = 'done'
+
+        for root in self.roots:
+            visit(root, [])
+
+    def build(self, the_app, force_recompile=False, clear_opt='error',
+              jobs=None):
+        """
+        Checks, compiles and deploys all plugins.
+
+        Arguments:
+            the_app (TheApp):
+                Holds the build settings.
+            force_recompile (bool):
+                Compile even if the outputs are up to date.
+            clear_opt (str):
+                What to do when a plugin is already installed.
+            jobs (int):
+                Maximum number of plugins built at the same time.
+
+        Returns:
+            True if all plugins were deployed.
+        """
+        # Created once, before the threads would race for them.
+        the_app.toolset.ensure_found()
+        for target in [None] if the_app.targets is None else the_app.targets:
+            the_app.target_destination(target)
+        lock = threading.Lock()
+
+        def build_one(root):
+            plugin = self.plugins[root]
+            if the_app.check and not the_app.check_plugin(plugin):
+                return False
+            logger.info("building %s", plugin.name)
+            if not the_app.build_plugin(
+                    plugin, force_recompile=force_recompile,
+                    clear_opt=clear_opt):
+                return False
+            with lock:
+                the_app.plugins.append(plugin)
+            return True
+
+        the_app.plugins = []
+        outcomes = run_graph(self.roots, self.dependencies, build_one, jobs)
+        for root, outcome in outcomes.items():
+            if outcome is None:
+                logger.error("%s was not built because a plugin it "
+                             "depends on failed", self.plugins[root].name)
+        return all(outcomes.values())
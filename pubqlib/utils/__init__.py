@@ -5,7 +5,74 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import logging
+import os
+import stat
+import tempfile
 
 logger = logging.getLogger('')
 
 
+def get_runtime_dir():
+    """
+    Locates the directory where we keep sockets and other volatile files.
+
+    The directory is private to the current user (see
+    is_private_dir()); it is created inside XDG_RUNTIME_DIR if set,
+    inside the temporary directory otherwise.
+
+    Returns:
+        The path of the directory.
+    """
+    base = os.environ.get('XDG_RUNTIME_DIR', '')
+    if len(base) == 0 or not os.path.isdir(base):
+        base = tempfile.gettempdir()
+    result = os.path.join(base, 'pubq-%d' % os.getuid())
+    try:
+        os.mkdir(result, 0o700)
+    except FileExistsError:
+        pass
+    except OSError as exc:
+        logger.debug("cannot create %s: %s", result, exc)
+    return result
+
+
+def is_private_dir(path):
+    """
+    Tell if a directory belongs to the current user and nobody else
+    can enter it.
+
+    A directory in a shared location may have been created by someone
+    else before us; sockets must not be placed or looked for there.
+    """
+    try:
+        path_stat = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(path_stat.st_mode) and \
+        path_stat.st_uid == os.getuid() and \
+        stat.S_IMODE(path_stat.st_mode) & 0o077 == 0
+
+
+def get_daemon_socket():
+    """ The default path of the unix socket used by the pubq daemon. """
+    return os.path.join(get_runtime_dir(), 'daemon.sock')
+
+
+def get_cache_dir(*parts):
+    """
+    Locates (and creates) a directory inside the cache of the program.
+
+    Arguments:
+        parts:
+            Path components appended to the cache directory.
+
+    Returns:
+        The path of the directory.
+    """
+    base = os.environ.get('XDG_CACHE_HOME', '')
+    if len(base) == 0:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    result = os.path.join(base, 'pubq', *parts)
+    if not os.path.isdir(result):
+        os.makedirs(result, exist_ok=True)
+    return result
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Copying and hashing helpers used when deploying and packaging.
+
+Files above LARGE_FILE_THRESHOLD bytes are copied inside the kernel
+(copy_file_range or sendfile) and hashed through mmap, so their content
+never passes through python buffers. Hashes are cached by inode, size
+and modification time, so unchanged files are never read twice.
+
+Files that other processes may be reading are written under a temporary
+name and renamed into place, so nobody ever sees a partial file.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from pubqlib.utils import get_cache_dir
+from pubqlib.utils.locking import FileLock
+
+logger = logging.getLogger('pubq.fileio')
+
+LARGE_FILE_THRESHOLD = 64 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+HASH_NAME = 'sha256'
+
+
+def hash_file(path, size=None):
+    """
+    Computes the hash of a file.
+
+    Arguments:
+        path (str):
+            The file to hash.
+        size (int):
+            The size of the file, if already known.
+
+    Returns:
+        The hexadecimal digest.
+    """
+    digest = hashlib.new(HASH_NAME)
+    if size is None:
+        size = os.path.getsize(path)
+    with open(path, 'rb') as fin:
+        if size >= LARGE_FILE_THRESHOLD:
+            # hashlib releases the GIL while digesting large buffers, so
+            # several large files can be hashed in parallel threads.
+            with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+        else:
+            for chunk in iter(lambda: fin.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def crc_file(path):
+    """ Computes the CRC-32 of a file, as stored in zip archives. """
+    result = 0
+    with open(path, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(CHUNK_SIZE), b''):
+            result = zlib.crc32(chunk, result)
+    return result
+
+
+def copy_file(source, target):
+    """
+    Copies the content and the permission bits of a file.
+
+    Large files are copied by the kernel without reading them into
+    user space.
+
+    Arguments:
+        source (str):
+            The file to copy.
+        target (str):
+            The destination file (not a directory).
+    """
+    size = os.path.getsize(source)
+    if size < LARGE_FILE_THRESHOLD:
+        shutil.copy(source, target)
+        return
+
+    logger.debug("copying large file %s (%d bytes)", source, size)
+    with open(source, 'rb') as fin, open(target, 'wb') as fout:
+        in_fd, out_fd = fin.fileno(), fout.fileno()
+        copied = 0
+        copier = getattr(os, 'copy_file_range', None)
+        try:
+            while copied < size:
+                if copier is not None:
+                    sent = copier(in_fd, out_fd, size - copied)
+                else:
+                    sent = os.sendfile(out_fd, in_fd, copied, size - copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError as exc:
+            # Not supported for this pair of file systems.
+            logger.debug("kernel copy failed (%s); falling back", exc)
+            fin.seek(copied)
+            fout.seek(copied)
+            shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+    shutil.copymode(source, target)
+
+
+def temp_name(path):
+    """ A name in the same directory as path, private to this thread. """
+    directory, name = os.path.split(path)
+    return os.path.join(directory, '.%s.%d.%d.tmp' % (
+        name, os.getpid(), threading.get_ident()))
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    Creates a file under a temporary name, then renames it.
+
+    The body of the `with` statement receives the temporary path and
+    writes the file there. If the body fails the temporary file is
+    removed and path is left untouched.
+
+    Arguments:
+        path (str):
+            The final path of the file.
+    """
+    temp_path = temp_name(path)
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_atomic(path, data):
+    """ Writes a text file so that readers never see a partial file. """
+    with atomic_output(path) as temp_path:
+        with open(temp_path, 'w') as fout:
+            fout.write(data)
+
+
+def link_file(source, target):
+    """
+    Makes target a symbolic link to source.
+
+    A file that is already at target is replaced in a single step, so
+    readers see either the old file or the link.
+    """
+    temp_path = temp_name(target)
+    os.symlink(source, temp_path)
+    try:
+        os.replace(temp_path, target)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class HashCache(object):
+    """
+    Remembers the hashes of files.
+
+    An entry is valid as long as the inode, the size and the modification
+    time of the file are the same as when it was hashed.
+
+    Attributes:
+        cache_path (str):
+            The json file where the hashes are stored; empty to keep them
+            in memory only.
+        entries (dict):
+            Maps absolute paths to [inode, size, mtime_ns, digest].
+    """
+
+    def __init__(self, cache_path=None):
+        """
+        Constructor.
+
+        Arguments:
+            cache_path (str):
+                The json file where the hashes are stored; by default a
+                file in the cache directory of the program.
+        """
+        super().__init__()
+        if cache_path is None:
+            cache_path = os.path.join(get_cache_dir(), 'hashes.json')
+        self.cache_path = cache_path
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'HashCache(%d entries)' % len(self.entries)
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'HashCache(cache_path=%r)' % self.cache_path
+
+    def read(self):
+        """ The entries saved by other runs. """
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r') as fin:
+                data = json.load(fin)
+        except (OSError, ValueError):
+            logger.debug("ignoring unreadable cache %s", self.cache_path)
+            return {}
+        if data.get('hash') != HASH_NAME:
+            return {}
+        return data.get('entries', {})
+
+    def load(self):
+        """ Reads the hashes saved by a previous run. """
+        self.entries = self.read()
+
+    def save(self):
+        """
+        Writes the hashes if any of them changed.
+
+        The hashes saved meanwhile by other processes are kept.
+        """
+        if not self.cache_path or not self.dirty:
+            return
+        with self.lock, FileLock(self.cache_path + '.lock'):
+            entries = self.read()
+            entries.update(self.entries)
+            self.entries = entries
+            with atomic_output(self.cache_path) as temp_path:
+                with open(temp_path, 'w') as fout:
+                    json.dump({'hash': HASH_NAME, 'entries': entries}, fout)
+            self.dirty = False
+
+    def lookup(self, path, stat=None):
+        """
+        Retrieves the hash of a file without reading it.
+
+        Returns:
+            The digest or None if the file changed since it was hashed.
+        """
+        path = os.path.abspath(path)
+        if stat is None:
+            stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is not None and entry[:3] == [
+                stat.st_ino, stat.st_size, stat.st_mtime_ns]:
+            return entry[3]
+        return None
+
+    def store(self, path, stat, digest):
+        """ Records the hash of a file. """
+        with self.lock:
+            self.entries[os.path.abspath(path)] = [
+                stat.st_ino, stat.st_size, stat.st_mtime_ns, digest]
+            self.dirty = True
+
+    def hash(self, path):
+        """ The hash of a file, computed only if not known. """
+        stat = os.stat(path)
+        digest = self.lookup(path, stat)
+        if digest is None:
+            digest = hash_file(path, stat.st_size)
+            self.store(path, stat, digest)
+        return digest
+
+    def hash_many(self, paths, jobs=None):
+        """
+        Hashes a list of files, using threads for the unknown ones.
+
+        Arguments:
+            paths (list):
+                The files to hash.
+            jobs (int):
+                Maximum number of threads.
+
+        Returns:
+            A dictionary mapping each path to its digest.
+        """
+        result = {}
+        pending = []
+        for path in paths:
+            stat = os.stat(path)
+            digest = self.lookup(path, stat)
+            if digest is None:
+                pending.append((path, stat))
+            else:
+                result[path] = digest
+
+        if len(pending) > 0:
+            logger.debug("hashing %d files", len(pending))
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                digests = executor.map(
+                    lambda item: hash_file(item[0], item[1].st_size),
+                    pending)
+                for (path, stat), digest in zip(pending, digests):
+                    self.store(path, stat, digest)
+                    result[path] = digest
+        return result
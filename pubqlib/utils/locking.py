@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the definition of the FileLock class.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; locks do nothing there.
+    fcntl = None
+
+logger = logging.getLogger('pubq.locking')
+
+
+class FileLock(object):
+    """
+    An advisory lock shared by all pubq processes on this machine.
+
+    The lock is held on a separate file (that is never removed), so the
+    file it protects can be replaced while the lock is held. Locks taken
+    by one process are released by the kernel if the process dies.
+
+    A lock must not be acquired twice by the same process, as the
+    second attempt would wait forever.
+
+    Attributes:
+        path (str):
+            The file used for locking.
+        shared (bool):
+            Take a shared (read) lock instead of an exclusive one.
+    """
+
+    def __init__(self, path, shared=False):
+        """
+        Constructor.
+
+        Arguments:
+            path (str):
+                The file used for locking; it is created if needed.
+            shared (bool):
+                Take a shared (read) lock instead of an exclusive one.
+        """
+        super().__init__()
+        self.path = path
+        self.shared = shared
+        self.fd = None
+
+    def __str__(self):
+        """ Represent this object as a human-readable string. """
+        return 'FileLock(%s)' % self.path
+
+    def __repr__(self):
+        """ Represent this object as a python constructor. """
+        return 'FileLock(%r, shared=%r)' % (self.path, self.shared)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self):
+        """ Waits until the lock is ours. """
+        if fcntl is None:
+            return
+        directory = os.path.dirname(self.path)
+        if len(directory) > 0 and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(self.fd, mode | fcntl.LOCK_NB)
+        except OSError:
+            logger.debug("waiting for %s", self.path)
+            fcntl.flock(self.fd, mode)
+
+    def release(self):
+        """ Gives up the lock. """
+        if self.fd is None:
+            return
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
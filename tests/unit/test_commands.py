@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for finding the selected command in pubqlib.commands.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+from unittest import TestCase
+
+from pubqlib.commands import selected_command
+
+
+class TestSelectedCommand(TestCase):
+    def test_first_positional(self):
+        self.assertEqual(selected_command(['install', 'status']), 'install')
+        self.assertEqual(
+            selected_command(['--verbose', 'status', '--targets', 'qt5']),
+            'status')
+        self.assertIsNone(selected_command(['--verbose']))
+        self.assertIsNone(selected_command(['version', 'install']))
+
+    def test_option_values_are_skipped(self):
+        self.assertEqual(
+            selected_command(['--log-file', 'install', 'check', '.']),
+            'check')
+        self.assertEqual(
+            selected_command(['--config', 'diff', '--log-level', '10',
+                              'verify', 'install']),
+            'verify')
+        self.assertEqual(
+            selected_command(['--udd=status', 'install']), 'install')
+        self.assertEqual(
+            selected_command(['--log-f', 'status', 'check']), 'check')
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the gitignore-style patterns in pubqlib.logic.ignore.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import configparser
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pubqlib.logic.ignore import PubIgnore, IGNORE_FILE
+
+
+class TestMatch(TestCase):
+    def test_defaults(self):
+        ignore = PubIgnore()
+        self.assertTrue(ignore.match('.git', is_dir=True))
+        self.assertTrue(ignore.match('sub/__pycache__', is_dir=True))
+        self.assertTrue(ignore.match('sub/__pycache__/mod.cpython-38.pyc'))
+        self.assertTrue(ignore.match('.pubq', is_dir=True))
+        self.assertFalse(ignore.match('sub/.pubq', is_dir=True))
+        self.assertTrue(ignore.match(IGNORE_FILE))
+        self.assertFalse(ignore.match('module.py'))
+
+    def test_no_defaults(self):
+        ignore = PubIgnore(defaults=False)
+        self.assertFalse(ignore.match('.git', is_dir=True))
+
+    def test_unanchored_name(self):
+        ignore = PubIgnore(['*.log'], defaults=False)
+        self.assertTrue(ignore.match('build.log'))
+        self.assertTrue(ignore.match('deep/down/build.log'))
+        self.assertFalse(ignore.match('build.log.txt'))
+
+    def test_anchored(self):
+        ignore = PubIgnore(['/docs', 'data/*.csv'], defaults=False)
+        self.assertTrue(ignore.match('docs', is_dir=True))
+        self.assertTrue(ignore.match('docs/index.rst'))
+        self.assertFalse(ignore.match('sub/docs', is_dir=True))
+        self.assertTrue(ignore.match('data/table.csv'))
+        self.assertFalse(ignore.match('sub/data/table.csv'))
+        self.assertFalse(ignore.match('data/deeper/table.csv'))
+
+    def test_directory_only(self):
+        ignore = PubIgnore(['build/'], defaults=False)
+        self.assertTrue(ignore.match('build', is_dir=True))
+        self.assertTrue(ignore.match('sub/build/out.py'))
+        self.assertFalse(ignore.match('build'))
+
+    def test_double_star(self):
+        ignore = PubIgnore(['a/**/z.py', 'logs/**'], defaults=False)
+        self.assertTrue(ignore.match('a/z.py'))
+        self.assertTrue(ignore.match('a/b/c/z.py'))
+        self.assertFalse(ignore.match('b/a/z.py'))
+        self.assertTrue(ignore.match('logs/2020/01.txt'))
+
+    def test_character_classes(self):
+        ignore = PubIgnore(['file?.[ch]', 'x[!0-9].py'], defaults=False)
+        self.assertTrue(ignore.match('file1.c'))
+        self.assertTrue(ignore.match('fileA.h'))
+        self.assertFalse(ignore.match('file10.c'))
+        self.assertFalse(ignore.match('file1.o'))
+        self.assertTrue(ignore.match('xa.py'))
+        self.assertFalse(ignore.match('x1.py'))
+
+    def test_last_pattern_wins(self):
+        ignore = PubIgnore(['*.txt', '!keep.txt'], defaults=False)
+        self.assertTrue(ignore.match('notes.txt'))
+        self.assertFalse(ignore.match('keep.txt'))
+        self.assertFalse(ignore.match('sub/keep.txt'))
+
+        ignore.add_patterns(['sub/keep.txt'])
+        self.assertTrue(ignore.match('sub/keep.txt'))
+        self.assertFalse(ignore.match('keep.txt'))
+
+    def test_comments_and_blanks(self):
+        ignore = PubIgnore(defaults=False)
+        ignore.add_patterns(['# a comment', '', '   ', ' *.tmp '])
+        self.assertEqual(ignore.patterns, ['*.tmp'])
+        self.assertTrue(ignore.match('a.tmp'))
+        self.assertFalse(ignore.match('# a comment'))
+
+    def test_empty(self):
+        ignore = PubIgnore(defaults=False)
+        self.assertFalse(ignore.match('anything'))
+
+
+class TestPlugin(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make(self, rel_path):
+        path = os.path.join(self.root, *rel_path.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as fout:
+            fout.write('')
+
+    def test_from_plugin(self):
+        with open(os.path.join(self.root, IGNORE_FILE), 'w',
+                  encoding='utf-8') as fout:
+            fout.write('# scratch files\n*.bak\nnotes/\n')
+        config = configparser.ConfigParser()
+        config.read_string(
+            '[extra]\nexclude = *.psd\n  data/\ninclude = data/keep.csv\n')
+
+        ignore = PubIgnore.from_plugin(self.root, config)
+        self.assertTrue(ignore.match('old.bak'))
+        self.assertTrue(ignore.match('notes', is_dir=True))
+        self.assertTrue(ignore.match('art/logo.psd'))
+        self.assertTrue(ignore.match('data/other.csv'))
+        self.assertFalse(ignore.match('data/keep.csv'))
+        self.assertFalse(ignore.match('main.py'))
+
+    def test_walk_prunes(self):
+        for rel_path in ('main.py', 'main.bak', 'build/out.py',
+                         'sub/mod.py', 'sub/__pycache__/mod.pyc',
+                         'sub/skip/deep.py'):
+            self.make(rel_path)
+        ignore = PubIgnore(['*.bak', 'build/', 'sub/skip/'])
+
+        visited = []
+        found = []
+        for dir_path, dirs, files in ignore.walk(self.root, self.root):
+            visited.append(os.path.relpath(dir_path, self.root))
+            found.extend(
+                os.path.relpath(os.path.join(dir_path, name), self.root)
+                for name in files)
+        self.assertEqual(sorted(visited), ['.', 'sub'])
+        self.assertEqual(
+            sorted(found), ['main.py', os.path.join('sub', 'mod.py')])
+
+    def test_walk_below_root(self):
+        self.make('sub/mod.py')
+        self.make('sub/skip/deep.py')
+        self.make('skip/top.py')
+        ignore = PubIgnore(['sub/skip/'], defaults=False)
+
+        found = []
+        for dir_path, dirs, files in ignore.walk(
+                os.path.join(self.root, 'sub'), self.root):
+            found.extend(files)
+        self.assertEqual(found, ['mod.py'])
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the lossless PNG optimizer in pubqlib.logic.images.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from unittest import TestCase
+
+from pubqlib.logic.images import (
+    ImageOptimizer, PNG_SIGNATURE, optimize_png, read_chunks, write_chunk,
+)
+from pubqlib.utils.fileio import HashCache
+
+
+def make_png(width=32, height=32, extra=(), split=2, level=0):
+    """
+    Creates an RGB image whose data is poorly compressed, split in
+    several IDAT chunks and preceded by the `extra` chunks.
+    """
+    raw = b''.join(
+        b'\0' + bytes((x * 7 + y) % 256 for x in range(width * 3))
+        for y in range(height))
+    data = zlib.compress(raw, level)
+    step = len(data) // split + 1
+    parts = [PNG_SIGNATURE, write_chunk(
+        b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))]
+    parts.extend(write_chunk(kind, payload) for kind, payload in extra)
+    for index in range(0, len(data), step):
+        parts.append(write_chunk(b'IDAT', data[index:index + step]))
+    parts.append(write_chunk(b'IEND', b''))
+    return b''.join(parts)
+
+
+def pixels(data):
+    """ The raw scanlines of a PNG file. """
+    return zlib.decompress(b''.join(
+        payload for kind, payload in read_chunks(data) if kind == b'IDAT'))
+
+
+class TestOptimizePng(TestCase):
+    def test_pixels_are_kept(self):
+        data = make_png(extra=[(b'tEXt', b'Comment\0made by hand'),
+                               (b'gAMA', struct.pack('>I', 45455))])
+        result = optimize_png(data)
+        self.assertIsNotNone(result)
+        self.assertLess(len(result), len(data))
+        self.assertEqual(pixels(result), pixels(data))
+
+        kinds = [kind for kind, payload in read_chunks(result)]
+        self.assertEqual(kinds, [b'IHDR', b'gAMA', b'IDAT', b'IEND'])
+
+    def test_no_gain(self):
+        data = optimize_png(make_png())
+        self.assertIsNone(optimize_png(data))
+
+    def test_animated(self):
+        data = make_png(extra=[(b'acTL', struct.pack('>II', 1, 0))])
+        self.assertIsNone(optimize_png(data))
+
+    def test_invalid(self):
+        data = make_png()
+        with self.assertRaises(ValueError):
+            optimize_png(b'GIF89a' + data[6:])
+        with self.assertRaises(ValueError):
+            optimize_png(data[:-6])
+
+        damaged = bytearray(data)
+        damaged[40] ^= 0xff
+        with self.assertRaises(ValueError):
+            optimize_png(bytes(damaged))
+
+        no_image = PNG_SIGNATURE + write_chunk(b'IHDR', data[16:29]) + \
+            write_chunk(b'IDAT', b'not zlib') + write_chunk(b'IEND', b'')
+        with self.assertRaises(ValueError):
+            optimize_png(no_image)
+
+
+class TestImageOptimizer(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = os.path.join(self.root, 'cache')
+        os.makedirs(self.cache)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, data):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as fout:
+            fout.write(data)
+        return path
+
+    def optimizer(self):
+        return ImageOptimizer(self.cache, hashes=HashCache(''), jobs=2)
+
+    def test_optimize(self):
+        big = self.write('big.png', make_png())
+        copy = self.write('copy.PNG', make_png())
+        small = self.write('small.png', optimize_png(make_png()))
+        other = self.write('notes.txt', b'text')
+
+        optimizer = self.optimizer()
+        result = optimizer.optimize([big, copy, small, other])
+        self.assertEqual(sorted(result), sorted([big, copy]))
+        self.assertEqual(result[big], result[copy])
+        self.assertGreater(optimizer.saved, 0)
+        with open(result[big], 'rb') as fin:
+            self.assertEqual(pixels(fin.read()), pixels(make_png()))
+        # Both copies were optimized once and the small one is remembered.
+        self.assertEqual(len(os.listdir(self.cache)), 2)
+
+    def test_cached(self):
+        big = self.write('big.png', make_png())
+        self.optimizer().optimize([big])
+
+        optimizer = self.optimizer()
+        self.assertEqual(len(optimizer.optimize([big])), 1)
+        self.assertEqual(optimizer.saved, 0)
+
+    def test_dry_run(self):
+        big = self.write('big.png', make_png())
+        optimizer = self.optimizer()
+        self.assertEqual(optimizer.optimize([big], dry_run=True), {})
+        self.assertEqual(os.listdir(self.cache), [])
+
+        optimizer.optimize([big])
+        self.assertEqual(
+            list(optimizer.optimize([big], dry_run=True)), [big])
+
+    def test_invalid_image_is_left_alone(self):
+        broken = self.write('broken.png', b'not an image')
+        self.assertEqual(self.optimizer().optimize([broken]), {})
+        self.assertEqual(
+            [name.endswith('.orig') for name in os.listdir(self.cache)],
+            [True])
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for resuming builds with pubqlib.logic.journal.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pubqlib.logic.journal import BuildJournal
+from pubqlib.utils.fileio import HashCache
+
+
+class TestBuildJournal(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, '.pubq', 'journal')
+        self.source = self.write('form.ui', 'source')
+        self.output = self.write('form.py', 'output')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        with open(path, 'w', encoding='utf-8') as fout:
+            fout.write(content)
+        return path
+
+    def journal(self):
+        return BuildJournal(self.path, hashes=HashCache(''))
+
+    def test_resume_after_reload(self):
+        journal = self.journal()
+        in_hash = journal.input_hash([self.source], 'profile')
+        journal.record('ui:form', in_hash, [self.output])
+        journal.close()
+
+        replayed = self.journal()
+        self.assertTrue(replayed.has('ui:form'))
+        self.assertTrue(replayed.is_done(
+            'ui:form', replayed.input_hash([self.source], 'profile')))
+
+    def test_changed_input(self):
+        journal = self.journal()
+        in_hash = journal.input_hash([self.source])
+        journal.record('ui:form', in_hash, [self.output])
+
+        self.write('form.ui', 'changed source')
+        journal.hashes = HashCache('')
+        new_hash = journal.input_hash([self.source])
+        self.assertNotEqual(in_hash, new_hash)
+        self.assertFalse(journal.is_done('ui:form', new_hash))
+
+    def test_extra_values_change_the_hash(self):
+        journal = self.journal()
+        self.assertNotEqual(
+            journal.input_hash([self.source], 'debug'),
+            journal.input_hash([self.source], 'release'))
+
+    def test_relative_hash(self):
+        journal = self.journal()
+        copy = os.path.join(self.root, 'copy')
+        os.makedirs(copy)
+        shutil.copy(self.source, copy)
+        self.assertEqual(
+            journal.input_hash([self.source], root=self.root),
+            journal.input_hash(
+                [os.path.join(copy, 'form.ui')], root=copy))
+
+    def test_missing_output(self):
+        journal = self.journal()
+        in_hash = journal.input_hash([self.source])
+        journal.record('ui:form', in_hash, [self.output])
+        os.remove(self.output)
+        self.assertFalse(journal.is_done('ui:form', in_hash))
+
+    def test_touched_output_with_same_content(self):
+        journal = self.journal()
+        in_hash = journal.input_hash([self.source])
+        journal.record('ui:form', in_hash, [self.output])
+        stat = os.stat(self.output)
+        os.utime(self.output, ns=(stat.st_atime_ns,
+                                  stat.st_mtime_ns + 10 ** 9))
+        self.assertTrue(journal.is_done('ui:form', in_hash))
+
+    def test_modified_output(self):
+        journal = self.journal()
+        in_hash = journal.input_hash([self.source])
+        journal.record('ui:form', in_hash, [self.output])
+        self.write('form.py', 'edited by hand')
+        self.assertFalse(journal.is_done('ui:form', in_hash))
+
+    def test_damaged_last_line(self):
+        journal = self.journal()
+        journal.record('ui:form', journal.input_hash([self.source]),
+                       [self.output])
+        journal.close()
+        with open(self.path, 'a', encoding='utf-8') as fout:
+            fout.write('{"unit": "ui:oth')
+
+        replayed = self.journal()
+        self.assertEqual(list(replayed.entries), ['ui:form'])
+
+    def test_drop_and_mark(self):
+        journal = self.journal()
+        journal.mark('deploy:/target')
+        journal.mark('link:/target')
+        journal.drop('deploy:/target')
+        journal.close()
+
+        replayed = self.journal()
+        self.assertFalse(replayed.has('deploy:/target'))
+        self.assertTrue(replayed.has('link:/target'))
+
+    def test_compact(self):
+        journal = self.journal()
+        for index in range(3):
+            journal.record('ui:form', str(index), [self.output])
+        journal.mark('deploy:/target')
+        journal.drop('deploy:/target')
+        journal.compact()
+
+        with open(self.path, 'r', encoding='utf-8') as fin:
+            lines = fin.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        replayed = self.journal()
+        self.assertEqual(replayed.entries['ui:form']['in'], '2')
+
+    def test_append_after_compaction_by_another(self):
+        journal = self.journal()
+        journal.mark('first')
+        other = self.journal()
+        other.mark('second')
+        other.compact()
+        journal.mark('third')
+        journal.close()
+
+        self.assertEqual(
+            sorted(self.journal().entries), ['first', 'second', 'third'])
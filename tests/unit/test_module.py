@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the static module discovery in pubqlib.logic.module.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pubqlib.logic.ignore import PubIgnore
+from pubqlib.logic.module import (
+    PubModule, scan_directory, module_kind,
+    PACKAGE, NAMESPACE, SOURCE, BYTECODE, EXTENSION,
+)
+
+
+def touch(root, rel_path, content=''):
+    """ Creates a file, and its parent directories, under root. """
+    path = os.path.join(root, *rel_path.split('/'))
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w', encoding='utf-8') as fout:
+        fout.write(content)
+    return path
+
+
+class TestModuleKind(TestCase):
+    def test_sources_and_bytecode(self):
+        self.assertEqual(module_kind('mod.py'), ('mod', SOURCE))
+        self.assertEqual(module_kind('mod.pyc'), ('mod', BYTECODE))
+
+    def test_tagged_extensions(self):
+        self.assertEqual(
+            module_kind('fast.cpython-38-x86_64-linux-gnu.so'),
+            ('fast', EXTENSION))
+        self.assertEqual(module_kind('fast.cp38-win_amd64.pyd'),
+                         ('fast', EXTENSION))
+
+    def test_not_modules(self):
+        self.assertEqual(module_kind('readme.txt'), (None, None))
+        self.assertEqual(module_kind('not-a-name.py'), (None, None))
+
+
+class TestScanDirectory(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_package_and_namespace(self):
+        touch(self.root, '__init__.py')
+        touch(self.root, 'pkg/__init__.py')
+        touch(self.root, 'compiled_pkg/__init__.pyc')
+        touch(self.root, 'nspkg/mod.py')
+        os.makedirs(os.path.join(self.root, '__pycache__'))
+        os.makedirs(os.path.join(self.root, 'not-a-package'))
+
+        found = scan_directory(self.root)
+        self.assertEqual(found[0][:2], ('__init__', SOURCE))
+        self.assertEqual(
+            [(name, kind) for name, kind, path in found[1:]],
+            [('compiled_pkg', PACKAGE), ('nspkg', NAMESPACE),
+             ('pkg', PACKAGE)])
+
+    def test_source_hides_stale_bytecode(self):
+        touch(self.root, 'mod.py')
+        touch(self.root, 'mod.pyc')
+        touch(self.root, 'legacy.pyc')
+
+        found = scan_directory(self.root)
+        self.assertEqual(
+            [(name, kind, os.path.basename(path))
+             for name, kind, path in found],
+            [('legacy', BYTECODE, 'legacy.pyc'),
+             ('mod', SOURCE, 'mod.py')])
+
+    def test_precedence(self):
+        touch(self.root, 'fast.py')
+        touch(self.root, 'fast.cpython-38-x86_64-linux-gnu.so')
+        touch(self.root, 'both/__init__.py')
+        touch(self.root, 'both.py')
+        touch(self.root, 'shadow/data.txt')
+        touch(self.root, 'shadow.py')
+
+        found = dict(
+            (name, kind) for name, kind, path in scan_directory(self.root))
+        self.assertEqual(found, {
+            'fast': EXTENSION,
+            'both': PACKAGE,
+            'shadow': SOURCE,
+        })
+
+    def test_namespace_init_directory(self):
+        touch(self.root, '__init__/mod.py')
+        touch(self.root, 'mod.py')
+
+        found = scan_directory(self.root)
+        self.assertEqual([name for name, kind, path in found], ['mod'])
+
+
+class TestCollectPyFiles(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'plug')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def collect(self, source_py=False, **kwargs):
+        module = PubModule('plug', self.path, **kwargs)
+        module.collect_py_files(source_py=source_py)
+        return sorted(
+            (os.path.relpath(item.path_in, self.path),
+             os.path.relpath(item.path_out, self.path),
+             item.use_compiled)
+            for item in module.files)
+
+    def test_tree(self):
+        touch(self.path, '__init__.py')
+        touch(self.path, 'core.py')
+        touch(self.path, 'sub/__init__.py')
+        touch(self.path, 'sub/deep.py')
+        touch(self.path, 'ns/part.py')
+        touch(self.path, 'legacy.pyc')
+        touch(self.path, 'fast.cpython-38-x86_64-linux-gnu.so')
+
+        self.assertEqual(self.collect(), [
+            ('__init__.py', '__init__.pyc', True),
+            ('core.py', 'core.pyc', True),
+            ('fast.cpython-38-x86_64-linux-gnu.so',
+             'fast.cpython-38-x86_64-linux-gnu.so', False),
+            ('legacy.pyc', 'legacy.pyc', False),
+            (os.path.join('ns', 'part.py'),
+             os.path.join('ns', 'part.pyc'), True),
+            (os.path.join('sub', '__init__.py'),
+             os.path.join('sub', '__init__.pyc'), True),
+            (os.path.join('sub', 'deep.py'),
+             os.path.join('sub', 'deep.pyc'), True),
+        ])
+
+    def test_source_py(self):
+        touch(self.path, '__init__.py')
+        touch(self.path, 'core.py')
+        self.assertEqual(
+            [use_compiled for path_in, path_out, use_compiled
+             in self.collect(source_py=True)],
+            [False, False])
+
+    def test_nothing_is_imported(self):
+        touch(self.path, '__init__.py', 'raise RuntimeError("imported")\n')
+        touch(self.path, 'sub/__init__.py', 'import qgis.core\n')
+        touch(self.path, 'sub/mod.py')
+        self.assertEqual(len(self.collect()), 3)
+
+    def test_excluded_and_ignored(self):
+        touch(self.path, '__init__.py')
+        touch(self.path, 'tests/__init__.py')
+        touch(self.path, 'tests/test_core.py')
+        touch(self.path, 'scratch.py')
+        touch(self.path, 'keep.py')
+
+        files = self.collect(
+            exclude_modules=['tests'],
+            ignore=PubIgnore(['scratch.py']))
+        self.assertEqual(
+            [path_in for path_in, path_out, use_compiled in files],
+            ['__init__.py', 'keep.py'])
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for sharing resources between .qrc files in pubqlib.logic.resources.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from xml.etree import ElementTree
+
+from pubqlib.logic.resources import (
+    ResourceIndex, SHARED_NAME, qrc_entries, resource_path, rewritten_qrc,
+    shared_import, write_if_changed,
+)
+from pubqlib.utils.fileio import HashCache
+
+
+class ResourceTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def path(self, rel_path):
+        return os.path.join(self.root, *rel_path.split('/'))
+
+    def write(self, rel_path, content):
+        path = self.path(rel_path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as fout:
+            fout.write(content)
+        return path
+
+    def qrc(self, rel_path, *resources):
+        """ Writes a resource file; each resource is (prefix, files). """
+        parts = ['<RCC>']
+        for prefix, files in resources:
+            parts.append('<qresource prefix="%s">' % prefix)
+            for name in files:
+                if isinstance(name, tuple):
+                    parts.append('<file alias="%s">%s</file>' % name)
+                else:
+                    parts.append('<file>%s</file>' % name)
+            parts.append('</qresource>')
+        parts.append('</RCC>')
+        return self.write(rel_path, '\n'.join(parts))
+
+
+class TestQrcFiles(ResourceTestCase):
+    def test_resource_path(self):
+        self.assertEqual(resource_path('/', 'icon.png'), '/icon.png')
+        self.assertEqual(
+            resource_path('/plugins/x', 'img/../icon.png'),
+            '/plugins/x/icon.png')
+        self.assertEqual(resource_path('', 'icon.png'), '/icon.png')
+
+    def test_entries(self):
+        qrc_path = self.qrc(
+            'unit/res.qrc',
+            ('/plug', ['icons/a.png', ('b.png', 'icons/b2.png')]))
+        self.assertEqual(qrc_entries(qrc_path), [
+            ('', '/plug/icons/a.png', self.path('unit/icons/a.png')),
+            ('', '/plug/b.png', self.path('unit/icons/b2.png')),
+        ])
+
+    def test_rewritten_unchanged(self):
+        qrc_path = self.qrc('res.qrc', ('/', ['a.png']))
+        self.assertIsNone(rewritten_qrc(qrc_path))
+        self.assertIsNone(rewritten_qrc(self.path('missing.qrc')))
+
+    def test_rewritten(self):
+        qrc_path = self.qrc('res.qrc', ('/p', ['a.png', 'b.png', 'c.png']))
+        optimized = self.path('cache/1234.png')
+        data = rewritten_qrc(
+            qrc_path, replace={self.path('a.png'): optimized},
+            exclude={('', '/p/b.png')})
+
+        files = [
+            (element.get('alias'), element.text)
+            for element in ElementTree.fromstring(data).iter('file')]
+        self.assertEqual(files, [
+            ('a.png', optimized),
+            ('c.png', self.path('c.png')),
+        ])
+
+    def test_rewritten_from_data(self):
+        qrc_path = self.qrc('res.qrc', ('/', ['a.png']))
+        data = b'<RCC><qresource><file>b.png</file></qresource></RCC>'
+        result = rewritten_qrc(
+            qrc_path, replace={self.path('b.png'): '/elsewhere/b.png'},
+            data=data)
+        self.assertIn(b'/elsewhere/b.png', result)
+
+    def test_write_if_changed(self):
+        path = self.path('out/res.qrc')
+        self.assertTrue(write_if_changed(path, b'content'))
+        stat = os.stat(path)
+        self.assertFalse(write_if_changed(path, b'content'))
+        self.assertEqual(os.stat(path).st_ino, stat.st_ino)
+        self.assertTrue(write_if_changed(path, b'other'))
+
+    def test_shared_import(self):
+        code = shared_import(os.path.join('unit', 'res_rc.py'))
+        self.assertIn('from .. import %s' % SHARED_NAME, code)
+        self.assertIn('from . import', shared_import('res_rc.py'))
+
+
+class TestResourceIndex(ResourceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write('unit/icon.png', 'icon')
+        self.write('other/icon.png', 'icon')
+        self.write('unit/logo.png', 'logo!')
+        self.write('other/logo.png', 'a different logo')
+        self.write('unit/copy.png', 'icon')
+        self.unit = self.qrc(
+            'unit/res.qrc',
+            ('/plug', ['icon.png', 'logo.png', 'copy.png', 'missing.png']))
+        self.other = self.qrc(
+            'other/res2.qrc', ('/plug', ['icon.png', 'logo.png']))
+
+    def index(self):
+        return ResourceIndex(
+            [self.unit, self.other], hashes=HashCache('')).build()
+
+    def test_shared(self):
+        index = self.index()
+        self.assertEqual(
+            index.shared, {('', '/plug/icon.png'): self.path('unit/icon.png')})
+        self.assertEqual(index.saved, 4)
+        self.assertEqual(index.users(self.unit), {('', '/plug/icon.png')})
+        self.assertEqual(index.users(self.other), {('', '/plug/icon.png')})
+
+    def test_conflicts_and_same_content(self):
+        index = self.index()
+        self.assertEqual(index.conflicts, ['/plug/logo.png'])
+        self.assertEqual(
+            index.same_content, [(4, ['/plug/copy.png', '/plug/icon.png'])])
+        self.assertEqual(len(index.report()), 4)
+
+    def test_shared_qrc(self):
+        index = self.index()
+        optimized = self.path('cache/icon.png')
+        root = ElementTree.fromstring(index.shared_qrc(
+            replace={self.path('unit/icon.png'): optimized}))
+        self.assertEqual(
+            [(element.get('alias'), element.text)
+             for element in root.iter('file')],
+            [('plug/icon.png', optimized)])
+
+    def test_users_exclude_shared(self):
+        index = self.index()
+        data = rewritten_qrc(self.other, exclude=index.users(self.other))
+        self.assertEqual(
+            [element.get('alias')
+             for element in ElementTree.fromstring(data).iter('file')],
+            ['logo.png'])
+
+    def test_languages_are_separate(self):
+        self.write('fr/icon.png', 'icon')
+        french = self.write(
+            'fr/res.qrc', '<RCC><qresource prefix="/plug" lang="fr">'
+                          '<file>icon.png</file></qresource></RCC>')
+        index = ResourceIndex(
+            [self.unit, french], hashes=HashCache('')).build()
+        self.assertEqual(index.shared, {})
+
+    def test_unreadable_qrc(self):
+        broken = self.write('broken.qrc', '<RCC><qresource>')
+        index = ResourceIndex(
+            [self.unit, broken], hashes=HashCache('')).build()
+        self.assertEqual(index.entries[broken], [])
+        self.assertEqual(index.shared, {})
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for ordering compile units with pubqlib.logic.schedule.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from pubqlib.logic.schedule import (
+    DEFAULT_RATE, BuildHistory, CompileSchedule, input_size, makespan,
+)
+
+
+class TestMakespan(TestCase):
+    def test_single_job(self):
+        self.assertEqual(makespan([1.0, 2.0, 3.0], 1), 6.0)
+        self.assertEqual(makespan([], 1), 0.0)
+        self.assertEqual(makespan([2.0], 0), 2.0)
+
+    def test_several_jobs(self):
+        self.assertEqual(makespan([1.0, 1.0, 1.0, 1.0], 2), 2.0)
+        # The long unit starts last and runs alone.
+        self.assertEqual(makespan([1.0, 1.0, 4.0], 2), 5.0)
+        self.assertEqual(makespan([4.0, 1.0, 1.0], 2), 4.0)
+        self.assertEqual(makespan([1.0, 2.0], 8), 2.0)
+
+
+class ScheduleTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, '.pubq', 'history.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, size):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as fout:
+            fout.write(b'x' * size)
+        return path
+
+
+class TestBuildHistory(ScheduleTestCase):
+    def test_record_averages(self):
+        history = BuildHistory(self.path)
+        history.record('ui:form', 'PubUi', 100, 1.0)
+        history.record('ui:form', 'PubUi', 100, 3.0)
+        self.assertEqual(history.units['ui:form']['time'], 2.0)
+        history.record('ui:form', 'PubUi', 100, 4.0)
+        self.assertEqual(history.units['ui:form']['time'], 3.0)
+
+    def test_save_and_load(self):
+        history = BuildHistory(self.path)
+        history.record('ui:form', 'PubUi', 100, 1.5)
+        self.assertTrue(history.changed)
+        history.save()
+        self.assertFalse(history.changed)
+
+        loaded = BuildHistory(self.path)
+        self.assertEqual(loaded.units, {
+            'ui:form': {'kind': 'PubUi', 'size': 100, 'time': 1.5}})
+
+    def test_damaged_file(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w', encoding='utf-8') as fout:
+            fout.write('{"units": ')
+        self.assertEqual(BuildHistory(self.path).units, {})
+
+    def test_estimates(self):
+        history = BuildHistory(self.path)
+        self.assertEqual(history.estimate('ui:new', 'PubUi', 1000),
+                         (1000 * DEFAULT_RATE, 'size'))
+
+        history.record('ui:a', 'PubUi', 100, 1.0)
+        history.record('ui:b', 'PubUi', 300, 3.0)
+        history.record('rc:c', 'PubQrc', 10, 5.0)
+        self.assertEqual(history.rate('PubUi'), 0.01)
+        self.assertEqual(history.estimate('ui:a', 'PubUi', 5000),
+                         (1.0, 'history'))
+        # Units that were never compiled scale with the size of their
+        # inputs, at the rate of their kind.
+        self.assertEqual(history.estimate('ui:new', 'PubUi', 1000),
+                         (10.0, 'size'))
+        self.assertEqual(history.rate('PubModule'), DEFAULT_RATE)
+
+
+class TestCompileSchedule(ScheduleTestCase):
+    def schedule(self, jobs):
+        history = BuildHistory(self.path)
+        history.record('ui:slow', 'PubUi', 1000, 5.0)
+        schedule = CompileSchedule(history, jobs=jobs)
+        # Never compiled: the estimate comes from the size.
+        schedule.add('ui:large', 'PubUi', [self.write('large.ui', 300)],
+                     'large')
+        schedule.add('ui:small', 'PubUi', [self.write('small.ui', 100)],
+                     'small')
+        schedule.add('ui:slow', 'PubUi', [self.write('slow.ui', 10)], 'slow')
+        return schedule.order()
+
+    def test_input_size(self):
+        paths = [self.write('a', 3), self.write('b', 4),
+                 os.path.join(self.root, 'missing')]
+        self.assertEqual(input_size(paths), 7)
+
+    def test_longest_first(self):
+        schedule = self.schedule(jobs=2)
+        self.assertEqual(
+            [(item['unit'], item['source']) for item in schedule.items],
+            [('ui:slow', 'history'), ('ui:large', 'size'),
+             ('ui:small', 'size')])
+        self.assertEqual(
+            [item['estimate'] for item in schedule.items], [5.0, 1.5, 0.5])
+        self.assertEqual(schedule.predicted, 5.0)
+        self.assertEqual(schedule.naive, 5.5)
+
+    def test_single_job_keeps_the_order(self):
+        schedule = self.schedule(jobs=1)
+        self.assertEqual(
+            [item['unit'] for item in schedule.items],
+            ['ui:large', 'ui:small', 'ui:slow'])
+        self.assertEqual(schedule.naive, schedule.predicted)
+
+    def test_run(self):
+        schedule = self.schedule(jobs=2)
+        ran = []
+
+        def compile_one(payload):
+            ran.append(payload)
+            # The small one was taken from a cache.
+            return payload != 'small'
+
+        with ThreadPoolExecutor(max_workers=schedule.jobs) as executor:
+            schedule.run(compile_one, executor)
+        self.assertEqual(sorted(ran), ['large', 'slow', 'small'])
+        self.assertTrue(all(
+            item['actual'] is not None for item in schedule.items))
+        self.assertIsNotNone(schedule.actual)
+        self.assertEqual(len(schedule.report(top=2)), 4)
+
+        history = BuildHistory(self.path)
+        self.assertEqual(sorted(history.units), ['ui:large', 'ui:slow'])
+        self.assertLess(history.units['ui:slow']['time'], 5.0)
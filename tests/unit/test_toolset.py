@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the Python of each target in pubqlib.logic.toolset.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import argparse
+import sys
+from unittest import TestCase
+
+from pubqlib.logic.toolset import Toolset, target_python
+
+
+class TestTargetPython(TestCase):
+    def test_parse(self):
+        self.assertEqual(target_python('qt4=/usr/bin/python2'),
+                         ('qt4', '/usr/bin/python2'))
+        for value in ('qt9=python', 'qt4', 'qt4=', '=python'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                target_python(value)
+
+    def test_default_versions(self):
+        self.assertEqual(Toolset('qt4').python_version(), (2, 7))
+        self.assertEqual(Toolset('qt5').python_version(),
+                         tuple(sys.version_info[:2]))
+
+    def test_given_interpreter(self):
+        toolset = Toolset()
+        toolset.pythons = {'qt4': sys.executable}
+        self.assertEqual(toolset.for_target('qt4').python_version(),
+                         tuple(sys.version_info[:2]))
+
+        toolset.pythons = {'qt4': '/does/not/exist'}
+        with self.assertRaises(ValueError):
+            toolset.for_target('qt4').python_version()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the deploy manifest and pubqlib.logic.verify.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pubqlib.logic.manifest import MANIFEST_NAME, PubManifest
+from pubqlib.logic.verify import PubVerifier
+from pubqlib.utils.fileio import HASH_NAME, HashCache, hash_file
+
+
+class TestPubManifest(TestCase):
+    def test_round_trip(self):
+        manifest = PubManifest()
+        manifest.add('sub\\mod.pyc', 10, 'ab' * 32)
+        manifest.add('metadata.txt', 3, 'cd' * 32)
+
+        loaded = PubManifest.from_json(manifest.to_json())
+        self.assertEqual(loaded.files, {
+            'sub/mod.pyc': (10, 'ab' * 32),
+            'metadata.txt': (3, 'cd' * 32),
+        })
+        self.assertEqual(loaded.get('sub\\mod.pyc'), (10, 'ab' * 32))
+        self.assertIsNone(loaded.get('other.pyc'))
+
+    def test_rejects_unknown_formats(self):
+        with self.assertRaises(ValueError):
+            PubManifest.from_json(json.dumps(
+                {'version': 99, 'hash': HASH_NAME, 'files': {}}))
+        with self.assertRaises(ValueError):
+            PubManifest.from_json(json.dumps(
+                {'version': 1, 'hash': 'md5', 'files': {}}))
+        with self.assertRaises(ValueError):
+            PubManifest.from_json('[]')
+        with self.assertRaises(ValueError):
+            PubManifest.from_json('not json')
+
+
+class TestPubVerifier(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'plug')
+        manifest = PubManifest()
+        for rel_path, content in (('metadata.txt', '[general]\n'),
+                                  ('__init__.pyc', 'init'),
+                                  ('sub/mod.pyc', 'module'),
+                                  ('res/icon.png', 'icon')):
+            path = self.write(rel_path, content)
+            manifest.add(rel_path, os.path.getsize(path), hash_file(path))
+        manifest.save(os.path.join(self.path, MANIFEST_NAME))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, rel_path, content):
+        path = os.path.join(self.path, *rel_path.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as fout:
+            fout.write(content)
+        return path
+
+    def verify(self, hashes=None, **kwargs):
+        return PubVerifier(
+            self.path, hashes=HashCache('') if hashes is None else hashes,
+            jobs=2, **kwargs).verify()
+
+    def test_intact(self):
+        verifier = self.verify()
+        self.assertTrue(verifier.intact)
+        self.assertEqual(verifier.unchanged, 4)
+        self.assertEqual(verifier.hashed, 4)
+        self.assertEqual(verifier.details(), [])
+
+    def test_pycache_is_not_extra(self):
+        self.write('sub/__pycache__/mod.cpython-38.pyc', 'cache')
+        self.assertTrue(self.verify().intact)
+
+    def test_differences(self):
+        self.write('sub/mod.pyc', 'edited module')
+        self.write('res/icon.png', 'ICON')
+        os.remove(os.path.join(self.path, '__init__.pyc'))
+        self.write('sub/added.py', 'print("hi")')
+
+        verifier = self.verify()
+        self.assertFalse(verifier.intact)
+        self.assertEqual(verifier.modified, ['res/icon.png', 'sub/mod.pyc'])
+        self.assertEqual(verifier.missing, ['__init__.pyc'])
+        self.assertEqual(verifier.extra, [os.path.join('sub', 'added.py')])
+        # The file with a new size is not read.
+        self.assertEqual(verifier.hashed, 2)
+        self.assertEqual(verifier.details(), [
+            'modified  res/icon.png',
+            'modified  sub/mod.pyc',
+            'missing   __init__.pyc',
+            'extra     %s' % os.path.join('sub', 'added.py'),
+        ])
+
+    def test_known_hashes_are_not_read_again(self):
+        hashes = HashCache('')
+        self.verify(hashes=hashes)
+
+        verifier = self.verify(hashes=hashes)
+        self.assertTrue(verifier.intact)
+        self.assertEqual(verifier.hashed, 0)
+
+        verifier = self.verify(hashes=hashes, full=True)
+        self.assertEqual(verifier.hashed, 4)
+
+    def test_stale_known_hash(self):
+        hashes = HashCache('')
+        self.verify(hashes=hashes)
+        path = os.path.join(self.path, 'sub', 'mod.pyc')
+        stat = os.stat(path)
+        hashes.store(path, stat, 'ff' * 32)
+
+        verifier = self.verify(hashes=hashes)
+        self.assertEqual(verifier.modified, ['sub/mod.pyc'])
+
+    def test_no_manifest(self):
+        os.remove(os.path.join(self.path, MANIFEST_NAME))
+        with self.assertRaises(OSError):
+            self.verify()
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the protocol of the compile workers in pubqlib.logic.worker.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import io
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import threading
+from unittest import TestCase, skipUnless
+
+from pubqlib.logic.worker import (
+    PubWorker, ThreadingUnixStreamServer, WorkerHandler, WorkerPool,
+    check_digest, check_name, check_qrc, digest_of, parse_address,
+    rc_bundle, read_message, send_message,
+)
+
+# A compiler that writes its input, and the files a resource file
+# lists, prefixed with a marker.
+FAKE_TOOL = '''#!%s
+import sys
+from xml.etree import ElementTree
+output, source = sys.argv[2], sys.argv[3]
+with open(source, 'rb') as fin:
+    data = fin.read()
+if source.endswith('.qrc'):
+    for element in ElementTree.fromstring(data).iter('file'):
+        with open(element.text, 'rb') as fin:
+            data = data + fin.read()
+with open(output, 'wb') as fout:
+    fout.write(b'compiled:' + data)
+'''
+
+
+class FakeToolset(object):
+    """ The attributes of a Toolset that the workers use. """
+
+    def __init__(self, tool):
+        super().__init__()
+        self.ui_compiler = tool
+        self.rc_compiler = tool
+        self.target = None
+
+    def for_target(self, target):
+        return self
+
+
+class TestMessages(TestCase):
+    def test_round_trip(self):
+        stream = io.BytesIO()
+        send_message(stream, {'command': 'x'}, [b'one', b'', b'three'])
+        send_message(stream, {'command': 'y'})
+        stream.seek(0)
+
+        self.assertEqual(read_message(stream), (
+            {'command': 'x', 'sizes': [3, 0, 5]}, [b'one', b'', b'three']))
+        self.assertEqual(read_message(stream),
+                         ({'command': 'y', 'sizes': []}, []))
+        self.assertEqual(read_message(stream), (None, []))
+
+    def test_truncated(self):
+        stream = io.BytesIO(b'{"sizes": [10]}\nshort')
+        with self.assertRaises(ValueError):
+            read_message(stream)
+
+    def test_malformed(self):
+        for data in (b'[1, 2]\n', b'{"sizes": 3}\n', b'{"sizes": [-1]}\n',
+                     b'{"sizes": ["3"]}\nabc', b'not json\n'):
+            with self.assertRaises(ValueError):
+                read_message(io.BytesIO(data))
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('7000'),
+                         (socket.AF_INET, ('127.0.0.1', 7000)))
+        self.assertEqual(parse_address(':7000'),
+                         (socket.AF_INET, ('127.0.0.1', 7000)))
+        self.assertEqual(parse_address('build.lan:7000'),
+                         (socket.AF_INET, ('build.lan', 7000)))
+        self.assertEqual(parse_address('unix:w.sock'),
+                         (socket.AF_UNIX, 'w.sock'))
+        self.assertEqual(parse_address('/run/w.sock'),
+                         (socket.AF_UNIX, '/run/w.sock'))
+        with self.assertRaises(ValueError):
+            parse_address('host:port')
+
+
+class TestValidation(TestCase):
+    def test_digest(self):
+        digest = digest_of(b'data')
+        self.assertEqual(check_digest(digest), digest)
+        for value in ('../../etc/passwd', digest.upper(), digest[:-1],
+                      digest + '0', '', None, 12):
+            with self.assertRaises(ValueError):
+                check_digest(value)
+
+    def test_name(self):
+        self.assertEqual(check_name('ab/icon.png'), 'ab/icon.png')
+        for value in ('', '/etc/passwd', '../up', 'a/../../up', 'a//b',
+                      './a', 'a\\b', 'a\0b', None):
+            with self.assertRaises(ValueError):
+                check_name(value)
+
+    def test_qrc(self):
+        files = {'res.qrc': '', 'ab/icon.png': ''}
+        check_qrc(b'<RCC><qresource><file alias="i.png">ab/icon.png'
+                  b'</file></qresource></RCC>', files)
+        for data in (b'<RCC><qresource><file>/etc/passwd</file>'
+                     b'</qresource></RCC>',
+                     b'<RCC><qresource><file>../ab/icon.png</file>'
+                     b'</qresource></RCC>',
+                     b'<RCC><qresource><file>other.png</file>'
+                     b'</qresource></RCC>',
+                     b'<RCC>'):
+            with self.assertRaises(ValueError):
+                check_qrc(data, files)
+
+    def test_rc_bundle(self):
+        root = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(root, 'icon.png'), 'wb') as fout:
+                fout.write(b'icon')
+            qrc_path = os.path.join(root, 'res.qrc')
+            with open(qrc_path, 'w', encoding='utf-8') as fout:
+                fout.write('<RCC><qresource prefix="/p">'
+                           '<file>icon.png</file></qresource></RCC>')
+            data, files = rc_bundle(qrc_path)
+            remote_name = '%s/icon.png' % digest_of(b'icon')
+            self.assertEqual(files, {remote_name: (
+                os.path.join(root, 'icon.png'), digest_of(b'icon'))})
+            check_qrc(data, dict(files, **{'res.qrc': ''}))
+            self.assertIn(b'alias="icon.png"', data)
+        finally:
+            shutil.rmtree(root)
+
+
+class WorkerTestCase(TestCase):
+    token = 'secret'
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        tool = os.path.join(self.root, 'fakercc')
+        with open(tool, 'w', encoding='utf-8') as fout:
+            fout.write(FAKE_TOOL % sys.executable)
+        os.chmod(tool, stat.S_IRWXU)
+        self.toolset = FakeToolset(tool)
+        self.worker = PubWorker(
+            'unused', self.toolset, jobs=2,
+            store=os.path.join(self.root, 'store'), token=self.token)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, data):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as fout:
+            fout.write(data)
+        return path
+
+    def compile_header(self, files, input_name, blobs=(), kind='ui'):
+        return {'command': 'compile', 'kind': kind, 'target': None,
+                'tool': 'fakercc', 'input': input_name, 'files': files,
+                'blobs': [digest for digest, _ in blobs]}
+
+
+class TestPubWorker(WorkerTestCase):
+    def test_hello_and_token(self):
+        header, _ = self.worker.execute({'command': 'hello'}, [])
+        self.assertEqual(header['jobs'], 2)
+        self.assertEqual(header['tools']['ui'], 'fakercc')
+        self.assertTrue(self.worker.check_token('secret'))
+        self.assertFalse(self.worker.check_token('Secret'))
+        self.assertFalse(self.worker.check_token(None))
+        self.assertTrue(PubWorker('x', self.toolset).check_token(None))
+
+    def test_compile(self):
+        data = b'<ui/>'
+        digest = digest_of(data)
+        header, _ = self.worker.execute(
+            {'command': 'missing', 'digests': [digest]}, [])
+        self.assertEqual(header['missing'], [digest])
+
+        header, payloads = self.worker.execute(
+            self.compile_header({'form.ui': digest}, 'form.ui',
+                                [(digest, data)]), [data])
+        self.assertEqual(header, {'result': 0, 'cached': False})
+        self.assertEqual(payloads, (b'compiled:<ui/>', ))
+
+        header, _ = self.worker.execute(
+            {'command': 'missing', 'digests': [digest]}, [])
+        self.assertEqual(header['missing'], [])
+        header, payloads = self.worker.execute(
+            self.compile_header({'form.ui': digest}, 'form.ui'), [])
+        self.assertTrue(header['cached'])
+        self.assertEqual(payloads, (b'compiled:<ui/>', ))
+
+    def test_content_must_match_digest(self):
+        digest = digest_of(b'<ui/>')
+        with self.assertRaises(ValueError):
+            self.worker.execute(
+                self.compile_header({'form.ui': digest}, 'form.ui',
+                                    [(digest, None)]), [b'<evil/>'])
+
+    def test_missing_input(self):
+        header, _ = self.worker.execute(self.compile_header(
+            {'form.ui': digest_of(b'never sent')}, 'form.ui'), [])
+        self.assertEqual(header['result'], 1)
+
+    def test_wrong_tool(self):
+        header = dict(self.compile_header({}, 'form.ui'), tool='pyuic4')
+        self.assertEqual(self.worker.execute(header, [])[0]['result'], 1)
+
+    def test_traversal(self):
+        secret = self.write('secret.txt', b'do not read')
+        data = b'x'
+        digest = digest_of(data)
+        self.worker.execute(
+            self.compile_header({'form.ui': digest}, 'form.ui',
+                                [(digest, data)]), [data])
+
+        for header in (
+                {'command': 'missing', 'digests': ['../../' + secret]},
+                self.compile_header({'../up.ui': digest}, '../up.ui'),
+                self.compile_header({secret: digest}, secret),
+                self.compile_header({'form.ui': '../' * 8 + secret},
+                                    'form.ui'),
+                self.compile_header({'form.ui': digest}, 'other.ui'),
+                self.compile_header({'-o': digest}, '-o'),
+                self.compile_header({'a/form.ui': digest}, 'a/form.ui')):
+            with self.assertRaises(ValueError):
+                self.worker.execute(header, [])
+
+    def test_qrc_cannot_reference_other_files(self):
+        secret = self.write('secret.txt', b'do not read')
+        for reference in (secret, '../' * 8 + secret[1:]):
+            qrc = ('<RCC><qresource><file>%s</file></qresource></RCC>'
+                   % reference).encode('utf-8')
+            digest = digest_of(qrc)
+            with self.assertRaises(ValueError):
+                self.worker.execute(self.compile_header(
+                    {'res.qrc': digest}, 'res.qrc', [(digest, qrc)],
+                    kind='rc'), [qrc])
+
+
+@skipUnless(hasattr(socket, 'AF_UNIX'), 'needs unix sockets')
+class TestOverSocket(WorkerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.address = os.path.join(self.root, 'worker.sock')
+        self.server = ThreadingUnixStreamServer(self.address, WorkerHandler)
+        self.server.worker = self.worker
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        super().tearDown()
+
+    def exchange(self, *messages):
+        """ Sends messages on one connection and collects the answers. """
+        result = []
+        with socket.socket(socket.AF_UNIX) as sock, \
+                sock.makefile('rwb') as stream:
+            sock.settimeout(10)
+            sock.connect(self.address)
+            for header, payloads in messages:
+                send_message(stream, header, payloads)
+                result.append(read_message(stream)[0])
+        return result
+
+    def test_socket_is_private(self):
+        self.assertEqual(os.stat(self.address).st_mode & 0o077, 0)
+
+    def test_hello_first(self):
+        self.assertEqual(
+            self.exchange(({'command': 'missing', 'digests': []}, ())),
+            [{'result': 1, 'error': 'not authenticated', 'sizes': []}])
+        answer = self.exchange(({'command': 'hello', 'token': 'wrong'}, ()))
+        self.assertEqual(answer[0]['result'], 1)
+
+    def test_traversal_closes_the_connection(self):
+        answers = self.exchange(
+            ({'command': 'hello', 'token': self.token}, ()),
+            ({'command': 'missing', 'digests': ['../../etc/passwd']}, ()))
+        self.assertEqual(answers[0]['result'], 0)
+        self.assertIsNone(answers[1])
+
+    def test_pool(self):
+        form = self.write('form.ui', b'<ui/>')
+        self.write('icon.png', b'icon')
+        qrc = self.write(
+            'res.qrc', b'<RCC><qresource><file>icon.png</file>'
+                       b'</qresource></RCC>')
+        pool = WorkerPool([self.address], timeout=10, token=self.token)
+        self.assertEqual(pool.jobs, 3)
+
+        out = os.path.join(self.root, 'form_ui.py')
+        self.assertTrue(pool.compile('ui', self.toolset, form, out))
+        with open(out, 'rb') as fin:
+            self.assertEqual(fin.read(), b'compiled:<ui/>')
+
+        out = os.path.join(self.root, 'res_rc.py')
+        self.assertTrue(pool.compile('rc', self.toolset, qrc, out))
+        with open(out, 'rb') as fin:
+            self.assertTrue(fin.read().endswith(b'icon'))
+        self.assertEqual((pool.remote, pool.local), (2, 0))
+        self.assertTrue(os.path.isfile(
+            self.worker.blob_path(digest_of(b'icon'))))
+
+    def answer_with(self, command, response):
+        """ Makes the worker give a fixed answer to a command. """
+        execute = self.worker.execute
+
+        def patched(header, payloads):
+            if header.get('command') == command:
+                return response, ()
+            return execute(header, payloads)
+        self.worker.execute = patched
+
+    def test_hello_without_jobs(self):
+        self.answer_with('hello', {'result': 0})
+        pool = WorkerPool([self.address], timeout=10, token=self.token)
+        self.assertEqual(pool.jobs, 1)
+
+    def test_result_without_output(self):
+        form = self.write('form.ui', b'<ui/>')
+        for command, response in (('compile', {'result': 0}),
+                                  ('missing', {'result': 0}),
+                                  ('missing', {'result': 0,
+                                               'missing': ['..']})):
+            self.answer_with(command, response)
+            pool = WorkerPool([self.address], timeout=10, token=self.token)
+            self.assertFalse(pool.compile(
+                'ui', self.toolset, form, os.path.join(self.root, 'out.py')))
+            self.assertEqual((pool.local, pool.jobs), (1, 1))
+
+    def test_pool_with_wrong_token(self):
+        form = self.write('form.ui', b'<ui/>')
+        pool = WorkerPool([self.address], timeout=10, token='wrong')
+        self.assertEqual(pool.jobs, 1)
+        self.assertFalse(pool.compile(
+            'ui', self.toolset, form, os.path.join(self.root, 'out.py')))
+        self.assertEqual(pool.local, 1)